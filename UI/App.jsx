@@ -36,11 +36,18 @@ function App() {
     return s; // for the others already the right format
   }
 
-  useEffect(() => { // auto fill using names from a set of names
-    axios.get('http://localhost:8080/api/players') // get list of names from
-      .then(res => setPlayerOptions(res.data.players || []))
-      .catch(e => console.error(e));
-  }, []);
+  useEffect(() => { // auto fill, server side matches for what has been typed so far
+    if (!playerName.trim()) {
+      setPlayerOptions([]);
+      return;
+    }
+    const timer = setTimeout(() => { // wait for a pause in typing instead of one request per key
+      axios.get('http://localhost:8080/api/autocomplete', { params: { q: playerName, limit: 10, fuzzy: 1 } })
+        .then(res => setPlayerOptions((res.data.matches || []).map(match => match.player)))
+        .catch(e => console.error(e));
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [playerName]);
 
   function handleSubmit(e) { // search button clicked
     e.preventDefault(); // no default options
@@ -1,48 +1,229 @@
 import numpy as np
-from collections import defaultdict
+import heapq
 
 
 class ANNSearch:
 
-    def __init__(self, dimensions, num_tables=10, hash_size=8):
+    def __init__(self, dimensions, num_tables=10, hash_size=8, num_probes=0, seed=None):
         self.dimensions = dimensions
         self.num_tables = num_tables
         self.hash_size = hash_size
-        self.hash_tables = [defaultdict(list) for _ in range(num_tables)]
-        self.random_planes = []
+        self.num_probes = num_probes  # extra neighbouring buckets to visit per query (0 = exact bucket only)
+        self.seed = seed  # same seed -> same planes -> same buckets and results after a restart (None = random)
 
-        # gets random planes (dimensions/stats)
-        for _ in range(num_tables):
-            planes = [np.random.randn(dimensions) for _ in range(hash_size)]
-            self.random_planes.append(planes)
+        # gets random planes (dimensions/stats) -> one (tables, planes per table, dims) tensor
+        self.random_planes = np.random.default_rng(seed).standard_normal((num_tables, hash_size, dimensions))
+        # planes go through the mean of the data, not the origin: the stats are scaled to 0-1 so every point is on
+        # the same side of most planes through the origin and a handful of huge buckets hold nearly everything
+        self.center = np.zeros(dimensions)
+        self.bit_weights = 1 << np.arange(hash_size, dtype=np.int64)  # packs hash bits into one int per table
+
+        # csr style buckets per table: sorted unique keys, offsets into the member list, members grouped by key
+        self.bucket_keys = [np.empty(0, dtype=np.int64) for _ in range(num_tables)]
+        self.bucket_offsets = [np.zeros(1, dtype=np.intp) for _ in range(num_tables)]
+        self.bucket_members = np.empty((num_tables, 0), dtype=np.intp)
+
+        self.points = np.empty((0, dimensions), dtype=np.float32)  # by row, including inserted rows
+        self.player_ids = np.empty(0)
+
+        # live updates without rehashing everything: rows dropped from the csr buckets are flagged in
+        # in_buckets, inserted (or updated) rows keep their keys in a small buffer that queries compare directly
+        self.in_buckets = np.empty(0, dtype=bool)
+        self.extra_rows = np.empty(0, dtype=np.intp)
+        self.extra_keys = np.empty((0, num_tables), dtype=np.int64)
 
     # generates binary hash key based on where players fall in the randomly generated planes
     # 1 = above plane, 0 = below plane (based on dot product of point, each plane out of all planes)
-    def _hash(self, point, planes):
-        return tuple(int(np.dot(point, plane) > 0) for plane in planes)
+    # the bits are packed into an int64 so every point gets one key per table from a single matmul
+    def _hash(self, points):
+        projections = self._project(points)
+        return (projections > 0).astype(np.int64) @ self.bit_weights  # (n, num_tables)
+
+    def _project(self, points):
+        return np.einsum('nd,thd->nth', np.atleast_2d(points) - self.center, self.random_planes)
 
     # hashes player list
     def build_index(self, points, player_ids):
-        self.points = points
-        self.player_ids = player_ids
+        self.points = np.asarray(points, dtype=np.float32)  # distances are still taken in float64 (target is)
+        self.player_ids = np.asarray(player_ids)
+        self.center = self.points.mean(axis=0, dtype=np.float64) if len(self.points) else np.zeros(self.dimensions)
 
-        for idx, point in enumerate(points):
-            for table_idx in range(self.num_tables):
-                hash_key = self._hash(point, self.random_planes[table_idx])
-                self.hash_tables[table_idx][hash_key].append(idx)
+        keys = self._hash(self.points)
+        self.bucket_members = np.empty((self.num_tables, len(self.points)), dtype=np.intp)
+        for table_idx in range(self.num_tables):
+            table_keys = keys[:, table_idx]
+            order = np.argsort(table_keys, kind='stable')
+            unique_keys, starts = np.unique(table_keys[order], return_index=True)
+            self.bucket_keys[table_idx] = unique_keys
+            self.bucket_offsets[table_idx] = np.append(starts, len(order))
+            self.bucket_members[table_idx] = order
 
-    # generates list of approximate nearest neighbors
-    def query(self, target, k=5):
-        candidates = set()
+        self.in_buckets = np.ones(len(self.points), dtype=bool)
+        self.extra_rows = np.empty(0, dtype=np.intp)
+        self.extra_keys = np.empty((0, self.num_tables), dtype=np.int64)
+
+    # add points without rehashing the index, rows -> their row numbers (default: after every existing row)
+    # inserting a row that already exists (after delete) replaces its point
+    def insert(self, points, player_ids, rows=None):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if rows is None:
+            rows = np.arange(len(self.points), len(self.points) + len(points))
+        rows = np.asarray(rows, dtype=np.intp)
+
+        grow = int(rows.max()) + 1 - len(self.points) if len(rows) else 0
+        if grow > 0:
+            self.points = np.concatenate((self.points, np.zeros((grow, self.dimensions), dtype=np.float32)))
+            self.player_ids = np.concatenate((self.player_ids, np.zeros(grow, dtype=self.player_ids.dtype)))
+            self.in_buckets = np.concatenate((self.in_buckets, np.zeros(grow, dtype=bool)))
+        elif not self.points.flags.writeable:  # memory mapped snapshot -> private copy on first change
+            self.points, self.player_ids = self.points.copy(), self.player_ids.copy()
+        self.points[rows] = points
+        self.player_ids[rows] = player_ids
+
+        self.delete(rows)  # old bucket entries of updated rows are stale now
+        self.extra_rows = np.concatenate((self.extra_rows, rows))
+        self.extra_keys = np.concatenate((self.extra_keys, self._hash(points)))
+
+    def delete(self, rows):
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.intp))
+        if not self.in_buckets.flags.writeable:
+            self.in_buckets = self.in_buckets.copy()
+        self.in_buckets[rows] = False
+        keep = ~np.isin(self.extra_rows, rows)
+        self.extra_rows, self.extra_keys = self.extra_rows[keep], self.extra_keys[keep]
+
+    # share of rows living outside the hashed csr buckets (buffered inserts + deleted entries)
+    def degraded(self, max_fraction=0.2):
+        base = self.bucket_members.shape[1]
+        stale = len(self.extra_rows) + base - int(self.in_buckets[:base].sum())
+        return stale > max_fraction * max(base, 1)
+
+    # arrays that fully describe the index (used to save/load index snapshots)
+    # per table keys/offsets have different lengths so they are concatenated with split points
+    def get_state(self):
+        return {
+            'random_planes': self.random_planes, 'center': self.center, 'points': self.points,
+            'player_ids': self.player_ids,
+            'bucket_members': self.bucket_members,
+            'bucket_keys': np.concatenate(self.bucket_keys),
+            'key_splits': np.cumsum([len(keys) for keys in self.bucket_keys])[:-1],
+            'bucket_offsets': np.concatenate(self.bucket_offsets),
+            'offset_splits': np.cumsum([len(offsets) for offsets in self.bucket_offsets])[:-1],
+            'in_buckets': self.in_buckets, 'extra_rows': self.extra_rows, 'extra_keys': self.extra_keys
+        }
+
+    @classmethod
+    def from_state(cls, state, num_probes=0, seed=None):  # no hashing work, arrays are used as given
+        num_tables, hash_size, dimensions = state['random_planes'].shape
+        index = cls(dimensions, num_tables, hash_size, num_probes)
+        index.seed = seed
+        index.random_planes = state['random_planes']
+        index.center = state.get('center', index.center)
+        index.points = state['points']
+        index.player_ids = state['player_ids']
+        index.bucket_members = state['bucket_members']
+        index.bucket_keys = np.split(state['bucket_keys'], state['key_splits'])
+        index.bucket_offsets = np.split(state['bucket_offsets'], state['offset_splits'])
+        index.in_buckets = state.get('in_buckets', np.ones(len(index.points), dtype=bool))
+        index.extra_rows = state.get('extra_rows', index.extra_rows)
+        index.extra_keys = state.get('extra_keys', index.extra_keys)
+        return index
 
-        for table_idx in range(self.num_tables):  # loop through hash tables
-            hash_key = self._hash(target, self.random_planes[table_idx])  # hash for random dimensions
-            candidates.update(self.hash_tables[table_idx].get(hash_key, []))
+    # returns the member rows of the bucket with this key (empty if nobody hashed there)
+    def _bucket(self, table_idx, key):
+        keys = self.bucket_keys[table_idx]
+        pos = np.searchsorted(keys, key)
+        if pos == len(keys) or keys[pos] != key:
+            return self.bucket_members[table_idx, :0]
+        offsets = self.bucket_offsets[table_idx]
+        return self.bucket_members[table_idx, offsets[pos]:offsets[pos + 1]]
 
-        candidate_distances = []
-        for idx in candidates:
-            dist = np.linalg.norm(target - self.points[idx])  # euclidean distance
-            candidate_distances.append((dist, self.player_ids[idx], self.points[idx]))
+    # multi-probe: yields (table, key) for the buckets next to the target's, best first
+    # a neighbouring bucket flips the bits whose planes the target is closest to (smallest |dot(point, plane)|),
+    # perturbation sets are ranked by the sum of flipped margins across all tables (Lv et al. 2007)
+    def _probe_sequence(self, projections, target_keys, num_probes):
+        margins = np.abs(projections)  # (num_tables, hash_size)
+        bit_order = np.argsort(margins, axis=1)
+        sorted_margins = np.take_along_axis(margins, bit_order, axis=1)
+
+        heap = [(sorted_margins[t, 0], t, (0,)) for t in range(self.num_tables)]
+        heapq.heapify(heap)
+        while heap and num_probes > 0:
+            score, t, flips = heapq.heappop(heap)
+            flip_mask = np.bitwise_or.reduce(self.bit_weights[bit_order[t, list(flips)]])
+            yield t, target_keys[t] ^ flip_mask
+            num_probes -= 1
+
+            last = flips[-1]
+            if last + 1 < self.hash_size:  # shift last flipped bit to the next one, or also flip the next one
+                shifted = flips[:-1] + (last + 1,)
+                heapq.heappush(heap, (score - sorted_margins[t, last] + sorted_margins[t, last + 1], t, shifted))
+                heapq.heappush(heap, (score + sorted_margins[t, last + 1], t, flips + (last + 1,)))
+
+    # rows sharing a probed bucket with target (the only ones an lsh query ever compares), mask applied
+    def _candidates(self, target, probes, stats, mask):
+        probes = self.num_probes if probes is None else probes
+        projections = self._project(target)[0]
+        target_keys = (projections > 0).astype(np.int64) @ self.bit_weights
+
+        probed = list(enumerate(target_keys))
+        if probes > 0:
+            probed += list(self._probe_sequence(projections, target_keys, probes))
+        buckets = [self._bucket(table_idx, key) for table_idx, key in probed]
+        candidates = np.unique(np.concatenate(buckets)) if buckets else np.empty(0, dtype=np.intp)
+        candidates = candidates[self.in_buckets[candidates]]
+
+        if len(self.extra_rows):  # buffered inserts that share any probed key
+            matched = np.zeros(len(self.extra_rows), dtype=bool)
+            for table_idx, key in probed:
+                matched |= self.extra_keys[:, table_idx] == key
+            candidates = np.union1d(candidates, self.extra_rows[matched])
+
+        if stats is not None:
+            stats['buckets_probed'] = len(buckets)
+            stats['candidates'] = len(candidates)
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        return candidates
+
+    # generates list of approximate nearest neighbors
+    # probes overrides num_probes for this query, stats (dict) gets the number of buckets and candidates looked at
+    # mask -> optional boolean array over the indexed rows, False rows are dropped before ranking
+    def query(self, target, k=5, probes=None, stats=None, mask=None):
+        if k <= 0:
+            return []
+        target = np.asarray(target, dtype=float)
+        candidates = self._candidates(target, probes, stats, mask)
+        if not len(candidates):
+            return []
+
+        diff = self.points[candidates] - target
+        dists = np.sqrt(np.einsum('ij,ij->i', diff, diff))  # euclidean distance for every candidate at once
+        if len(candidates) > k:
+            top = np.argpartition(dists, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(dists[top], kind='stable')]
 
         # return neighbors in order
-        return sorted(candidate_distances)[:k]
+        return [(float(dists[i]), self.player_ids[candidates[i]], self.points[candidates[i]]) for i in top]
+
+    # approximate range queries: candidates from the probed buckets that are within radius (inclusive),
+    # points that hashed elsewhere are missed just like in query
+    def range_search(self, target, radius, probes=None, stats=None, mask=None):
+        target = np.asarray(target, dtype=float)
+        candidates = self._candidates(target, probes, stats, mask)
+        diff = self.points[candidates] - target
+        dists = np.einsum('ij,ij->i', diff, diff)
+        keep = dists <= float(radius) ** 2
+        candidates, dists = candidates[keep], np.sqrt(dists[keep])
+        order = np.argsort(dists, kind='stable')
+        return [(d, self.player_ids[c], self.points[c])
+                for d, c in zip(dists[order].tolist(), candidates[order].tolist())]
+
+    def range_count(self, target, radius, probes=None, stats=None, mask=None):
+        target = np.asarray(target, dtype=float)
+        candidates = self._candidates(target, probes, stats, mask)
+        diff = self.points[candidates] - target
+        return int((np.einsum('ij,ij->i', diff, diff) <= float(radius) ** 2).sum())
+
@@ -0,0 +1,213 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from kdTree import KDTree
+from ann import ANNSearch
+from bruteForce import BruteForceSearch
+from hnsw import HNSWIndex
+from vectorStore import QuantizedSearch
+
+# each engine: build(points) -> index, query(index, target, k) -> row indices (nearest first)
+# indexes are built with row numbers as ids so results can be compared against the exact baseline directly
+ENGINES = {
+    'kdtree': {
+        'build': lambda points: _build(KDTree(points.shape[1]), 'build', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.find_nearest_neighbors(target, k)]
+    },
+    'lsh': {
+        'build': lambda points: _build(ANNSearch(points.shape[1], seed=0), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'brute': {
+        'build': lambda points: _build(BruteForceSearch(points.shape[1]), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'lsh_multiprobe': {
+        'build': lambda points: _build(ANNSearch(points.shape[1], num_tables=4, num_probes=32, seed=0),
+                                       'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'hnsw': {
+        'build': lambda points: _build(HNSWIndex(points.shape[1]), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'hnsw_ef50': {
+        'build': lambda points: _build(HNSWIndex(points.shape[1], ef_search=50), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'sq8': {  # index_bytes of the quantized engines = codes only, the exact points for re-ranking live elsewhere
+        'build': lambda points: _build(QuantizedSearch(points.shape[1], 'sq8'), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    },
+    'pq': {
+        'build': lambda points: _build(QuantizedSearch(points.shape[1], 'pq'), 'build_index', points),
+        'query': lambda index, target, k: [row for _, row, _ in index.query(target, k)]
+    }
+}
+
+# --quantization: (name, store kind, pq subspaces) compared against float64 points
+QUANTIZERS = [('float32', 'float32', None), ('sq8', 'sq8', None), ('pq', 'pq', None), ('pq_1stat', 'pq', 'dims')]
+
+
+def _build(index, method, points):
+    getattr(index, method)(points, np.arange(len(points)))
+    return index
+
+
+# bytes held by an index (arrays from get_state, or the index itself if it is a plain array)
+def index_nbytes(index):
+    if isinstance(index, np.ndarray):
+        return index.nbytes
+    return int(sum(np.asarray(array).nbytes for array in index.get_state().values()))
+
+
+# exact numpy baseline: one distance computation over all points + argpartition
+def exact_neighbors(points, target, k):
+    diff = points - target
+    dists = np.einsum('ij,ij->i', diff, diff)
+    top = np.argpartition(dists, k - 1)[:k] if k < len(points) else np.arange(len(points))
+    return top[np.argsort(dists[top], kind='stable')]
+
+
+def real_datasets(data_path):  # scaled matrix of every feature group in the csv
+    from playerSimilarity import NBAPlayerSimilarity
+    sim = NBAPlayerSimilarity(data_path)
+    return {f'real:{group}': sim.group_points(group).astype(float) for group in sim.feature_data}
+
+
+def synthetic_dataset(n, dims, rng):
+    # clustered points in [0, 1] so the structure looks more like player archetypes than uniform noise
+    centers = rng.random((max(n // 500, 8), dims))
+    points = centers[rng.integers(0, len(centers), n)] + rng.normal(0, 0.05, (n, dims))
+    return np.clip(points, 0, 1)
+
+
+def benchmark_engine(engine, points, query_rows, ks, warmup=10):
+    start = time.perf_counter()
+    index = engine['build'](points)
+    build_time = time.perf_counter() - start
+
+    results = []
+    for k in ks:
+        for row in query_rows[:warmup]:  # warm caches / lazy allocations before timing
+            engine['query'](index, points[row], k)
+
+        latencies = []
+        hits = 0
+        for row in query_rows:
+            target = points[row]
+            start = time.perf_counter()
+            found = engine['query'](index, target, k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found) & set(exact_neighbors(points, target, k).tolist()))
+
+        latencies = np.array(latencies) * 1000
+        results.append({
+            'k': k,
+            'build_s': build_time,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean()),
+            'recall': hits / (k * len(query_rows)),
+            'index_bytes': index_nbytes(index)
+        })
+    return results
+
+
+def run(datasets, engines, ks, num_queries, seed):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name, points in datasets.items():
+        query_rows = rng.choice(len(points), min(num_queries, len(points)), replace=False)
+        for engine_name in engines:
+            for result in benchmark_engine(ENGINES[engine_name], points, query_rows, ks):
+                rows.append(dict(result, dataset=name, engine=engine_name, n=len(points), dims=points.shape[1]))
+                print(f"{name:>22} n={len(points):>8} d={points.shape[1]} {engine_name:>15} k={result['k']:>3} "
+                      f"build={result['build_s']:.3f}s p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+                      f"recall={result['recall']:.3f} mem={result['index_bytes'] / 1e6:.1f}MB", file=sys.stderr)
+    return rows
+
+
+# memory saved vs recall lost per compressed store: bytes per row next to float64 points, recall@k of the
+# compressed distances alone (adc) and after re-ranking a shortlist of `rerank` rows with the exact points
+def quantization_report(datasets, ks, num_queries, seed, rerank=64):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name, points in datasets.items():
+        n, dims = points.shape
+        query_rows = rng.choice(n, min(num_queries, n), replace=False)
+        truth = {k: [set(exact_neighbors(points, points[row], k).tolist()) for row in query_rows] for k in ks}
+        for label, kind, subspaces in QUANTIZERS:
+            start = time.perf_counter()
+            index = QuantizedSearch(dims, kind, dims if subspaces == 'dims' else subspaces, rerank=rerank)
+            index.build_index(points, np.arange(n))
+            build_time = time.perf_counter() - start
+            code_bytes = index.store.nbytes()
+            for k in ks:
+                adc_hits = rerank_hits = 0
+                for row, expected in zip(query_rows, truth[k]):
+                    dists = index.store.distances(points[row])
+                    adc_hits += len(set(np.argsort(dists, kind='stable')[:k].tolist()) & expected)
+                    rerank_hits += len(set(row for _, row, _ in index.query(points[row], k)) & expected)
+                result = {
+                    'dataset': name, 'store': label, 'n': n, 'dims': dims, 'k': k, 'build_s': build_time,
+                    'bytes_per_row': code_bytes / n,
+                    'float64_bytes_per_row': 8 * dims,
+                    'saved_vs_float64': 1 - code_bytes / (8 * dims * n),
+                    'max_error': index.max_error,
+                    'recall_adc': adc_hits / (k * len(query_rows)),
+                    'recall_rerank': rerank_hits / (k * len(query_rows))
+                }
+                rows.append(result)
+                print(f"{name:>22} n={n:>8} d={dims} {label:>9} k={k:>3} {result['bytes_per_row']:.1f}B/row "
+                      f"saved={result['saved_vs_float64']:.1%} recall adc={result['recall_adc']:.3f} "
+                      f"rerank={result['recall_rerank']:.3f}", file=sys.stderr)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall/latency benchmark for the similarity search engines")
+    parser.add_argument('--data', help="playerstats.csv to benchmark every feature group on")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000], help="synthetic dataset sizes")
+    parser.add_argument('--dims', type=int, nargs='*', default=[3, 5, 6, 7], help="synthetic dimensions")
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 5, 25])
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--queries', type=int, default=200, help="timed queries per dataset and k")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--quantization', action='store_true',
+                        help="report memory saved vs recall lost of the compressed stores instead")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    datasets = real_datasets(args.data) if args.data else {}
+    for n in args.sizes:
+        for dims in args.dims:
+            datasets[f'synthetic:{n}x{dims}'] = synthetic_dataset(n, dims, rng)
+
+    if args.quantization:
+        results = quantization_report(datasets, args.k, args.queries, args.seed)
+    else:
+        results = run(datasets, args.engines, args.k, args.queries, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'seed': args.seed,
+                'queries': args.queries
+            },
+            'results': results
+        }, f, indent=2)
+    print(f"wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
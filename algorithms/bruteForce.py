@@ -0,0 +1,169 @@
+import numpy as np
+
+
+class BruteForceSearch:
+    # exact knn by scanning every point -> with 3-7 dims one matrix product over all players is hard to beat
+    # points are kept as float32 together with their squared norms so |p - t|^2 = |p|^2 - 2 p.t + |t|^2
+    # is one blas call per block, the shortlist is then re-ranked with the exact difference form
+    def __init__(self, dimensions, block_size=65536, rerank_extra=16):
+        self.dimensions = dimensions
+        self.block_size = block_size  # rows scored at once (bounds the temporary distance matrix)
+        self.rerank_extra = rerank_extra  # extra shortlist slots so float32 rounding can't change the top k
+        self.points = np.empty((0, dimensions), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.player_ids = np.empty(0)
+        self.alive = np.empty(0, dtype=bool)  # False = deleted (or a row that was never inserted)
+
+    def build_index(self, points, player_ids):
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.points, self.points)
+        self.player_ids = np.asarray(player_ids)
+        self.alive = np.ones(len(self.points), dtype=bool)
+
+    @classmethod
+    def from_state(cls, state, block_size=65536):  # arrays are used as given
+        index = cls(state['points'].shape[1], block_size)
+        index.points, index.norms = state['points'], state['norms']
+        index.player_ids, index.alive = state['player_ids'], state['alive']
+        return index
+
+    def _make_writeable(self):  # memory mapped arrays -> private copy on first change
+        if not all(array.flags.writeable for array in (self.points, self.norms, self.player_ids, self.alive)):
+            self.points, self.norms = np.array(self.points), np.array(self.norms)
+            self.player_ids, self.alive = np.array(self.player_ids), np.array(self.alive)
+
+    # add or replace points by row (default: after every existing row), no index structure to maintain
+    def insert(self, points, player_ids, rows=None):
+        points = np.atleast_2d(np.asarray(points, dtype=np.float32))
+        if rows is None:
+            rows = np.arange(len(self.points), len(self.points) + len(points))
+        rows = np.asarray(rows, dtype=np.intp)
+
+        self._make_writeable()
+        grow = int(rows.max()) + 1 - len(self.points) if len(rows) else 0
+        if grow > 0:
+            self.points = np.concatenate((self.points, np.zeros((grow, self.dimensions), dtype=np.float32)))
+            self.norms = np.concatenate((self.norms, np.zeros(grow, dtype=np.float32)))
+            self.player_ids = np.concatenate((self.player_ids, np.zeros(grow, dtype=self.player_ids.dtype)))
+            self.alive = np.concatenate((self.alive, np.zeros(grow, dtype=bool)))
+        self.points[rows] = points
+        self.norms[rows] = np.einsum('ij,ij->i', points, points)
+        self.player_ids[rows] = player_ids
+        self.alive[rows] = True
+
+    def delete(self, rows):
+        self._make_writeable()
+        self.alive[np.asarray(rows, dtype=np.intp)] = False
+
+    def get_state(self):
+        return {'points': self.points, 'norms': self.norms, 'player_ids': self.player_ids, 'alive': self.alive}
+
+    # single query, same output as KDTree.find_nearest_neighbors / ANNSearch.query
+    # mask -> optional boolean array over the indexed rows, False rows are never returned
+    # stats (dict) gets the number of points scored
+    def query(self, target, k=5, mask=None, stats=None):
+        if k <= 0:
+            return []
+        rows, dists = self.query_batch(np.asarray(target)[None, :], k, None if mask is None else mask[None, :])
+        if stats is not None:
+            stats['points_scanned'] = len(self.points)
+        return [(float(d), self.player_ids[r], self.points[r]) for r, d in zip(rows[0], dists[0]) if r >= 0]
+
+    # many queries at once -> (m, k) row indices and distances, nearest first
+    # rows are -1 (distance inf) where fewer than k points are allowed by the mask
+    # masks -> optional (m, n) boolean array, one row per query
+    def query_batch(self, targets, k=5, masks=None):
+        targets = np.atleast_2d(np.asarray(targets, dtype=np.float32))
+        m, n = len(targets), len(self.points)
+        if not self.alive.all():
+            masks = np.broadcast_to(self.alive, (m, n)) if masks is None else masks & self.alive
+        k = min(k, n)
+        shortlist = min(k + self.rerank_extra, n)
+        if not m or k <= 0:
+            return np.empty((m, 0), dtype=np.intp), np.empty((m, 0))
+
+        best_rows = np.empty((m, 0), dtype=np.intp)
+        best_dists = np.empty((m, 0), dtype=np.float32)
+        target_norms = np.einsum('ij,ij->i', targets, targets)
+        for lo in range(0, n, self.block_size):
+            hi = min(lo + self.block_size, n)
+            # (m, block) squared distances from one matrix product
+            dists = self.norms[lo:hi][None, :] - 2 * (targets @ self.points[lo:hi].T) + target_norms[:, None]
+            if masks is not None:
+                dists[~masks[:, lo:hi]] = np.inf
+
+            # merge this block's best with the running shortlist
+            rows = np.broadcast_to(np.arange(lo, hi), dists.shape)
+            dists = np.concatenate((best_dists, dists), axis=1)
+            rows = np.concatenate((best_rows, rows), axis=1)
+            if dists.shape[1] > shortlist:
+                top = np.argpartition(dists, shortlist - 1, axis=1)[:, :shortlist]
+                dists = np.take_along_axis(dists, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_dists, best_rows = dists, rows
+
+        # exact re-rank of the shortlist (difference form, no cancellation error)
+        diff = self.points[best_rows] - targets[:, None, :]
+        exact = np.einsum('mkd,mkd->mk', diff.astype(np.float64), diff.astype(np.float64))
+        exact[~np.isfinite(best_dists)] = np.inf
+        order = np.argsort(exact, axis=1, kind='stable')[:, :k]
+        rows = np.take_along_axis(best_rows, order, axis=1)
+        dists = np.sqrt(np.take_along_axis(exact, order, axis=1))
+        rows[~np.isfinite(dists)] = -1
+        return rows, dists
+
+    # range queries: every allowed point within radius (inclusive), for one target or counts for many
+    # the matrix product form is off by float32 rounding, so only pairs that land within rounding distance of
+    # the radius are recomputed with the difference form -> same answers as the kd tree
+    def _within(self, targets, target_norms, lo, hi, limit):  # (m, hi - lo) booleans
+        dists = self.norms[lo:hi][None, :] - 2 * (targets @ self.points[lo:hi].T) + target_norms[:, None]
+        tolerance = 1e-5 * (limit + float(target_norms.max()) + float(self.norms[lo:hi].max()))
+        within = dists <= limit
+        i, j = np.nonzero(np.abs(dists - limit) <= tolerance)
+        if len(i):
+            diff = self.points[lo + j].astype(np.float64) - targets[i].astype(np.float64)
+            within[i, j] = np.einsum('ij,ij->i', diff, diff) <= limit
+        return within
+
+    def range_search(self, target, radius, mask=None, stats=None):  # [(distance, player_id, point)] nearest first
+        target = np.asarray(target, dtype=np.float32)[None, :]
+        target_norms = np.einsum('ij,ij->i', target, target)
+        limit = float(radius) ** 2
+        n = len(self.points)
+        allowed = self.alive if mask is None else self.alive & mask[:n]
+        rows = [np.empty(0, dtype=np.intp)]
+        for lo in range(0, n, self.block_size):
+            hi = min(lo + self.block_size, n)
+            rows.append(lo + np.flatnonzero(self._within(target, target_norms, lo, hi, limit)[0] & allowed[lo:hi]))
+        rows = np.concatenate(rows)
+        if stats is not None:
+            stats['points_scanned'] = n
+        diff = self.points[rows].astype(np.float64) - target.astype(np.float64)
+        dists = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        order = np.argsort(dists, kind='stable')
+        return [(d, self.player_ids[r], self.points[r]) for d, r in zip(dists[order].tolist(), rows[order].tolist())]
+
+    def range_count(self, target, radius, mask=None, stats=None):
+        if stats is not None:
+            stats['points_scanned'] = len(self.points)
+        return int(self.range_count_batch(np.asarray(target)[None, :], radius, mask)[0])
+
+    # allowed points within radius of every target -> (m,) counts, targets are scored in chunks of rows so the
+    # temporary (chunk, block) matrix stays around 4 million entries
+    # mask -> optional boolean array over the indexed rows, shared by every target
+    def range_count_batch(self, targets, radius, mask=None):
+        targets = np.atleast_2d(np.asarray(targets, dtype=np.float32))
+        m, n = len(targets), len(self.points)
+        limit = float(radius) ** 2
+        allowed = self.alive if mask is None else self.alive & mask[:n]
+        target_norms = np.einsum('ij,ij->i', targets, targets)
+        counts = np.zeros(m, dtype=np.intp)
+        chunk = max(1, (1 << 22) // max(min(n, self.block_size), 1))
+        for start in range(0, m, chunk):
+            stop = min(start + chunk, m)
+            for lo in range(0, n, self.block_size):
+                hi = min(lo + self.block_size, n)
+                within = self._within(targets[start:stop], target_norms[start:stop], lo, hi, limit)
+                counts[start:stop] += (within & allowed[lo:hi]).sum(axis=1)
+        return counts
+
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class CareerSearch:
+    # stretches of careers instead of single player-seasons: every player's rows in season order, career season 0 =
+    # the player's first season in the data (missing seasons are skipped, not counted)
+    # a target stretch of m seasons is compared against the same career seasons of every player who has them
+    # - aligned: season i against season i
+    # - dtw: dynamic time warping inside a band of `band` seasons, so a breakout one season later still lines up
+    # distance = sqrt(cost / m) with cost the sum of squared season distances, so a one season stretch gives the
+    # same distance as find_similar_players
+    # pruning: every candidate gets a lower bound first (endpoint seasons + LB_Keogh envelope around the target),
+    # candidates are then compared in bound order and stop as soon as the next bound can't beat the k-th best,
+    # dtw comparisons give up (early abandon) once every cell of a row costs more than the k-th best
+    def __init__(self, careers, block_size=256):
+        # careers -> one array of rows per player, season order
+        self.lengths = np.array([len(rows) for rows in careers], dtype=np.intp)
+        self.rows = np.full((len(careers), int(self.lengths.max()) if len(careers) else 0), -1, dtype=np.intp)
+        for career, rows in enumerate(careers):
+            self.rows[career, :len(rows)] = rows
+        self.block_size = block_size  # candidates compared at once
+
+    def windows(self, start, length):  # careers with seasons start..start + length - 1 -> (careers, (n, length) rows)
+        careers = np.flatnonzero(self.lengths >= start + length)
+        return careers, self.rows[careers, start:start + length]
+
+    # envelope of the target (per season and stat, the min/max over the seasons it can be matched with)
+    # lower bound of the cost: each candidate season has to be matched with a target season inside the band,
+    # so it costs at least its squared distance to the envelope, and the first/last seasons are always matched
+    # with each other. with band 0 the envelope is the target itself and the bound is the exact aligned cost
+    @staticmethod
+    def lower_bounds(target, points, band):
+        m = len(target)
+        upper = np.array([target[max(i - band, 0):i + band + 1].max(axis=0) for i in range(m)])
+        lower = np.array([target[max(i - band, 0):i + band + 1].min(axis=0) for i in range(m)])
+        keogh = (np.maximum(points - upper, 0) ** 2 + np.maximum(lower - points, 0) ** 2).sum(axis=(1, 2))
+        if band == 0:
+            return keogh
+        ends = ((points[:, 0] - target[0]) ** 2).sum(axis=1)
+        if m > 1:
+            ends += ((points[:, -1] - target[-1]) ** 2).sum(axis=1)
+        return np.maximum(keogh, ends)
+
+    # dtw costs of a block of candidates, inf where the cost passed limit (abandoned)
+    @staticmethod
+    def dtw(target, points, band, limit=np.inf, stats=None):
+        n, m = len(points), len(target)
+        cost = ((points[:, None, :, :] - target[None, :, None, :]) ** 2).sum(axis=3)  # (n, target, candidate)
+        live = np.arange(n)
+        prev = np.full((n, m), np.inf)
+        for i in range(m):
+            cur = np.full((len(live), m), np.inf)
+            for j in range(max(i - band, 0), min(i + band + 1, m)):
+                if i == 0 and j == 0:
+                    best = 0.0
+                else:
+                    best = prev[:, j]
+                    if j > 0:
+                        best = np.minimum(best, np.minimum(prev[:, j - 1], cur[:, j - 1]))
+                cur[:, j] = cost[:, i, j] + best
+            # every path crosses row i and costs never go down -> the row minimum bounds the final cost
+            keep = cur.min(axis=1) < limit
+            if not keep.all():
+                if stats is not None:
+                    stats['abandoned'] = stats.get('abandoned', 0) + int((~keep).sum())
+                live, cur, cost = live[keep], cur[keep], cost[keep]
+            prev = cur
+        costs = np.full(n, np.inf)
+        costs[live] = prev[:, m - 1]
+        return costs
+
+    # target -> (m, d) points of the target stretch starting at career season `start`
+    # points -> function rows -> (..., d) points (read at query time, so live updates are seen)
+    # mask -> optional boolean mask over rows, a candidate needs every compared season allowed
+    # returns [(distance, career, rows)] nearest first
+    def query(self, target, points, k, start=0, band=0, mask=None, stats=None):
+        target = np.asarray(target, dtype=np.float64)
+        m = len(target)
+        band = min(max(int(band), 0), m - 1)
+        careers, rows = self.windows(start, m)
+        if mask is not None:
+            allowed = mask[rows].all(axis=1)
+            careers, rows = careers[allowed], rows[allowed]
+        if k <= 0 or not len(careers):
+            return []
+
+        candidate_points = np.asarray(points(rows), dtype=np.float64)
+        bounds = self.lower_bounds(target, candidate_points, band)
+        order = np.argsort(bounds, kind='stable')
+        if band == 0:  # the bound is the exact cost
+            best = order[:k]
+            costs = bounds[best]
+            compared = len(careers)
+        else:
+            best = np.empty(0, dtype=np.intp)
+            costs = np.empty(0)
+            limit = np.inf
+            compared = 0
+            position = 0
+            size = k  # the first block only seeds the k-th best, later blocks are bigger
+            while position < len(order) and bounds[order[position]] < limit:
+                block = order[position:position + size]
+                block = block[bounds[block] < limit]
+                position += size
+                size = self.block_size
+                block_costs = self.dtw(target, candidate_points[block], band, limit, stats)
+                compared += len(block)
+                best = np.concatenate((best, block))
+                costs = np.concatenate((costs, block_costs))
+                top = np.lexsort((best, costs))[:k]
+                best, costs = best[top], costs[top]
+                if len(best) == k:
+                    limit = costs[-1]
+            best, costs = best[np.isfinite(costs)], costs[np.isfinite(costs)]
+        if stats is not None:
+            stats['candidates'] = stats.get('candidates', 0) + len(careers)
+            stats['compared'] = stats.get('compared', 0) + compared
+            stats['pruned'] = stats.get('pruned', 0) + len(careers) - compared
+        top = np.lexsort((best, costs))
+        return [(float(np.sqrt(cost / m)), int(careers[i]), rows[i]) for i, cost in zip(best[top], costs[top])]
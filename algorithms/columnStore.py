@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class ColumnStore:
+    # every stat column exactly once, row aligned with player_info -> (rows, columns) float32 matrices
+    # feature groups only keep the column indices of their stats, so PTS/DEF_RATING/... are not copied per group
+    # raw -> stats as in the csv (for display), scaled -> 0-1 per column (for distance calculations)
+    def __init__(self, columns, raw=None):
+        self.columns = list(columns)
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.raw = np.empty((0, len(self.columns)), dtype=np.float32)
+        self.scaled = np.empty((0, len(self.columns)), dtype=np.float32)
+        self.min = np.zeros(len(self.columns))  # normalization bounds, live updates are scaled with these
+        self.max = np.zeros(len(self.columns))
+        if raw is not None:
+            self.raw = np.ascontiguousarray(raw, dtype=np.float32)
+            self.rescale()
+
+    def __len__(self):
+        return len(self.raw)
+
+    # re-normalize with bounds taken from the live rows only (all rows if none given)
+    def rescale(self, live=None):
+        X = self.raw if live is None or not live.any() else self.raw[live]
+        if len(X):
+            self.min, self.max = X.min(axis=0).astype(float), X.max(axis=0).astype(float)
+        self.scaled = self.scale(self.raw)
+
+    def scale(self, X):  # 1e-8 prevents division by zero
+        return ((np.asarray(X, dtype=float) - self.min) / (self.max - self.min + 1e-8)).astype(np.float32)
+
+    def indices(self, features):  # column positions of a feature group
+        return np.array([self.column_index[feature] for feature in features], dtype=np.intp)
+
+    # one group's points for every row (a copy, used to build indexes) or for some rows
+    def group_points(self, columns, rows=None):
+        if rows is None:
+            return self.scaled[:, columns]
+        return self.scaled[rows][..., columns]
+
+    def raw_stats(self, row, features, columns):  # {stat: value} of one row, plain python floats
+        return dict(zip(features, self.raw[row, columns].tolist()))
+
+    def norm_stats(self, row, features, columns):
+        return dict(zip(features, self.scaled[row, columns].tolist()))
+
+    # write whole rows (all columns), rows past the end grow the store, X is scaled with the current bounds
+    def set_rows(self, rows, X):
+        X = np.asarray(X, dtype=np.float32)
+        grow = int(rows.max()) + 1 - len(self.raw) if len(rows) else 0
+        if grow > 0:
+            self.raw = np.concatenate((self.raw, np.zeros((grow, len(self.columns)), dtype=np.float32)))
+            self.scaled = np.concatenate((self.scaled, np.zeros((grow, len(self.columns)), dtype=np.float32)))
+        elif not self.raw.flags.writeable or not self.scaled.flags.writeable:  # memory mapped snapshot
+            self.raw, self.scaled = self.raw.copy(), self.scaled.copy()
+        self.raw[rows] = X
+        self.scaled[rows] = self.scale(X)
+
+    # how far new stats fall outside the current bounds, as a share of each column's range (0 = inside)
+    def drift(self, X):
+        span = self.max - self.min + 1e-8
+        X = np.asarray(X, dtype=float)
+        return float(np.max(np.maximum(self.min - X.min(axis=0), X.max(axis=0) - self.max) / span))
+
+    def get_state(self):
+        return {'raw': self.raw, 'scaled': self.scaled, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_state(cls, columns, state):  # arrays are used as given (no re-normalizing)
+        store = cls(columns)
+        store.raw, store.scaled, store.min, store.max = state['raw'], state['scaled'], state['min'], state['max']
+        return store
+
+    def nbytes(self):
+        return int(sum(np.asarray(array).nbytes for array in self.get_state().values()))
@@ -1,19 +1,69 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
-from playerSimilarity import NBAPlayerSimilarity
+from playerSimilarity import NBAPlayerSimilarity, GroupUnavailableError
+from resultCache import ResultCache
+from metrics import Metrics, RequestTrace
+import json
+import os
+import sys
 
 
 app = Flask(__name__)
 CORS(app)  # allows react to communicate back
 
 # init nba simn
+# without a snapshot each feature group's indexes are built on its first search and warmed in the background
+# (WARM_ORDER=scoring,style,... goes first, LAZY_BUILD=0 builds everything before serving)
+# a group that fails to build shows up in /api/status and the others keep working
+init_error = None
 try:
-    nba_sim = NBAPlayerSimilarity('playerstats.csv')
+    nba_sim = NBAPlayerSimilarity(  # reuses saved indexes if csv unchanged
+        'playerstats.csv', snapshot_dir='index_snapshot',
+        build_workers=int(os.environ.get('BUILD_WORKERS', 1)),  # feature groups indexed at once on a fresh build
+        build_mode=os.environ.get('BUILD_MODE', 'process'),
+        lazy=os.environ.get('LAZY_BUILD', '1') == '1',
+        warm_order=[group for group in os.environ.get('WARM_ORDER', 'scoring').lower().split(',') if group],
+        lsh_params_path=os.environ.get('LSH_PARAMS', 'lsh_params.json')  # written by python main.py --tune-lsh
+    )
     #print("nba sim initialized")
-except Exception as e:
-    #print("error")
+except Exception as e:  # csv missing or unreadable, nothing can be served
+    init_error = f"{type(e).__name__}: {e}"
+    print(f"nba sim failed to initialize: {init_error}", file=sys.stderr)
     nba_sim = None
 
+# finished /api/similar responses, size and ttl (seconds) can be set with env vars
+result_cache = ResultCache(
+    max_size=int(os.environ.get('RESULT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ['RESULT_CACHE_TTL']) if os.environ.get('RESULT_CACHE_TTL') else None
+)
+
+# phase timing / index counter histograms for /api/metrics, ENABLE_METRICS=0 turns them off
+# (a request with "debug": true is still traced and gets its own numbers back)
+ENABLE_METRICS = os.environ.get('ENABLE_METRICS', '1') == '1'
+request_metrics = Metrics()
+
+# live stat updates through /api/rows are off unless ENABLE_UPDATES=1
+ENABLE_UPDATES = os.environ.get('ENABLE_UPDATES') == '1'
+
+SEARCH_METHODS = {'kdtree': 'Exact KD-Tree', 'lsh': 'Approximate ANN', 'brute': 'Exact Brute Force',
+                  'hnsw': 'Approximate HNSW', 'table': 'Precomputed KNN Table', 'sq8': 'Quantized 8-bit Scan',
+                  'pq': 'Product Quantized Scan'}
+
+AUTOCOMPLETE_MAX_RESULTS = 100
+
+# /api/similar/within and /api/uniqueness page sizes (stream=true on /api/similar/within has no limit)
+RANGE_PAGE_SIZE = 100
+RANGE_MAX_PAGE_SIZE = 1000
+
+# /api/similar/batch limits, workers > 1 forks a process pool per batch
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 1))
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', 5000))
+
+
+@app.errorhandler(GroupUnavailableError)
+def group_unavailable(e):  # the group's indexes failed to build, see /api/status
+    return jsonify({'error': str(e), 'feature_group': e.group}), 503
+
 
 @app.route('/api/feature-groups', methods=['GET']) # reading 
 def get_feature_groups():
@@ -24,7 +74,8 @@ def get_feature_groups():
         'feature_groups': list(nba_sim.feature_groups.keys()),
         'profiles': {
             group: features for group, features in nba_sim.feature_groups.items()
-        }
+        },
+        'stats': nba_sim.stats.columns  # everything usable in custom searches (features/weights)
     })
 
 @app.route('/api/similar', methods=['POST']) # sending 
@@ -34,6 +85,8 @@ def find_similar_players():
 
     try:
         data = request.get_json()
+        debug = bool(data.get('debug')) or request.args.get('debug') == '1'  # timings + counters in the response
+        trace = RequestTrace() if ENABLE_METRICS or debug else None
 
         # get data from jason, as easy as stealing candy from a baby
         player_name = data.get('player_name', '').strip()
@@ -41,6 +94,13 @@ def find_similar_players():
         k = data.get('k', 5)
         season = data.get('season')
         exact = data.get('exact', False)
+        engine = data.get('engine')  # 'auto', 'kdtree', 'lsh', 'brute' or 'hnsw', overrides exact when given
+        probes = data.get('probes')  # optional multi-probe budget for ANN
+        ef = data.get('ef')  # optional hnsw candidate list size (recall vs speed)
+        season_from = data.get('season_from')  # optional season range to search in, e.g. 1990-1999
+        season_to = data.get('season_to')
+        features = data.get('features')  # optional custom stat list instead of the group's
+        weights = data.get('weights')  # optional {stat: weight}, e.g. {"TS_PCT": 3}
         
 
 
@@ -48,10 +108,54 @@ def find_similar_players():
         if not isinstance(k, int) or k <= 0:
             return jsonify({'error': 'k must be a positive integer'}), 400 # user error 
         
+        if engine is not None and engine not in nba_sim.ENGINES:
+            return jsonify({'error': f"engine must be one of {', '.join(nba_sim.ENGINES)}"}), 400
+
+        if probes is not None and (not isinstance(probes, int) or probes < 0):
+            return jsonify({'error': 'probes must be a non-negative integer'}), 400
+
+        if ef is not None and (not isinstance(ef, int) or ef <= 0):
+            return jsonify({'error': 'ef must be a positive integer'}), 400
+
+        if features is not None and (not isinstance(features, list) or not features or
+                                     not all(isinstance(feat, str) for feat in features)):
+            return jsonify({'error': 'features must be a non-empty list of stat names'}), 400
+
+        if weights is not None and (not isinstance(weights, dict) or not all(
+                isinstance(w, (int, float)) and not isinstance(w, bool) for w in weights.values())):
+            return jsonify({'error': 'weights must map stat names to numbers'}), 400
+
+        if feature_group not in nba_sim.feature_groups and features is None:
+            return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+
+        try:  # bad stat names / weights are the caller's fault, not a missing player
+            nba_sim.custom_space(feature_group, features, weights)
+        except KeyError:
+            return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         # convert string to int to pass into function
         if season and isinstance(season, str) and season.isdigit():
             season = int(season)
-        
+
+        try:
+            season_range = (None if season_from in (None, '') else int(season_from),
+                            None if season_to in (None, '') else int(season_to))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'season_from and season_to must be years'}), 400
+
+        # popular searches come straight from the cache, no index work or serialization
+        cache_key = (player_name, season, feature_group, k, bool(exact), engine, probes, ef, season_range,
+                     tuple(features or ()), tuple(sorted((weights or {}).items())))
+        if trace is not None:
+            trace.lap('parse')
+        version = nba_sim.index_version  # before the search, a live update during it must not be cached as new
+        cached = None if debug else result_cache.get(cache_key, version)
+        if cached is not None:
+            if trace is not None:
+                request_metrics.record(trace.finish(), 'cached.')
+            return app.response_class(cached, mimetype='application/json')
 
         # do the search
         similar_players = nba_sim.find_similar_players(
@@ -59,7 +163,14 @@ def find_similar_players():
             feature_group=feature_group,
             k=k,
             season=season,
-            exact=exact
+            exact=exact,
+            probes=probes,
+            ef=ef,
+            season_range=season_range,
+            engine=engine,
+            features=features,
+            weights=weights,
+            trace=trace
         )
 
         # response from backend
@@ -73,28 +184,20 @@ def find_similar_players():
             'is_target': True
         }
         
+        features = features or nba_sim.feature_groups[feature_group]
+
         # target playe stats 
         if similar_players:
-            features = nba_sim.feature_groups[feature_group]
             # Find target player's actual stats
-            mask = (nba_sim.player_info['PLAYER_NAME'] == player_name)
-            if season:
-                if isinstance(season, int):
-                    mask &= nba_sim.player_info['SEASON'].astype(str).str.startswith(str(season))
-                else:
-                    mask &= (nba_sim.player_info['SEASON'] == season)
-            target_info = nba_sim.player_info[mask]
-            if not target_info.empty:
-                target_id = target_info['player_id'].values[0]
-                target_stats = nba_sim.feature_data[feature_group]['raw'][target_id]
-                target_player['metrics'] = [round(target_stats[feat], 1) for feat in features]
+            target_row = nba_sim.find_player_row(player_name, season)
+            target_stats = nba_sim.describe_row(feature_group, target_row, 0.0, features)['raw_stats']
+            target_player['metrics'] = [round(target_stats[feat], 1) for feat in features]
 
         response_data.append(target_player)
         
         # append similar players
         for player in similar_players:
             similarity_score = round(1 / (1 + player['distance']), 3)
-            features = nba_sim.feature_groups[feature_group]
             metrics = [round(player['raw_stats'][feat], 1) for feat in features]
             
             response_data.append({
@@ -106,23 +209,464 @@ def find_similar_players():
                 'is_target': False
             })
         
-        return jsonify({
+        if nba_sim.table_applies(feature_group, k, engine, data.get('features'), weights, season_range,
+                                 exact=bool(exact)):
+            method = 'table'
+        else:
+            method = nba_sim.resolve_engine(feature_group, exact, engine, dims=len(features))
+        payload = {
             'success': True,
             'data': response_data,
             'metadata': {
                 'feature_group': feature_group,
-                'features': nba_sim.feature_groups[feature_group],
-                'search_method': 'Exact KD-Tree' if exact else 'Approximate ANN',
+                'features': features,
+                'weights': weights,
+                'search_method': SEARCH_METHODS[method],
                 'total_results': len(similar_players)
             }
-        })
+        }
+        if trace is None:
+            response = jsonify(payload)
+            result_cache.put(cache_key, response.get_data(), version)
+            return response
+
+        trace.lap('hydrate')
+        if debug:  # serialize/total aren't known until after jsonify, they are in the Server-Timing header
+            payload['debug'] = dict(trace.as_dict(), engine=method)
+        response = jsonify(payload)
+        trace.lap('serialize')
+        trace.finish()
+        if ENABLE_METRICS:
+            request_metrics.record(trace)
+            request_metrics.observe(f'{method}.search_ms', trace.phases.get('search', 0.0) * 1000)
+        if debug:
+            response.headers['Server-Timing'] = ', '.join(
+                f'{phase};dur={seconds * 1000:.3f}' for phase, seconds in trace.phases.items())
+        else:
+            result_cache.put(cache_key, response.get_data(), version)
+        return response
         
+    except GroupUnavailableError as e:
+        return group_unavailable(e)
     except ValueError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
         print(f"Error in find_similar_players: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/similar/profiles', methods=['POST'])
+def find_similar_profiles():
+    """/api/similar for several feature groups at once (default all of them): the target is looked up once and
+    "fuse": "distance" or "rank" adds an overall ranking across the groups"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    data = request.get_json(silent=True) or {}
+    player_name = str(data.get('player_name', '')).strip()
+    feature_groups = data.get('feature_groups')
+    k = data.get('k', 5)
+    season = data.get('season')
+    exact = data.get('exact', False)
+    engine = data.get('engine')
+    fuse = data.get('fuse')
+
+    if feature_groups is not None and (not isinstance(feature_groups, list) or not feature_groups or
+                                       not all(isinstance(group, str) for group in feature_groups)):
+        return jsonify({'error': 'feature_groups must be a non-empty list of feature group names'}), 400
+    feature_groups = [group.lower() for group in feature_groups or nba_sim.feature_groups]
+    unknown = [group for group in feature_groups if group not in nba_sim.feature_groups]
+    if unknown:
+        return jsonify({'error': f"Unknown feature groups {', '.join(unknown)}"}), 400
+    if not isinstance(k, int) or isinstance(k, bool) or k <= 0:
+        return jsonify({'error': 'k must be a positive integer'}), 400
+    if engine is not None and engine not in nba_sim.ENGINES:
+        return jsonify({'error': f"engine must be one of {', '.join(nba_sim.ENGINES)}"}), 400
+    if fuse not in (None, 'distance', 'rank'):
+        return jsonify({'error': 'fuse must be distance or rank'}), 400
+    if season and isinstance(season, str) and season.isdigit():
+        season = int(season)
+    try:
+        season_range = (None if data.get('season_from') in (None, '') else int(data['season_from']),
+                        None if data.get('season_to') in (None, '') else int(data['season_to']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'season_from and season_to must be years'}), 400
+
+    cache_key = ('profiles', player_name, season, tuple(feature_groups), k, bool(exact), engine, season_range, fuse)
+    version = nba_sim.index_version  # before the search, like /api/similar
+    cached = result_cache.get(cache_key, version)
+    if cached is not None:
+        return app.response_class(cached, mimetype='application/json')
+
+    trace = RequestTrace() if ENABLE_METRICS else None
+    try:
+        found = nba_sim.find_similar_profiles(player_name, feature_groups, k, season, exact, engine, season_range,
+                                              fuse, trace)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    target_row = nba_sim.find_player_row(player_name, season)
+    groups = {}
+    for group, result in found['groups'].items():
+        if 'error' in result:
+            groups[group] = {'error': result['error']}
+            continue
+        features = nba_sim.feature_groups[group]
+        target_stats = nba_sim.describe_row(group, target_row, 0.0)['raw_stats']
+        groups[group] = {
+            'features': features,
+            'search_method': SEARCH_METHODS[result['engine']],
+            'target_metrics': [round(target_stats[feat], 1) for feat in features],
+            'data': [{
+                'player': player['player'],
+                'season': player['season'],
+                'similarity': round(1 / (1 + player['distance']), 3),
+                'distance': round(player['distance'], 3),
+                'metrics': [round(player['raw_stats'][feat], 1) for feat in features]
+            } for player in result['results']]
+        }
+    payload = {
+        'success': True,
+        'target': {'player': player_name, 'season': nba_sim.seasons[target_row]},
+        'groups': groups
+    }
+    if fuse:
+        payload['overall'] = [{
+            'player': player['player'],
+            'season': player['season'],
+            'similarity': round(1 / (1 + player['distance']), 3),
+            'distance': round(player['distance'], 3),
+            'distances': {group: round(distance, 3) for group, distance in player['distances'].items()},
+            'rrf': None if player['rrf'] is None else round(player['rrf'], 5)
+        } for player in found['overall']]
+    response = jsonify(payload)
+    if trace is not None:
+        trace.lap('serialize')
+        request_metrics.record(trace.finish(), 'profiles.')
+    result_cache.put(cache_key, response.get_data(), version)
+    return response
+
+@app.route('/api/similar/batch', methods=['POST'])
+def find_similar_batch():
+    """Run many similarity searches in one request, results are in the same order as the queries"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'queries must be a non-empty list'}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({'error': f'at most {BATCH_MAX_QUERIES} queries per batch'}), 400
+
+    cleaned = []
+    for query in queries:  # same fields and checks as /api/similar
+        if not isinstance(query, dict) or not str(query.get('player_name', '')).strip():
+            return jsonify({'error': 'every query needs a player_name'}), 400
+        k = query.get('k', 5)
+        if not isinstance(k, int) or k <= 0:
+            return jsonify({'error': 'k must be a positive integer'}), 400
+        if query.get('engine') is not None and query['engine'] not in nba_sim.ENGINES:
+            return jsonify({'error': f"engine must be one of {', '.join(nba_sim.ENGINES)}"}), 400
+        probes, ef = query.get('probes'), query.get('ef')
+        if probes is not None and (not isinstance(probes, int) or isinstance(probes, bool) or probes < 0):
+            return jsonify({'error': 'probes must be a non-negative integer'}), 400
+        if ef is not None and (not isinstance(ef, int) or isinstance(ef, bool) or ef <= 0):
+            return jsonify({'error': 'ef must be a positive integer'}), 400
+        season = query.get('season')
+        if season and isinstance(season, str) and season.isdigit():
+            season = int(season)
+        cleaned.append({
+            'player_name': str(query['player_name']).strip(),
+            'feature_group': str(query.get('feature_group', 'scoring')).lower(),
+            'season': season,
+            'k': k,
+            'exact': bool(query.get('exact', False)),
+            'engine': query.get('engine'),
+            'probes': query.get('probes'),
+            'ef': query.get('ef')
+        })
+
+    response_data = []
+    for entry in nba_sim.find_similar_batch(cleaned, workers=BATCH_WORKERS):
+        query = entry['query']
+        item = {'player': query['player_name'], 'season': query['season'], 'feature_group': query['feature_group']}
+        if 'error' in entry:
+            item['error'] = entry['error']
+        else:
+            item['results'] = [{
+                'player': player['player'],
+                'season': player['season'],
+                'similarity': round(1 / (1 + player['distance']), 3),
+                'distance': round(player['distance'], 3),
+                'metrics': [round(player['raw_stats'][feat], 1) for feat in nba_sim.feature_groups[query['feature_group']]]
+            } for player in entry['results']]
+        response_data.append(item)
+
+    return jsonify({'success': True, 'data': response_data, 'total_queries': len(response_data)})
+
+def page_args(offset, limit):  # -> (offset, limit, error message or None)
+    limit = RANGE_PAGE_SIZE if limit is None else limit
+    if not isinstance(offset, int) or offset < 0:
+        return offset, limit, 'offset must be a non-negative integer'
+    if not isinstance(limit, int) or not 0 < limit <= RANGE_MAX_PAGE_SIZE:
+        return offset, limit, f'limit must be between 1 and {RANGE_MAX_PAGE_SIZE}'
+    return offset, limit, None
+
+@app.route('/api/similar/within', methods=['POST'])
+def find_players_within():
+    """Every player-season within `radius` of a player, paged with offset/limit, streamed as json lines with
+    "stream": true, or just counted with "count_only": true"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    data = request.get_json(silent=True) or {}
+    player_name = str(data.get('player_name', '')).strip()
+    feature_group = str(data.get('feature_group', 'scoring')).lower()
+    radius = data.get('radius')
+    season = data.get('season')
+    engine = data.get('engine')
+    features = data.get('features')
+    weights = data.get('weights')
+    count_only = bool(data.get('count_only'))
+    stream = bool(data.get('stream'))
+
+    if not isinstance(radius, (int, float)) or isinstance(radius, bool) or radius < 0:
+        return jsonify({'error': 'radius must be a non-negative number'}), 400
+    if engine is not None and engine not in nba_sim.ENGINES:
+        return jsonify({'error': f"engine must be one of {', '.join(nba_sim.ENGINES)}"}), 400
+    offset, limit, error = page_args(data.get('offset', 0), data.get('limit'))
+    if error:
+        return jsonify({'error': error}), 400
+    if season and isinstance(season, str) and season.isdigit():
+        season = int(season)
+    try:
+        season_range = (None if data.get('season_from') in (None, '') else int(data['season_from']),
+                        None if data.get('season_to') in (None, '') else int(data['season_to']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'season_from and season_to must be years'}), 400
+    if feature_group not in nba_sim.feature_groups and features is None:
+        return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+    try:
+        nba_sim.custom_space(feature_group, features, weights)
+    except KeyError:
+        return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    search = dict(player_name=player_name, feature_group=feature_group, radius=radius, season=season,
+                  exact=data.get('exact', True), engine=engine, season_range=season_range, features=features,
+                  weights=weights)
+    features = features or nba_sim.feature_groups[feature_group]
+    try:
+        if count_only:
+            return jsonify({'success': True, 'total': nba_sim.count_players_within(**search), 'radius': radius})
+        if stream:
+            found = nba_sim.find_players_within(**search, offset=offset, lazy=True)
+        else:
+            found = nba_sim.find_players_within(**search, offset=offset, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    def row(player):
+        return {
+            'player': player['player'],
+            'season': player['season'],
+            'similarity': round(1 / (1 + player['distance']), 3),
+            'distance': round(player['distance'], 3),
+            'metrics': [round(player['raw_stats'][feat], 1) for feat in features]
+        }
+
+    if stream:  # first line = totals, then one player-season per line, hydrated while the response is sent
+        def lines():
+            yield json.dumps({'total': found['total'], 'radius': radius, 'features': features}) + '\n'
+            for player in found['results']:
+                yield json.dumps(row(player)) + '\n'
+        return app.response_class(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+    next_offset = offset + limit if offset + limit < found['total'] else None
+    return jsonify({
+        'success': True,
+        'data': [row(player) for player in found['results']],
+        'total': found['total'],
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset,
+        'metadata': {'feature_group': feature_group, 'features': features, 'radius': radius}
+    })
+
+@app.route('/api/similar/careers', methods=['POST'])
+def find_similar_careers():
+    """Players whose careers developed like a player's: career seasons start..start + length - 1 (or the stretch
+    covered by season_first..season_last) against the same career seasons of everyone else, metric "aligned" or
+    "dtw" (seasons may shift by up to band)"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    data = request.get_json(silent=True) or {}
+    player_name = str(data.get('player_name', '')).strip()
+    feature_group = str(data.get('feature_group', 'scoring')).lower()
+    k = data.get('k', 5)
+    start = data.get('start', 0)
+    length = data.get('length')
+    metric = data.get('metric', 'aligned')
+    band = data.get('band', 1)
+    features = data.get('features')
+    weights = data.get('weights')
+
+    if not isinstance(k, int) or isinstance(k, bool) or k <= 0:
+        return jsonify({'error': 'k must be a positive integer'}), 400
+    if not isinstance(start, int) or isinstance(start, bool) or start < 0:
+        return jsonify({'error': 'start must be a non-negative integer'}), 400
+    if length is not None and (not isinstance(length, int) or isinstance(length, bool) or length <= 0):
+        return jsonify({'error': 'length must be a positive integer'}), 400
+    if metric not in ('aligned', 'dtw'):
+        return jsonify({'error': 'metric must be aligned or dtw'}), 400
+    if not isinstance(band, int) or isinstance(band, bool) or band < 0:
+        return jsonify({'error': 'band must be a non-negative integer'}), 400
+    if feature_group not in nba_sim.feature_groups and features is None:
+        return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+    try:
+        seasons = None
+        if data.get('season_first') not in (None, '') or data.get('season_last') not in (None, ''):
+            seasons = (int(data.get('season_first') or 0), int(data.get('season_last') or 9999))
+        season_range = (None if data.get('season_from') in (None, '') else int(data['season_from']),
+                        None if data.get('season_to') in (None, '') else int(data['season_to']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'season_first, season_last, season_from and season_to must be years'}), 400
+    try:
+        nba_sim.custom_space(feature_group, features, weights)
+    except KeyError:
+        return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        found = nba_sim.find_similar_careers(player_name, feature_group, k, start, length, seasons, metric, band,
+                                             season_range, features, weights)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    features = features or nba_sim.feature_groups[feature_group]
+    return jsonify({
+        'success': True,
+        'target': {'player': player_name, 'seasons': found['seasons']},
+        'data': [{
+            'player': career['player'],
+            'seasons': career['seasons'],
+            'similarity': round(1 / (1 + career['distance']), 3),
+            'distance': round(career['distance'], 3),
+            'metrics': [[round(stats[feat], 1) for feat in features] for stats in career['raw_stats']]
+        } for career in found['results']],
+        'metadata': {'feature_group': feature_group, 'features': features, 'metric': metric,
+                     'band': band if metric == 'dtw' else 0}
+    })
+
+@app.route('/api/uniqueness', methods=['GET'])
+def get_uniqueness():
+    """Comparables (other players' seasons within ?radius=) and uniqueness of every player-season in a feature
+    group, most unique first (?order=common for the reverse), paged, ?player= to only get one player's seasons"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    feature_group = request.args.get('feature_group', 'scoring').lower()
+    radius = request.args.get('radius', 0.1, type=float)
+    engine = request.args.get('engine', 'auto')
+    player = request.args.get('player')
+    if feature_group not in nba_sim.feature_groups:
+        return jsonify({'error': f"Unknown feature group {feature_group}"}), 400
+    if radius is None or radius < 0:
+        return jsonify({'error': 'radius must be a non-negative number'}), 400
+    if engine not in nba_sim.ENGINES:
+        return jsonify({'error': f"engine must be one of {', '.join(nba_sim.ENGINES)}"}), 400
+    offset, limit, error = page_args(request.args.get('offset', 0, type=int), request.args.get('limit', type=int))
+    if error:
+        return jsonify({'error': error}), 400
+
+    scores = nba_sim.uniqueness_scores(feature_group, radius, engine)
+    if player is not None:
+        scores = scores[scores['player'] == player]
+    scores = scores.sort_values('comparables', ascending=request.args.get('order') != 'common', kind='stable')
+    page = scores.iloc[offset:offset + limit]
+    return jsonify({
+        'feature_group': feature_group,
+        'radius': radius,
+        'data': [{'player': name, 'season': season, 'comparables': int(count), 'uniqueness': round(float(score), 4)}
+                 for name, season, count, score in zip(page['player'], page['season'], page['comparables'],
+                                                       page['uniqueness'])],
+        'total': len(scores),
+        'offset': offset,
+        'limit': limit
+    })
+
+@app.route('/api/rows', methods=['POST', 'DELETE'])
+def update_rows():
+    """Upsert player-season stat lines (POST {'rows': [...]}) or remove one (DELETE {'player_name', 'season'})"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+    if not ENABLE_UPDATES:
+        return jsonify({'error': 'updates are disabled'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if request.method == 'DELETE':
+            nba_sim.remove_rows(data.get('player_name', ''), data.get('season'))
+            return jsonify({'success': True, 'removed': 1})
+
+        rows = data.get('rows')
+        if not isinstance(rows, list) or not rows:
+            return jsonify({'error': 'rows must be a non-empty list'}), 400
+        return jsonify(dict(nba_sim.upsert_rows(rows), success=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """200 once every feature group is built or loaded (or failed, see /api/status), 503 until then or if loading
+    failed"""
+    groups = nba_sim.group_status if nba_sim else {}
+    ready = nba_sim is not None and all(status['state'] in ('ready', 'failed') for status in groups.values())
+    return jsonify({
+        'ready': ready,
+        'pid': os.getpid(),
+        'index_version': nba_sim.index_version if nba_sim else None,
+        'failed_groups': [group for group, status in groups.items() if status['state'] == 'failed']
+    }), 200 if ready else 503
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """Index state of every feature group (pending, building, ready or failed), where it came from (build or
+    snapshot), how many seconds that took, the error of failed groups, the lsh settings in use (with the
+    recall/latency they reached if they were tuned) and whether its hnsw graph and knn table have been built yet"""
+    if not nba_sim:
+        return jsonify({'initialized': False, 'error': init_error}), 500
+    groups = {group: dict(status, build_seconds=None if status['build_seconds'] is None else
+                          round(status['build_seconds'], 3), lsh=nba_sim.lsh_info(group),
+                          hnsw=group in nba_sim.hnsw_indices, knn_table=group in nba_sim.knn_tables)
+              for group, status in list(nba_sim.group_status.items())}
+    return jsonify({
+        'initialized': True,
+        'warming': nba_sim.warm_thread is not None and nba_sim.warm_thread.is_alive(),
+        'ready_groups': sum(status['state'] == 'ready' for status in groups.values()),
+        'total_groups': len(groups),
+        'groups': groups,
+        'pid': os.getpid()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Histograms of /api/similar phase timings (ms) and index traversal counters for this worker process"""
+    return jsonify({
+        'enabled': ENABLE_METRICS,
+        'pid': os.getpid(),
+        'histograms': request_metrics.snapshot(),
+        'result_cache': result_cache.stats()
+    })
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss/eviction counters for the /api/similar result cache"""
+    return jsonify(result_cache.stats())
+
 @app.route('/api/players', methods=['GET']) # auto fill
 def get_players():
 
@@ -130,16 +674,38 @@ def get_players():
         return jsonify({'error': 'nba sim not initialized'}), 500
     
     try:
-        players = nba_sim.player_info['PLAYER_NAME'].unique().tolist()
-        players.sort()
-        
+        players = nba_sim.name_index.names  # prebuilt, already sorted
+        # optional paging, ?offset=0&limit=100 (no limit = everything from offset on)
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        if offset < 0 or (limit is not None and limit < 0):
+            return jsonify({'error': 'offset and limit must be non-negative integers'}), 400
+        page = players[offset:] if limit is None else players[offset:offset + limit]
+
         return jsonify({
-            'players': players,
-            'total': len(players)
+            'players': page,
+            'total': len(players),
+            'offset': offset,
+            'limit': limit
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    """Top matches for a partial player name (?q=leb&limit=10&fuzzy=1), each with its seasons"""
+    if not nba_sim:
+        return jsonify({'error': 'nba sim not initialized'}), 500
+
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    fuzzy = request.args.get('fuzzy', '0').lower() in ('1', 'true', 'yes')
+    if limit <= 0 or limit > AUTOCOMPLETE_MAX_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {AUTOCOMPLETE_MAX_RESULTS}'}), 400
+
+    matches = nba_sim.autocomplete(query, limit, fuzzy)
+    return jsonify({'query': query, 'matches': matches, 'total': len(matches)})
+
 @app.route('/api/player/<player_name>', methods=['GET'])
 def get_player_seasons(player_name):
     """Get available seasons for a specific player"""
@@ -147,15 +713,13 @@ def get_player_seasons(player_name):
         return jsonify({'error': 'nba sim not initialized'}), 500
     
     try:
-        player_data = nba_sim.player_info[
-            nba_sim.player_info['PLAYER_NAME'] == player_name
-        ]
-        
-        if player_data.empty:
+        rows = nba_sim.name_rows.get(player_name)
+
+        if rows is None:
             return jsonify({'error': 'Player not found'}), 404
-        
-        seasons = sorted(player_data['SEASON'].unique().tolist())
-        
+
+        seasons = sorted(set(nba_sim.seasons[rows].tolist()))
+
         return jsonify({
             'player': player_name,
             'seasons': seasons,
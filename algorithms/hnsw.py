@@ -0,0 +1,500 @@
+import threading
+
+import numpy as np
+
+from kdTree import KDTree
+
+
+class HNSWIndex:
+    # hierarchical navigable small world graph (Malkov & Yashunin 2018) with array backed adjacency lists
+    # layer 0 holds every node with up to 2*M links, layer l > 0 holds the nodes whose random level is >= l
+    # with up to M links, a query walks greedily down the sparse layers and runs a best-first search on layer 0
+    # nodes are never renumbered: deleted/updated rows are tombstoned and updates are inserted as new nodes
+    EXACT_WIRING_MAX_POINTS = 32768  # above this, build candidates only come from nearby points (see _wire)
+    ENTRY_SCAN_MAX_NODES = 4096  # upper layers up to this size are scanned in one step instead of walked
+
+    def __init__(self, dimensions, M=16, ef_construction=64, ef_search=20, seed=0):
+        self.dimensions = dimensions
+        self.M = M  # links per node on the upper layers (2*M on layer 0)
+        self.ef_construction = ef_construction  # candidate list size while linking new nodes
+        self.ef_search = ef_search  # candidate list size per query (higher = better recall, slower)
+        self.level_mult = 1 / np.log(M)
+        self.rng = np.random.default_rng(seed)
+
+        self.size = 0  # nodes in use (arrays below have spare capacity for inserts)
+        self.points = np.empty((0, dimensions), dtype=np.float32)  # by node, float32 like the column store
+        self.player_ids = np.empty(0)
+        self.rows = np.empty(0, dtype=np.intp)  # node -> original row (masks are over rows)
+        self.alive = np.empty(0, dtype=bool)  # False = deleted, or replaced by a newer node for the same row
+        self.levels = np.empty(0, dtype=np.int8)
+
+        self.links = np.empty((0, 2 * M), dtype=np.int32)  # layer 0 adjacency, -1 = empty slot
+        self.upper_slots = []  # layer l (index l - 1) -> {node: row in upper_links}
+        self.upper_links = []  # layer l (index l - 1) -> (nodes on layer, M) adjacency, -1 = empty slot
+        self.entry = -1
+        self.max_level = -1
+        self.entry_scan = None  # (level, its nodes) scanned by _descend, None = recompute
+
+        self.local = threading.local()  # per thread visited stamps, queries can run concurrently
+
+    def _random_levels(self, n):
+        return np.minimum(np.floor(-np.log(1 - self.rng.random(n)) * self.level_mult), 127).astype(np.int8)
+
+    # bulk build: the graph is wired from nearest neighbour lists (blocked matrix products, exact up to
+    # EXACT_WIRING_MAX_POINTS) instead of n sequential insertions, pruned with the heuristic insertion uses
+    def build_index(self, points, player_ids):
+        n = len(points)
+        self.size = n
+        self.points = np.array(points, dtype=np.float32)  # own copy, float32 halves the memory of a float64 one
+        self.player_ids = np.asarray(player_ids).copy()
+        self.rows = np.arange(n)
+        self.alive = np.ones(n, dtype=bool)
+        self.levels = self._random_levels(n)
+
+        self.links = self._wire(np.arange(n), 2 * self.M)  # M picked per node + reverse links, up to 2*M
+        self.upper_slots, self.upper_links = [], []
+        self.max_level = int(self.levels.max()) if n else -1
+        for level in range(1, self.max_level + 1):
+            nodes = np.flatnonzero(self.levels >= level)
+            self.upper_slots.append({node: slot for slot, node in enumerate(nodes.tolist())})
+            self.upper_links.append(self._wire(nodes, self.M))
+        self.entry = int(np.flatnonzero(self.levels == self.max_level)[0]) if n else -1
+        self.entry_scan = None
+
+    def _wire(self, nodes, max_degree, block_size=2048):  # (len(nodes), max_degree) adjacency in node numbers
+        count = len(nodes)
+        links = np.full((count, max_degree), -1, dtype=np.int32)
+        if count < 2:
+            return links
+        points = self.points[nodes]
+        candidates = min(self.ef_construction, count - 1)
+
+        # comparing every pair is quadratic, so big layers are put in kd tree order and every block of points is
+        # only compared with the points up to `window` positions away (spatially close by construction)
+        # neighbours that straddle a kd split get missed that way, a second pass in the order of a randomly
+        # rotated copy splits elsewhere and the two candidate lists are merged
+        if count <= self.EXACT_WIRING_MAX_POINTS:
+            near, near_d = self._nearest(points, np.arange(count), count, candidates, block_size)
+        else:
+            passes = []
+            for rotation in (np.eye(points.shape[1]), np.linalg.qr(self.rng.normal(size=(points.shape[1],) * 2))[0]):
+                tree = KDTree(points.shape[1], leaf_size=block_size // 4)
+                tree.build(points @ rotation.astype(np.float32), np.arange(count))
+                passes.append(self._nearest(points, tree.order, 4 * block_size, candidates, block_size))
+            near = np.concatenate([ids for ids, _ in passes], axis=1)
+            near_d = np.concatenate([dists for _, dists in passes], axis=1)
+            by_id = np.argsort(near, axis=1, kind='stable')
+            near, near_d = np.take_along_axis(near, by_id, axis=1), np.take_along_axis(near_d, by_id, axis=1)
+            near_d[:, 1:][near[:, 1:] == near[:, :-1]] = np.inf  # found by both passes
+            order = np.argsort(near_d, axis=1, kind='stable')[:, :candidates]
+            near, near_d = np.take_along_axis(near, order, axis=1), np.take_along_axis(near_d, order, axis=1)
+
+        # the nearest points all sit in the node's own cluster once clusters are bigger than ef_construction, so the
+        # nearest few of the sparser layers' nodes are candidates too: inserting one node at a time gets its long
+        # links the same way (early nodes only see a sparse graph)
+        level = int(self.levels[nodes].min())
+        for upper in range(level + 1, int(self.levels[nodes].max()) + 1):
+            hubs = np.flatnonzero(self.levels[nodes] >= upper)
+            if count > self.EXACT_WIRING_MAX_POINTS and len(hubs) > self.ENTRY_SCAN_MAX_NODES:
+                continue  # too many pairs, the next layer up is small enough
+            hub_near, hub_d = self._nearest_hubs(points, hubs, min(self.M, len(hubs)), block_size)
+            near, near_d = np.hstack((near, hub_near)), np.hstack((near_d, hub_d))
+        if near.shape[1] > candidates:  # drop hubs that already were candidates, nearest first again
+            by_id = np.argsort(near, axis=1, kind='stable')
+            near, near_d = np.take_along_axis(near, by_id, axis=1), np.take_along_axis(near_d, by_id, axis=1)
+            near_d[:, 1:][near[:, 1:] == near[:, :-1]] = np.inf
+            order = np.argsort(near_d, axis=1, kind='stable')
+            near, near_d = np.take_along_axis(near, order, axis=1), np.take_along_axis(near_d, order, axis=1)
+
+        # diversity heuristic, all nodes at once: walk the candidates nearest first and keep one only if it is
+        # closer to the node than to every neighbour kept so far (keeps links pointing in different directions)
+        keep_degree = self.M
+        kept = np.full((count, keep_degree), -1, dtype=np.intp)
+        kept_count = np.zeros(count, dtype=np.intp)
+        everyone = np.arange(count)
+        for j in range(near.shape[1]):
+            open_rows = everyone[(kept_count < keep_degree) & np.isfinite(near_d[:, j])]
+            if not len(open_rows):
+                break
+            cand = near[open_rows, j]
+            kept_so_far = kept[open_rows, :kept_count[open_rows].max()]  # low dims rarely fill every slot
+            diff = points[kept_so_far] - points[cand][:, None, :]
+            to_kept = np.einsum('mkd,mkd->mk', diff, diff)
+            to_kept[kept_so_far < 0] = np.inf
+            ok = (to_kept > near_d[open_rows, j][:, None]).all(axis=1)
+            rows = open_rows[ok]
+            kept[rows, kept_count[rows]] = near[rows, j]
+            kept_count[rows] += 1
+
+        # links = kept ones plus reverse links (someone kept me), nearest max_degree of the union
+        src, slot = np.nonzero(kept >= 0)
+        dst = kept[src, slot]
+        src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+        pairs = np.unique(src * count + dst)
+        src, dst = pairs // count, pairs % count
+        diff = points[src] - points[dst]
+        dists = np.einsum('ij,ij->i', diff, diff)
+        order = np.lexsort((dists, src))
+        src, dst = src[order], dst[order]
+        rank = np.arange(len(src)) - np.searchsorted(src, src)  # position within each node's list
+        fits = rank < max_degree
+        links[src[fits], rank[fits]] = dst[fits]
+        self._connect(points, links)
+        return np.where(links >= 0, nodes[links], -1).astype(np.int32)
+
+    # nearest neighbour lists only link points of the same cluster once clusters are bigger than ef_construction,
+    # which leaves whole clusters unreachable from the entry point (inserting one node at a time doesn't: early
+    # nodes link across clusters). every component but the biggest is bridged to the nearest point outside it,
+    # looked up from `samples` of its points with a kd tree, until the layer is one component
+    # links -> (count, max_degree) adjacency in positions within points, nearest first, changed in place
+    def _connect(self, points, links, samples=16):
+        while True:
+            labels = self._components(links)
+            roots, sizes = np.unique(labels, return_counts=True)
+            if len(roots) == 1:
+                return
+            tree = KDTree(points.shape[1])
+            tree.build(points, np.arange(len(points)))
+            for root in roots[roots != roots[np.argmax(sizes)]].tolist():
+                members = np.flatnonzero(labels == root)
+                outside = labels != root
+                bridges = [(distance, member, int(other)) for member in
+                           members[np.linspace(0, len(members) - 1, min(samples, len(members))).astype(np.intp)]
+                           for distance, other, _ in tree.find_nearest_neighbors(points[member], 1, mask=outside)]
+                _, member, other = min(bridges)
+                for node, neighbour in ((member, other), (other, member)):
+                    free = np.flatnonzero(links[node] < 0)
+                    links[node, free[0] if len(free) else -1] = neighbour  # full -> replaces the furthest link
+
+    @staticmethod
+    def _components(links):  # component label per node (its smallest position), links count both ways
+        src = np.repeat(np.arange(len(links)), links.shape[1])
+        dst = links.ravel()
+        src, dst = src[dst >= 0], dst[dst >= 0]
+        labels = np.arange(len(links))
+        while True:
+            a, b = labels[src], labels[dst]
+            hook = a != b
+            if not hook.any():
+                return labels
+            np.minimum.at(labels, np.maximum(a[hook], b[hook]), np.minimum(a[hook], b[hook]))  # roots only
+            while True:  # pointer jumping -> every label is a root again
+                jumped = labels[labels]
+                if (jumped == labels).all():
+                    break
+                labels = jumped
+
+    @staticmethod
+    def _nearest(points, spatial, window, candidates, block_size):
+        # nearest `candidates` of every point among the ones within `window` positions in `spatial` order
+        # (nearest first, positions within points), one blocked matrix product per block of points
+        count = len(points)
+        ordered = points[spatial]
+        norms = np.einsum('ij,ij->i', ordered, ordered)
+        near = np.empty((count, candidates), dtype=np.intp)
+        near_d = np.empty((count, candidates))
+        for lo in range(0, count, block_size):
+            hi = min(lo + block_size, count)
+            first, last = max(lo - window, 0), min(hi + window, count)
+            dists = ordered[lo:hi] @ ordered[first:last].T
+            dists *= -2
+            dists += norms[None, first:last]
+            dists += norms[lo:hi, None]
+            dists[np.arange(hi - lo), np.arange(lo, hi) - first] = np.inf  # not its own neighbour
+            top = np.argpartition(dists, candidates - 1, axis=1)[:, :candidates]
+            top_d = np.take_along_axis(dists, top, axis=1)
+            order = np.argsort(top_d, axis=1)
+            near[spatial[lo:hi]] = spatial[first + np.take_along_axis(top, order, axis=1)]
+            near_d[spatial[lo:hi]] = np.take_along_axis(top_d, order, axis=1)
+        return near, near_d
+
+    @staticmethod
+    def _nearest_hubs(points, hubs, candidates, block_size):
+        # nearest `candidates` of every point among points[hubs] (a point isn't its own candidate), nearest first
+        hub_points = points[hubs]
+        hub_norms = np.einsum('ij,ij->i', hub_points, hub_points)
+        near = np.empty((len(points), candidates), dtype=np.intp)
+        near_d = np.empty((len(points), candidates))
+        for lo in range(0, len(points), block_size):
+            hi = min(lo + block_size, len(points))
+            block = points[lo:hi]
+            dists = hub_norms[None, :] - 2 * (block @ hub_points.T) + np.einsum('ij,ij->i', block, block)[:, None]
+            dists[np.arange(lo, hi)[:, None] == hubs[None, :]] = np.inf
+            top = np.argpartition(dists, candidates - 1, axis=1)[:, :candidates]
+            top_d = np.take_along_axis(dists, top, axis=1)
+            order = np.argsort(top_d, axis=1)
+            near[lo:hi] = hubs[np.take_along_axis(top, order, axis=1)]
+            near_d[lo:hi] = np.take_along_axis(top_d, order, axis=1)
+        return near, near_d
+
+    def _neighbours(self, node, level):
+        if level == 0:
+            links = self.links[node]
+        else:
+            links = self.upper_links[level - 1][self.upper_slots[level - 1][node]]
+        return links[links >= 0]
+
+    def _stamps(self):  # visited marker per node, reset by bumping the stamp instead of clearing the array
+        local = self.local
+        if getattr(local, 'visited', None) is None or len(local.visited) < len(self.points):
+            local.visited = np.zeros(len(self.points), dtype=np.int32)
+            local.stamp = 0
+        local.stamp += 1
+        if local.stamp == np.iinfo(np.int32).max:
+            local.visited[:] = 0
+            local.stamp = 1
+        return local.visited, local.stamp
+
+    # best-first search of one layer -> [(squared distance, node)] of the ef best allowed nodes (unordered)
+    # allowed -> optional boolean array by node, disallowed nodes are walked through but never returned
+    # the `width` nearest unexpanded candidates are expanded together, so one numpy step (gather links, one
+    # distance computation, prune) covers several nodes instead of a python heap operation per neighbour
+    def _search_layer(self, target, entry_points, ef, level, allowed=None, counters=None, width=8):
+        visited, stamp = self._stamps()
+        pool = np.unique(np.asarray(entry_points, dtype=np.intp))  # candidates/results within the current bound
+        visited[pool] = stamp
+        diff = self.points[pool] - target
+        pool_d = np.einsum('ij,ij->i', diff, diff)
+        pool_open = np.ones(len(pool), dtype=bool)  # not expanded yet
+        expanded = 0
+
+        while True:
+            # bound = distance of the ef-th best allowed node so far, nothing past it can make the results
+            ok = pool_d if allowed is None else pool_d[allowed[pool]]
+            bound = np.partition(ok, ef - 1)[ef - 1] if len(ok) >= ef else np.inf
+            keep = pool_d <= bound
+            if not keep.all():
+                pool, pool_d, pool_open = pool[keep], pool_d[keep], pool_open[keep]
+            frontier = np.flatnonzero(pool_open)
+            if not len(frontier):
+                break
+            if len(frontier) > width:
+                frontier = frontier[np.argpartition(pool_d[frontier], width - 1)[:width]]
+            pool_open[frontier] = False
+            expanded += len(frontier)
+
+            if level == 0:
+                neighbours = self.links[pool[frontier]].ravel()
+            else:
+                slots = self.upper_slots[level - 1]
+                neighbours = self.upper_links[level - 1][[slots[node] for node in pool[frontier].tolist()]].ravel()
+            neighbours = neighbours[neighbours >= 0]
+            neighbours = np.unique(neighbours[visited[neighbours] != stamp])
+            if not len(neighbours):
+                continue
+            visited[neighbours] = stamp
+            diff = self.points[neighbours] - target
+            dists = np.einsum('ij,ij->i', diff, diff)
+            close = dists <= bound
+            pool = np.concatenate((pool, neighbours[close]))
+            pool_d = np.concatenate((pool_d, dists[close]))
+            pool_open = np.concatenate((pool_open, np.ones(int(close.sum()), dtype=bool)))
+
+        if counters is not None:
+            counters['nodes_expanded'] = counters.get('nodes_expanded', 0) + expanded
+        if allowed is not None:
+            ok = allowed[pool]
+            pool, pool_d = pool[ok], pool_d[ok]
+        if len(pool) > ef:
+            top = np.argpartition(pool_d, ef - 1)[:ef]
+            pool, pool_d = pool[top], pool_d[top]
+        return list(zip(pool_d.tolist(), pool.tolist()))
+
+    # greedy walk from the top layer down to to_level, the few top layers are tiny and each step of the walk
+    # costs the same python overhead as a big one, so it starts with one distance scan over the lowest layer
+    # that has at most ENTRY_SCAN_MAX_NODES nodes (its nearest node is where the walk would have got to)
+    def _descend(self, target, to_level, counters=None):
+        if self.entry_scan is None:
+            level = next((level for level in range(1, self.max_level + 1)
+                          if len(self.upper_slots[level - 1]) <= self.ENTRY_SCAN_MAX_NODES), 0)
+            nodes = np.fromiter(self.upper_slots[level - 1], dtype=np.intp) if level else np.array([self.entry])
+            self.entry_scan = (level, nodes)
+        level, nodes = self.entry_scan
+        if level > to_level:
+            diff = self.points[nodes] - target
+            entry, start = int(nodes[np.argmin(np.einsum('ij,ij->i', diff, diff))]), level - 1
+        else:
+            entry, start = self.entry, self.max_level
+        for level in range(start, to_level, -1):
+            entry = min(self._search_layer(target, [entry], 1, level, counters=counters))[1]
+        return entry
+
+    # insertion-time neighbour selection (heuristic from the paper, same rule as the bulk build)
+    def _select(self, target_d, nodes, max_degree):
+        order = np.argsort(target_d)
+        kept = []
+        for i in order.tolist():
+            if kept:
+                diff = self.points[kept] - self.points[nodes[i]]
+                if (np.einsum('ij,ij->i', diff, diff) <= target_d[i]).any():
+                    continue
+            kept.append(nodes[i])
+            if len(kept) == max_degree:
+                break
+        return kept
+
+    def _link(self, node, neighbour, level):  # add node to neighbour's list, drop its furthest link if full
+        if level == 0:
+            links = self.links[neighbour]
+        else:
+            links = self.upper_links[level - 1][self.upper_slots[level - 1][neighbour]]
+        free = np.flatnonzero(links < 0)
+        if len(free):
+            links[free[0]] = node
+            return
+        current = np.append(links, node)
+        diff = self.points[current] - self.points[neighbour]
+        dists = np.einsum('ij,ij->i', diff, diff)
+        links[:] = current[np.argsort(dists, kind='stable')[:len(links)]]
+
+    def _grow(self, extra):
+        capacity = len(self.points)
+        if self.size + extra <= capacity:
+            if not self.links.flags.writeable:  # memory mapped snapshot -> private copy on first change
+                self._copy_arrays()
+            return
+        capacity = max(self.size + extra, 2 * capacity, 16)
+
+        def grown(array, fill):
+            out = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            out[:self.size] = array[:self.size]
+            return out
+        self.points = grown(self.points, 0)
+        self.player_ids = grown(self.player_ids, 0)
+        self.rows = grown(self.rows, -1)
+        self.alive = grown(self.alive, False)
+        self.levels = grown(self.levels, 0)
+        self.links = grown(self.links, -1)
+        self.upper_links = [links.copy() for links in self.upper_links]
+
+    def _copy_arrays(self):
+        self.points, self.player_ids, self.rows = self.points.copy(), self.player_ids.copy(), self.rows.copy()
+        self.alive, self.levels, self.links = self.alive.copy(), self.levels.copy(), self.links.copy()
+        self.upper_links = [links.copy() for links in self.upper_links]
+
+    # add points one at a time the classic hnsw way, rows -> their row numbers (default: after every existing row)
+    # inserting a row that is already in the index replaces it (the old node is tombstoned)
+    def insert(self, points, player_ids, rows=None):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if rows is None:
+            start = int(self.rows[:self.size].max()) + 1 if self.size else 0
+            rows = np.arange(start, start + len(points))
+        rows = np.asarray(rows, dtype=np.intp)
+        player_ids = np.broadcast_to(np.asarray(player_ids), (len(points),))
+        self.delete(rows)
+        self._grow(len(points))
+
+        for point, player_id, row, level in zip(points, player_ids, rows.tolist(), self._random_levels(len(points))):
+            node = self.size
+            self.size += 1
+            self.points[node], self.player_ids[node], self.rows[node] = point, player_id, row
+            self.alive[node], self.levels[node] = True, level
+            # entry point first, the node isn't on any layer yet so the walk can't end on it (it has no links)
+            entry = self._descend(point, level) if self.max_level > level else self.entry
+            for upper in range(1, level + 1):  # new slot (and maybe a new layer) for every layer it is on
+                if upper > len(self.upper_links):
+                    self.upper_slots.append({})
+                    self.upper_links.append(np.empty((0, self.M), dtype=np.int32))
+                self.upper_slots[upper - 1][node] = len(self.upper_links[upper - 1])
+                self.upper_links[upper - 1] = np.vstack((self.upper_links[upper - 1],
+                                                         np.full((1, self.M), -1, dtype=np.int32)))
+            if level:
+                self.entry_scan = None
+            if entry < 0:
+                self.entry, self.max_level = node, int(level)
+                continue
+
+            entry_points = [entry]
+            for layer in range(min(level, self.max_level), -1, -1):
+                found = self._search_layer(point, entry_points, self.ef_construction, layer)
+                nodes = np.array([n for _, n in found], dtype=np.intp)
+                kept = self._select(np.array([d for d, _ in found]), nodes, self.M)
+                links = self.links[node] if layer == 0 else \
+                    self.upper_links[layer - 1][self.upper_slots[layer - 1][node]]
+                links[:len(kept)] = kept
+                for neighbour in kept:
+                    self._link(node, neighbour, layer)
+                entry_points = nodes
+            if level > self.max_level:
+                self.entry, self.max_level = node, int(level)
+
+    def delete(self, rows):  # tombstones, deleted nodes still route searches but are never returned
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.intp))
+        if not len(rows) or not self.size:
+            return
+        if not self.alive.flags.writeable:
+            self._copy_arrays()
+        self.alive[:self.size][np.isin(self.rows[:self.size], rows)] = False
+
+    def degraded(self, max_fraction=0.2):  # too many tombstones -> routing gets worse, rebuild
+        return self.size - int(self.alive[:self.size].sum()) > max_fraction * max(self.size, 1)
+
+    # ef overrides ef_search for this query, stats (dict) gets nodes expanded and distances computed
+    # mask -> optional boolean array over the indexed rows, False rows are never returned
+    def query(self, target, k=5, ef=None, stats=None, mask=None):
+        if self.entry < 0 or k <= 0:
+            return []
+        target = np.asarray(target, dtype=float)
+        ef = max(ef or self.ef_search, k)
+        allowed = self.alive[:self.size]
+        if mask is not None:
+            allowed = allowed & mask[self.rows[:self.size]]
+        allowed_count = int(allowed.sum()) if mask is not None or not self.alive[:self.size].all() else self.size
+
+        counters = {}
+        if allowed_count <= 4 * ef:  # very selective filter -> the graph walk would mostly see filtered nodes
+            nodes = np.flatnonzero(allowed)
+            diff = self.points[nodes] - target
+            found = list(zip(np.einsum('ij,ij->i', diff, diff).tolist(), nodes.tolist()))
+            counters['nodes_expanded'] = 0
+        else:
+            entry = self._descend(target, 0, counters)
+            found = self._search_layer(target, [entry], ef, 0, allowed if allowed_count < self.size else None,
+                                       counters)
+        found.sort()
+        if stats is not None:
+            stats.update(counters, candidates=len(found))
+
+        return [(float(np.sqrt(d)), self.player_ids[node], self.points[node]) for d, node in found[:k]]
+
+    # approximate range queries: the graph search is repeated with a doubling candidate list until its furthest
+    # result is past radius (or it ran out of allowed nodes), then cut at radius (inclusive)
+    def range_search(self, target, radius, ef=None, stats=None, mask=None):
+        ef = max(ef or self.ef_search, 16)
+        while True:
+            found = self.query(target, ef, ef=ef, stats=stats, mask=mask)
+            if len(found) < ef or found[-1][0] > radius:
+                return [result for result in found if result[0] <= radius]
+            ef *= 2
+
+    def range_count(self, target, radius, ef=None, stats=None, mask=None):
+        return len(self.range_search(target, radius, ef, stats, mask))
+
+    # arrays that fully describe the index (used to save/load index snapshots), upper layers are concatenated
+    def get_state(self):
+        n = self.size
+        upper_nodes = [np.array(list(slots), dtype=np.intp) for slots in self.upper_slots]
+        return {
+            'points': self.points[:n], 'player_ids': self.player_ids[:n], 'rows': self.rows[:n],
+            'alive': self.alive[:n], 'levels': self.levels[:n], 'links': self.links[:n],
+            'upper_nodes': np.concatenate(upper_nodes) if upper_nodes else np.empty(0, dtype=np.intp),
+            'upper_links': np.concatenate(self.upper_links) if self.upper_links else
+            np.empty((0, self.M), dtype=np.int32),
+            'upper_splits': np.cumsum([len(nodes) for nodes in upper_nodes])[:-1],
+            'params': np.array([self.M, self.ef_construction, self.ef_search, self.entry])
+        }
+
+    @classmethod
+    def from_state(cls, state, ef_search=None):  # no graph work, arrays are used as given
+        M, ef_construction, saved_ef_search, entry = state['params'].tolist()
+        index = cls(state['points'].shape[1], M, ef_construction, ef_search or saved_ef_search)
+        for name in ('points', 'player_ids', 'rows', 'alive', 'levels', 'links'):
+            setattr(index, name, state[name])
+        index.size = len(index.points)
+        index.entry = entry
+        upper_nodes = np.split(state['upper_nodes'], state['upper_splits']) if len(state['upper_nodes']) else []
+        upper_links = np.split(state['upper_links'], state['upper_splits']) if len(state['upper_nodes']) else []
+        index.upper_slots = [{node: slot for slot, node in enumerate(nodes.tolist())} for nodes in upper_nodes]
+        index.upper_links = upper_links
+        index.max_level = len(upper_nodes)
+        return index
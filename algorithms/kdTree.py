@@ -1,73 +1,339 @@
 import numpy as np
-import heapq
-
-
-class KDNode:
-    def __init__(self, point, player_id, left=None, right=None):
-        self.point = point  # point in k-dimensional space
-        self.player_id = player_id  # id from csv file
-        self.left = left  # left node in kd tree
-        self.right = right  # right node in kd tree
 
 
 class KDTree:
-    def __init__(self, dimensions):
-        self.root = None
+    # flat kd tree -> nodes live in parallel numpy arrays instead of one python object per player
+    # points are reordered so every node covers a contiguous slice [start, end) of self.data
+    def __init__(self, dimensions, leaf_size=16):
         self.dimensions = dimensions
+        self.leaf_size = leaf_size  # max points per leaf bucket (scanned all at once)
         self.size = 0
 
+        self.data = np.empty((0, dimensions), dtype=np.float32)  # points in tree order (distances in float64)
+        self.order = np.empty(0, dtype=np.intp)  # tree position -> original row
+        self.player_ids = np.empty(0)  # ids in tree order
+
+        # node arrays (node 0 is the root)
+        self.split_dim = np.empty(0, dtype=np.int32)
+        self.split_value = np.empty(0)
+        self.left = np.empty(0, dtype=np.int32)  # -1 = leaf
+        self.right = np.empty(0, dtype=np.int32)
+        self.start = np.empty(0, dtype=np.intp)
+        self.end = np.empty(0, dtype=np.intp)
+
+        # live updates without re-partitioning: deleted tree points are tombstoned, inserted points go to a
+        # small buffer that every query scans in one vectorized step (rebuild once degraded() says so)
+        self.alive = np.empty(0, dtype=bool)  # tree order, False = deleted
+        self.extra_data = np.empty((0, dimensions), dtype=np.float32)
+        self.extra_ids = np.empty(0)
+        self.extra_rows = np.empty(0, dtype=np.intp)  # original row of each inserted point (for masks)
+        self.row_positions = None  # original row -> tree position, built on the first delete
+        self.box_lo = self.box_hi = None  # per node bounding boxes for range queries, built on first use
+
     def build(self, points, player_ids):
-        def build_loop(points, depth=0):  # kd tree recursively builds
-            if not points:
-                return None
+        points = np.asarray(points, dtype=float)
+        n = len(points)
+        self.size = n
+        order = np.arange(n)
+
+        max_nodes = max(2 * n, 1)  # upper bound for a binary tree with non-empty leaves, trimmed after
+        split_dim = np.zeros(max_nodes, dtype=np.int32)
+        split_value = np.zeros(max_nodes)
+        left = np.full(max_nodes, -1, dtype=np.int32)
+        right = np.full(max_nodes, -1, dtype=np.int32)
+        start = np.zeros(max_nodes, dtype=np.intp)
+        end = np.zeros(max_nodes, dtype=np.intp)
+
+        node_count = 1 if n else 0
+        end[0] = n
+        stack = [0] if n > self.leaf_size else []
+        while stack:  # iterative build -> no recursion limit on big files
+            node = stack.pop()
+            lo, hi = start[node], end[node]
+            segment = points[order[lo:hi]]
+
+            # split on the widest dimension (better boxes than cycling axes by depth)
+            axis = int(np.argmax(segment.max(axis=0) - segment.min(axis=0)))
+            mid = (hi - lo) // 2
+            # argpartition puts the median in place in O(n) instead of fully sorting every level
+            part = np.argpartition(segment[:, axis], mid)
+            order[lo:hi] = order[lo:hi][part]
+
+            split_dim[node] = axis
+            split_value[node] = points[order[lo + mid], axis]
+
+            for child, (c_lo, c_hi) in enumerate(((lo, lo + mid), (lo + mid, hi))):
+                child_id = node_count
+                node_count += 1
+                start[child_id], end[child_id] = c_lo, c_hi
+                if child == 0:
+                    left[node] = child_id
+                else:
+                    right[node] = child_id
+                if c_hi - c_lo > self.leaf_size:
+                    stack.append(child_id)
+
+        self.split_dim = split_dim[:node_count]
+        self.split_value = split_value[:node_count]
+        self.left = left[:node_count]
+        self.right = right[:node_count]
+        self.start = start[:node_count]
+        self.end = end[:node_count]
+
+        self.order = order
+        self.data = np.ascontiguousarray(points[order], dtype=np.float32)  # scaled stats are float32 to begin with
+        self.player_ids = np.asarray(player_ids)[order]
+        self.alive = np.ones(n, dtype=bool)
+        self.extra_data = np.empty((0, self.dimensions), dtype=np.float32)
+        self.extra_ids = np.empty(0, dtype=self.player_ids.dtype)
+        self.extra_rows = np.empty(0, dtype=np.intp)
+        self.row_positions = None
+        self.box_lo = self.box_hi = None
+
+    # add points without rebuilding, rows -> their original row numbers (default: after every existing row)
+    def insert(self, points, player_ids, rows=None):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if rows is None:
+            start = max(len(self.order), int(self.extra_rows.max()) + 1 if len(self.extra_rows) else 0)
+            rows = np.arange(start, start + len(points))
+        self.extra_data = np.concatenate((self.extra_data, points.astype(np.float32)))
+        self.extra_ids = np.concatenate((self.extra_ids, np.asarray(player_ids)))
+        self.extra_rows = np.concatenate((self.extra_rows, np.asarray(rows, dtype=np.intp)))
+        self.size += len(points)
 
-            axis = depth % self.dimensions  # cycles through dimensions to determine axis of rotation (discriminator)
+    # remove points by original row (an update is delete + insert with the same row)
+    def delete(self, rows):
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.intp))
+        in_extra = np.isin(self.extra_rows, rows)
+        if in_extra.any():
+            self.extra_data = self.extra_data[~in_extra]
+            self.extra_ids = self.extra_ids[~in_extra]
+            self.extra_rows = self.extra_rows[~in_extra]
+            self.size -= int(in_extra.sum())
 
-            points_sorted = sorted(points, key=lambda x: x[0][axis])
-            median = len(points_sorted) // 2  # data is split along median for each dimension
+        base_rows = rows[rows < len(self.order)]
+        if len(base_rows):
+            if self.row_positions is None:
+                self.row_positions = np.empty(len(self.order), dtype=np.intp)
+                self.row_positions[self.order] = np.arange(len(self.order))
+            if not self.alive.flags.writeable:  # memory mapped snapshot -> private copy on first change
+                self.alive = self.alive.copy()
+            positions = self.row_positions[base_rows]
+            self.size -= int(self.alive[positions].sum())
+            self.alive[positions] = False
 
-            node = KDNode(  # initialize node in tree for each player
-                point=points_sorted[median][0],
-                player_id=points_sorted[median][1],
-                left=build_loop(points_sorted[:median], depth + 1),
-                right=build_loop(points_sorted[median + 1:], depth + 1)
-            )
-            return node
+    # share of points living outside the balanced tree (buffered inserts + tombstones)
+    def degraded(self, max_fraction=0.2):
+        stale = len(self.extra_rows) + len(self.alive) - int(self.alive.sum())
+        return stale > max_fraction * max(len(self.order), 1)
 
-        self.root = build_loop(list(zip(points, player_ids)))  # call recursive function again
-        self.size = len(points)
+    # arrays that fully describe the built tree (used to save/load index snapshots)
+    def get_state(self):
+        return {
+            'data': self.data, 'order': self.order, 'player_ids': self.player_ids,
+            'split_dim': self.split_dim, 'split_value': self.split_value,
+            'left': self.left, 'right': self.right, 'start': self.start, 'end': self.end,
+            'alive': self.alive, 'extra_data': self.extra_data, 'extra_ids': self.extra_ids, 'extra_rows': self.extra_rows
+        }
 
-    def find_nearest_neighbors(self, target, k=5):
-        if not self.root:
+    @classmethod
+    def from_state(cls, dimensions, state, leaf_size=16):  # no partitioning work, arrays are used as given
+        tree = cls(dimensions, leaf_size)
+        for name, array in state.items():
+            setattr(tree, name, array)
+        if 'alive' not in state:
+            tree.alive = np.ones(len(tree.data), dtype=bool)
+        tree.size = int(tree.alive.sum()) + len(tree.extra_rows)
+        return tree
+
+    # mask -> optional boolean array over the original rows (build order), False rows are never returned
+    # it is checked inside the leaf scans so exactly k allowed neighbours come back from one traversal
+    # stats (dict) gets nodes visited, subtrees pruned, leaves and points scanned
+    def find_nearest_neighbors(self, target, k=5, mask=None, stats=None):
+        if not self.size or k <= 0:
             return []
 
-        neighbors = []
+        target = np.asarray(target, dtype=float)
+        k = min(k, self.size)
+        best_d = np.empty(0)  # squared distances of current k best
+        best_pos = np.empty(0, dtype=np.intp)  # their positions in self.data (inserted points after the tree)
+        worst = np.inf  # squared distance to beat once we have k results
+        has_deletes = not self.alive.all()
+        visited = pruned = leaves = 0  # plain int adds, cheap enough to count on every query
+        scanned = len(self.extra_rows)  # buffered inserts are compared directly
+
+        if len(self.extra_rows):  # buffered inserts first, they also tighten the pruning bound
+            diff = self.extra_data - target
+            dists = np.einsum('ij,ij->i', diff, diff)
+            keep = np.ones(len(dists), dtype=bool) if mask is None else mask[self.extra_rows]
+            best_d = dists[keep]
+            best_pos = len(self.data) + np.flatnonzero(keep)
+            if len(best_d) >= k:
+                top = np.argpartition(best_d, k - 1)[:k]
+                best_d, best_pos = best_d[top], best_pos[top]
+                worst = best_d.max()
 
-        def search(node, depth=0):
-            if not node:
-                return
+        # stack of (node, squared lower bound on distance to anything in that node)
+        stack = [(0, 0.0)] if len(self.left) else []
+        while stack:
+            node, bound = stack.pop()
+            if bound >= worst:  # everything in here is further than the current kth -> prune
+                pruned += 1
+                continue
+            visited += 1
 
-            axis = depth % self.dimensions  # cycle through dimensions
-            distance = np.linalg.norm(np.array(target) - np.array(node.point))  # euclidean distance
+            if self.left[node] == -1:  # leaf bucket -> one vectorized distance computation
+                lo, hi = self.start[node], self.end[node]
+                leaves += 1
+                scanned += hi - lo
+                diff = self.data[lo:hi] - target
+                dists = np.einsum('ij,ij->i', diff, diff)  # squared euclidean
+                keep = dists < worst
+                if mask is not None:
+                    keep &= mask[self.order[lo:hi]]
+                if has_deletes:
+                    keep &= self.alive[lo:hi]
+                if not keep.any():
+                    continue
+                best_d = np.concatenate((best_d, dists[keep]))
+                best_pos = np.concatenate((best_pos, np.arange(lo, hi)[keep]))
+                if len(best_d) >= k:
+                    top = np.argpartition(best_d, k - 1)[:k]
+                    best_d, best_pos = best_d[top], best_pos[top]
+                    worst = best_d.max()
+                continue
 
-            # priority queue to handle results -> pop lowest distance first (basically min heap)
-            if len(neighbors) < k:
-                heapq.heappush(neighbors, (-distance, node.player_id, node.point))
-            elif distance < -neighbors[0][0]:
-                heapq.heappop(neighbors)
-                heapq.heappush(neighbors, (-distance, node.player_id, node.point))
+            # go down the side the target is on first, far side only if the splitting plane is close enough
+            gap = target[self.split_dim[node]] - self.split_value[node]
+            if gap < 0:
+                near, far = self.left[node], self.right[node]
+            else:
+                near, far = self.right[node], self.left[node]
+            stack.append((far, max(bound, gap * gap)))  # squared gap vs squared distances
+            stack.append((near, bound))
 
-            # recursively search in new dimensions based on where the target is in current dimension
-            if target[axis] < node.point[axis]:
-                search(node.left, depth + 1)
-                if (node.point[axis] - target[axis]) ** 2 < -neighbors[0][0] if neighbors else float('inf'):
-                    search(node.right, depth + 1)
+        results = []
+        for i in np.argsort(best_d, kind='stable'):
+            pos = best_pos[i]
+            if pos < len(self.data):
+                player_id, point = self.player_ids[pos], self.data[pos]
             else:
-                search(node.right, depth + 1)
-                if (target[axis] - node.point[axis]) ** 2 < -neighbors[0][0] if neighbors else float('inf'):
-                    search(node.left, depth + 1)
+                player_id, point = self.extra_ids[pos - len(self.data)], self.extra_data[pos - len(self.data)]
+            results.append((float(np.sqrt(best_d[i])), player_id, point))
 
-        search(self.root)
+        if stats is not None:
+            stats.update(nodes_visited=visited, subtrees_pruned=pruned, leaves_scanned=leaves,
+                         points_scanned=int(scanned))
 
         # return distance, player id, point in order
-        return sorted([(-distance, player_id, point) for distance, player_id, point in neighbors])
+        return results
+
+    # (lo, hi) corners of the box around every node's points, leaves from one reduceat over the tree order
+    # (leaves cover disjoint slices of self.data), inner nodes level by level from their children
+    # tombstoned points stay inside their boxes, which only makes the boxes a bit loose until the next rebuild
+    def _boxes(self):
+        if self.box_lo is None:
+            nodes = len(self.left)
+            box_lo, box_hi = np.empty((nodes, self.dimensions)), np.empty((nodes, self.dimensions))
+            if nodes:
+                leaves = np.flatnonzero(self.left == -1)
+                leaves = leaves[np.argsort(self.start[leaves])]
+                box_lo[leaves] = np.minimum.reduceat(self.data, self.start[leaves])
+                box_hi[leaves] = np.maximum.reduceat(self.data, self.start[leaves])
+                levels, frontier = [], np.array([0])
+                while len(frontier):
+                    levels.append(frontier)
+                    inner = frontier[self.left[frontier] >= 0]
+                    frontier = np.concatenate((self.left[inner], self.right[inner]))
+                for level in reversed(levels):  # children are done before their parents
+                    inner = level[self.left[level] >= 0]
+                    box_lo[inner] = np.minimum(box_lo[self.left[inner]], box_lo[self.right[inner]])
+                    box_hi[inner] = np.maximum(box_hi[self.left[inner]], box_hi[self.right[inner]])
+            self.box_lo, self.box_hi = box_lo, box_hi
+        return self.box_lo, self.box_hi
+
+    # every allowed point within radius of target (inclusive) -> [(distance, player_id, point)] nearest first
+    # a node whose box is out of reach is skipped, a node whose box is entirely inside is taken whole
+    # mask/stats as in find_nearest_neighbors (stats also gets subtrees_contained)
+    def range_search(self, target, radius, mask=None, stats=None):
+        dists, positions = self._range(target, radius, mask, stats, count_only=False)
+        order = np.argsort(dists, kind='stable')
+        results = []
+        for dist, pos in zip(np.sqrt(dists[order]).tolist(), positions[order].tolist()):
+            if pos < len(self.data):
+                results.append((dist, self.player_ids[pos], self.data[pos]))
+            else:
+                results.append((dist, self.extra_ids[pos - len(self.data)], self.extra_data[pos - len(self.data)]))
+        return results
+
+    # number of allowed points within radius, boxes entirely inside are counted without computing a distance
+    def range_count(self, target, radius, mask=None, stats=None):
+        return self._range(target, radius, mask, stats, count_only=True)
+
+    def _range(self, target, radius, mask, stats, count_only):
+        target = np.asarray(target, dtype=float)
+        limit = float(radius) ** 2
+        box_lo, box_hi = self._boxes()
+        has_deletes = not self.alive.all()
+        count = 0
+        found_d, found_pos = [], []
+        visited = pruned = contained = 0
+        scanned = len(self.extra_rows)
+
+        if len(self.extra_rows):  # buffered inserts are compared directly
+            diff = self.extra_data - target
+            dists = np.einsum('ij,ij->i', diff, diff)
+            keep = dists <= limit
+            if mask is not None:
+                keep &= mask[self.extra_rows]
+            count += int(keep.sum())
+            found_d.append(dists[keep])
+            found_pos.append(len(self.data) + np.flatnonzero(keep))
+
+        stack = [0] if len(self.left) else []
+        while stack:
+            node = stack.pop()
+            near = np.maximum(np.maximum(box_lo[node] - target, target - box_hi[node]), 0)
+            if near @ near > limit:  # closest corner of the box is out of reach
+                pruned += 1
+                continue
+            visited += 1
+            far = np.maximum(np.abs(target - box_lo[node]), np.abs(target - box_hi[node]))
+            inside = far @ far <= limit
+            lo, hi = self.start[node], self.end[node]
+            # partly inside -> split further, unless the node is small enough that one scan beats more box tests
+            if not inside and self.left[node] != -1 and hi - lo > 4 * self.leaf_size:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+                continue
+
+            keep = self.alive[lo:hi] if has_deletes else None
+            if mask is not None:
+                keep = mask[self.order[lo:hi]] if keep is None else keep & mask[self.order[lo:hi]]
+            if inside:
+                contained += 1
+                if count_only:
+                    count += hi - lo if keep is None else int(keep.sum())
+                    continue
+            scanned += hi - lo
+            diff = self.data[lo:hi] - target
+            dists = np.einsum('ij,ij->i', diff, diff)
+            if not inside:
+                keep = dists <= limit if keep is None else keep & (dists <= limit)
+            if keep is None:
+                count += hi - lo
+                found_d.append(dists)
+                found_pos.append(np.arange(lo, hi))
+            else:
+                count += int(keep.sum())
+                found_d.append(dists[keep])
+                found_pos.append(np.arange(lo, hi)[keep])
+
+        if stats is not None:
+            stats.update(nodes_visited=visited, subtrees_pruned=pruned, subtrees_contained=contained,
+                         points_scanned=int(scanned))
+        if count_only:
+            return int(count)
+        if not found_d:
+            return np.empty(0), np.empty(0, dtype=np.intp)
+        return np.concatenate(found_d), np.concatenate(found_pos)
@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class KNNTable:
+    # every row's K nearest neighbours precomputed -> a top-k search around a row that is already in the data
+    # is one slice of two (n, K) arrays instead of a search
+    # same neighbours as find_similar_players without filters: removed rows and the player's own seasons are
+    # left out (codes -> one number per player, row aligned)
+    # built and refreshed with the group's brute force index (exact, one matrix product per block of rows)
+    def __init__(self, index, K=25):
+        self.index = index  # BruteForceSearch over the same rows, always updated before the table
+        self.K = K
+        self.rows = np.empty((0, K), dtype=np.int32)  # neighbour rows nearest first, -1 past the last one
+        self.dists = np.empty((0, K), dtype=np.float32)  # inf past the last one
+        self.codes = np.empty(0, dtype=np.intp)
+
+    def build(self, codes, alive=None):
+        n = len(self.index.points)
+        self.codes = np.asarray(codes, dtype=np.intp)
+        self.rows = np.full((n, self.K), -1, dtype=np.int32)
+        self.dists = np.full((n, self.K), np.inf, dtype=np.float32)
+        allowed = None if alive is None else np.asarray(alive[:n], dtype=bool)
+        self._recompute(np.flatnonzero(self.index.alive if allowed is None else self.index.alive & allowed), allowed)
+
+    @classmethod
+    def from_state(cls, state, index):  # arrays are used as given
+        table = cls(index, state['rows'].shape[1])
+        table.rows, table.dists, table.codes = state['rows'], state['dists'], state['codes']
+        return table
+
+    def get_state(self):
+        return {'rows': self.rows, 'dists': self.dists, 'codes': self.codes}
+
+    def _make_writeable(self):  # memory mapped arrays -> private copy on first change
+        if not all(array.flags.writeable for array in (self.rows, self.dists, self.codes)):
+            self.rows, self.dists, self.codes = np.array(self.rows), np.array(self.dists), np.array(self.codes)
+
+    # (neighbour rows, distances) of one row, nearest first, at most k
+    def neighbours(self, row, k):
+        rows = self.rows[row, :k]
+        found = rows >= 0
+        return rows[found], self.dists[row, :k][found]
+
+    # full top K of some rows against every allowed row, targets go in chunks so the temporary
+    # (chunk, n) distance matrix stays around 4 million entries, allowed -> optional extra row mask
+    def _recompute(self, targets, allowed=None):
+        n = len(self.index.points)
+        chunk = max(1, (1 << 22) // max(n, 1))
+        for start in range(0, len(targets), chunk):
+            rows = targets[start:start + chunk]
+            masks = self.codes[None, :n] != self.codes[rows][:, None]  # the brute index drops removed rows itself
+            if allowed is not None:
+                masks &= allowed
+            found, dists = self.index.query_batch(self.index.points[rows], self.K, masks)
+            self.rows[rows] = -1
+            self.dists[rows] = np.inf
+            self.rows[rows, :found.shape[1]] = found
+            self.dists[rows, :found.shape[1]] = dists
+
+    # rows whose points changed or were added (already in the brute force index), codes -> every row's player
+    # code after the change. only the affected neighbourhoods are redone:
+    # - the changed rows themselves and every row that listed one of them get a full recompute
+    #   (a listed neighbour may have moved away, so the rest of the list can't be trusted)
+    # - every other row can only gain changed rows, they are merged in where closer than its K-th neighbour
+    def update(self, rows, codes):
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        self._make_writeable()
+        n = len(self.index.points)
+        if n > len(self.rows):
+            grow = n - len(self.rows)
+            self.rows = np.concatenate((self.rows, np.full((grow, self.K), -1, dtype=np.int32)))
+            self.dists = np.concatenate((self.dists, np.full((grow, self.K), np.inf, dtype=np.float32)))
+        self.codes = np.asarray(codes, dtype=np.intp)
+        if not len(rows):
+            return
+
+        stale = np.flatnonzero(np.isin(self.rows, rows).any(axis=1))
+        redo = np.union1d(stale, rows[self.index.alive[rows]])
+        others = np.ones(n, dtype=bool)
+        others[redo] = False
+        others[rows] = False
+        others &= self.index.alive
+        self._merge(np.flatnonzero(others), rows[self.index.alive[rows]])
+        self._recompute(redo)
+
+    def _merge(self, targets, candidates):
+        if not len(targets) or not len(candidates):
+            return
+        points = self.index.points[candidates].astype(np.float64)
+        chunk = max(1, (1 << 22) // (len(candidates) * points.shape[1]))
+        for start in range(0, len(targets), chunk):
+            rows = targets[start:start + chunk]
+            diff = self.index.points[rows].astype(np.float64)[:, None, :] - points[None, :, :]
+            dists = np.sqrt(np.einsum('mcd,mcd->mc', diff, diff))
+            dists[self.codes[rows][:, None] == self.codes[candidates][None, :]] = np.inf
+            closer = (dists < self.dists[rows, -1:]).any(axis=1)
+            if not closer.any():
+                continue
+            rows, dists = rows[closer], dists[closer]
+            merged_dists = np.concatenate((self.dists[rows].astype(np.float64), dists), axis=1)
+            merged_rows = np.concatenate((self.rows[rows], np.broadcast_to(candidates, dists.shape)), axis=1)
+            order = np.argsort(merged_dists, axis=1, kind='stable')[:, :self.K]
+            self.dists[rows] = np.take_along_axis(merged_dists, order, axis=1)
+            merged_rows = np.take_along_axis(merged_rows, order, axis=1)
+            self.rows[rows] = np.where(np.isfinite(self.dists[rows]), merged_rows, -1)
+
+    # removed rows (already deleted from the brute force index) leave the table, rows that listed one are redone
+    def delete(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        if not len(rows):
+            return
+        self._make_writeable()
+        self.rows[rows] = -1
+        self.dists[rows] = np.inf
+        stale = np.flatnonzero(np.isin(self.rows, rows).any(axis=1))
+        self._recompute(stale[self.index.alive[stale]])
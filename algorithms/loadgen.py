@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# load generator for a running server (serve.py or flask_app.py): waits for /api/ready, then keeps
+# `concurrency` requests to /api/similar in flight for `duration` seconds and reports throughput and latency
+# with --server-pid it also sums the memory of that process and its workers (linux only)
+def get_json(url, body=None, timeout=30):
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_json(url + '/api/ready')
+        except (urllib.error.URLError, ConnectionError):  # refused, or 503 while loading
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def run_client(url, players, groups, duration, threads, seed):  # one client process -> [(seconds, ok), ...]
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(rng):
+        local = []
+        while time.monotonic() < deadline:
+            body = {'player_name': rng.choice(players), 'feature_group': rng.choice(groups),
+                    'k': rng.randint(3, 10), 'engine': 'auto'}
+            start = time.perf_counter()
+            try:
+                get_json(url + '/api/similar', body)
+                ok = True
+            except (urllib.error.URLError, ConnectionError):
+                ok = False
+            local.append((time.perf_counter() - start, ok))
+        with lock:
+            results.extend(local)
+
+    workers = [threading.Thread(target=loop, args=(random.Random(seed * 1000 + i),)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def process_memory(pid):  # (rss, pss) in bytes of a process and all of its children
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    rss = pss = 0
+    for p in pids:
+        with open(f'/proc/{p}/smaps_rollup') as f:
+            for line in f:
+                name, value = line.split()[:2]
+                if name == 'Rss:':
+                    rss += int(value) * 1024
+                elif name == 'Pss:':
+                    pss += int(value) * 1024
+    return {'processes': len(pids), 'rss_bytes': rss, 'pss_bytes': pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load generator for the similarity api")
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=16, help="requests in flight")
+    parser.add_argument('--processes', type=int, default=1, help="client processes (the client has a gil too)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds")
+    parser.add_argument('--players', type=int, default=500, help="distinct players to query")
+    parser.add_argument('--server-pid', type=int, help="report memory of this server process and its workers")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    ready = wait_ready(args.url, timeout=300)
+    print(f"server ready: {ready}", file=sys.stderr)
+    groups = get_json(args.url + '/api/feature-groups')['feature_groups']
+    players = random.Random(args.seed).sample(get_json(args.url + '/api/players')['players'], args.players)
+
+    per_process = [args.concurrency // args.processes + (i < args.concurrency % args.processes)
+                   for i in range(args.processes)]
+    start = time.perf_counter()
+    if args.processes <= 1:
+        results = run_client(args.url, players, groups, args.duration, args.concurrency, args.seed)
+    else:
+        with ProcessPoolExecutor(args.processes) as pool:
+            futures = [pool.submit(run_client, args.url, players, groups, args.duration, threads, args.seed + i)
+                       for i, threads in enumerate(per_process) if threads]
+            results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([seconds for seconds, ok in results if ok]) * 1000
+    report = {
+        'requests': len(results),
+        'errors': sum(not ok for _, ok in results),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'concurrency': args.concurrency
+    }
+    if args.server_pid:
+        report['memory'] = process_memory(args.server_pid)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from ann import ANNSearch
+
+# settings swept by tune_lsh, hash_size = planes (key bits) per table
+NUM_TABLES = (2, 4, 6, 8, 12, 16, 24)
+HASH_SIZES = (6, 8, 10, 12, 14, 16, 20)
+PROBES = (0, 2, 4, 8)  # extra buckets per table, cheaper than more tables when recall is just short
+
+
+# picks num_tables/hash_size/num_probes for one set of points: every setting hashes with the same seed and
+# answers the same sampled queries, recall@k is checked against exact answers and the cheapest setting (mean query
+# time) reaching target_recall wins, max_ms -> optional latency budget per query on top
+# if nothing qualifies the setting with the best recall comes back with met=False
+# queries -> [(target point, mask or None)], truth -> per query the set of exact neighbour ids
+# more tables only add recall and cost, so each hash size stops adding tables once one setting reaches the target
+def tune_lsh(points, player_ids, queries, truth, k=10, target_recall=0.9, max_ms=None, seed=0,
+             num_tables=NUM_TABLES, hash_sizes=HASH_SIZES, probes=PROBES):
+    trials = []
+    for hash_size in hash_sizes:
+        for tables in num_tables:
+            index = ANNSearch(points.shape[1], tables, hash_size, seed=seed)
+            index.build_index(points, player_ids)
+            met = False
+            for num_probes in probes:
+                trial = dict(measure(index, queries, truth, k, num_probes), num_tables=tables, hash_size=hash_size,
+                             num_probes=num_probes)
+                trials.append(trial)
+                met = met or trial['recall'] >= target_recall
+            if met:
+                break
+
+    qualified = [trial for trial in trials
+                 if trial['recall'] >= target_recall and (max_ms is None or trial['query_ms'] <= max_ms)]
+    if qualified:
+        best = min(qualified, key=lambda trial: trial['query_ms'])
+    else:
+        best = max(trials, key=lambda trial: (trial['recall'], -trial['query_ms']))
+    return dict(best, seed=seed, k=k, target_recall=target_recall, max_ms=max_ms, met=bool(qualified),
+                trials=trials)
+
+
+# recall@k, mean candidates compared and mean query time (best of `repeats` passes, so one slow pass from a
+# cold cache or another process doesn't decide the setting)
+def measure(index, queries, truth, k, num_probes, repeats=2):
+    hits = candidates = 0
+    for (target, mask), expected in zip(queries, truth):
+        stats = {}
+        found = index.query(target, k, probes=num_probes, stats=stats, mask=mask)
+        hits += len({player_id for _, player_id, _ in found} & expected)
+        candidates += stats['candidates']
+
+    seconds = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for target, mask in queries:
+            index.query(target, k, probes=num_probes, mask=mask)
+        seconds = min(seconds, time.perf_counter() - start)
+    return {
+        'recall': hits / max(sum(len(expected) for expected in truth), 1),
+        'candidates': candidates / max(len(queries), 1),
+        'query_ms': seconds * 1000 / max(len(queries), 1)
+    }
@@ -1,12 +1,48 @@
 from playerSimilarity import NBAPlayerSimilarity
+import argparse
+import csv
+import json
+import sys
 import time
 
+LSH_PARAMS = 'lsh_params.json'  # tuned lsh settings, written by --tune-lsh and read on every start
+
 
 def main():
+    parser = argparse.ArgumentParser(description="NBA Player Similarity Finder")
+    parser.add_argument('--batch', metavar='QUERIES', help="run every query in a .jsonl or .csv file (no menu)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="where to write batch results as json lines or --uniqueness csv (default stdout)")
+    parser.add_argument('--workers', type=int, default=1, help="processes to run batch queries on")
+    parser.add_argument('--memory', action='store_true', help="print the memory footprint report and exit")
+    parser.add_argument('--uniqueness', metavar='GROUP',
+                        help="write comparables/uniqueness of every player-season in a feature group as csv")
+    parser.add_argument('--radius', type=float, default=0.1, help="comparables radius for --uniqueness")
+    parser.add_argument('--tune-lsh', action='store_true',
+                        help=f"pick each feature group's lsh tables/hash size and save them to {LSH_PARAMS}")
+    parser.add_argument('--recall', type=float, default=0.9, help="recall@k --tune-lsh has to reach")
+    parser.add_argument('--k', type=int, default=10, help="k for --tune-lsh")
+    parser.add_argument('--max-ms', type=float, help="optional --tune-lsh latency budget per query")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.workers)
+        return
+    if args.uniqueness:
+        run_uniqueness(args.uniqueness, args.radius, args.output)
+        return
+    if args.tune_lsh:
+        run_tune_lsh(args.recall, args.k, args.max_ms)
+        return
+    if args.memory:
+        print(json.dumps(NBAPlayerSimilarity('playerstats.csv').memory_report(), indent=2))
+        return
+
     print("NBA Player Similarity Finder")
     print("============================")
 
-    nba_sim = NBAPlayerSimilarity('playerstats.csv')  # initialize class using dataset
+    nba_sim = NBAPlayerSimilarity('playerstats.csv', snapshot_dir='index_snapshot',
+                                  lsh_params_path=LSH_PARAMS)  # initialize class using dataset
 
     while True:  # menu
         print("\nOptions:")
@@ -86,19 +122,13 @@ def find_similar_players(nba_sim, exact=True):  # larger method to incorporate N
         search_time = time.time() - start_time
 
         # Get target player's stats for reference
-        player_and_season = (nba_sim.player_info['PLAYER_NAME'] == player_name)
-        if season:
-            player_and_season &= (nba_sim.player_info['SEASON_YEAR'] == season)
-        target_info = nba_sim.player_info[player_and_season]
-
-        target_id = target_info['player_id'].values[0]
-        target_raw = nba_sim.feature_data[feature_group]['raw'][target_id]
-        target_norm = nba_sim.feature_data[feature_group]['scaled'][target_id]
+        target_row = nba_sim.find_player_row(player_name, season)
+        target = nba_sim.describe_row(feature_group, target_row, 0.0)
 
         print("\n=== Target Player Stats ===")  # user inputted player displayed first
         print(f"{player_name} ({season if season else 'all seasons'}):")
-        for stat in target_raw:
-            print(f"   - {stat}: {target_raw[stat]:.2f} ({target_norm[list(target_raw.keys()).index(stat)]:.2f})")
+        for stat in target['raw_stats']:
+            print(f"   - {stat}: {target['raw_stats'][stat]:.2f} ({target['norm_stats'][stat]:.2f})")
 
         print(f"\nPlayers similar to {player_name}", end="")
         if season:
@@ -162,48 +192,23 @@ def compare_methods(nba_sim):  # contrast KD tree and ANN timing
         k = 5
 
     # Get target player's stats for reference
-    player_and_season = (nba_sim.player_info['PLAYER_NAME'] == player_name)
-    if season:
-        player_and_season &= (nba_sim.player_info['SEASON_YEAR'] == season)
-    target_info = nba_sim.player_info[player_and_season]
-
-    if target_info.empty:
-        print(f"Player {player_name} not found{'' if not season else f' in season {season}'}")
+    try:
+        target_row = nba_sim.find_player_row(player_name, season)
+    except ValueError as e:
+        print(e)
         return
 
-    target_id = target_info['player_id'].values[0]
-    target_raw = nba_sim.feature_data[feature_group]['raw'][target_id]
-    target_norm = nba_sim.feature_data[feature_group]['scaled'][target_id]
+    target = nba_sim.describe_row(feature_group, target_row, 0.0)
 
     print("\n=== Target Player Stats ===")  # user inputted player displayed first
     print(f"{player_name} ({season if season else 'all seasons'}):")
     # round stats to two decimal places, output as Raw (Normalized)
-    for stat in target_raw:
-        print(f"   - {stat}: {target_raw[stat]:.2f} ({target_norm[list(target_raw.keys()).index(stat)]:.2f})")
-
-    # Run both methods
-    comparison = {
-        'knn': {'time': 0, 'results': []},
-        'ann': {'time': 0, 'results': []}
-    }
-
-    # time both methods
-    for method in ['knn', 'ann']:
-        start = time.time()
-        results = nba_sim.find_similar_players(
-            player_name=player_name,
-            feature_group=feature_group,
-            k=k,
-            season=season,
-            exact=(method == 'knn')
-        )
-        comparison[method]['time'] = time.time() - start
-        comparison[method]['results'] = results
+    for stat in target['raw_stats']:
+        print(f"   - {stat}: {target['raw_stats'][stat]:.2f} ({target['norm_stats'][stat]:.2f})")
 
-    # Create sets of (player_name, season) pairs
-    knn_players = set((p['player'], p['season']) for p in comparison['knn']['results'])
-    ann_players = set((p['player'], p['season']) for p in comparison['ann']['results'])
-    common_players = len(knn_players & ann_players)
+    # Run both methods (warmup + median of several timed runs)
+    comparison = nba_sim.compare_search_methods(player_name, feature_group, k, season)
+    common_players = comparison['common_players']
 
     # print out results for both KNN and ANN
     print("\n=== Results Comparison ===")
@@ -220,10 +225,66 @@ def compare_methods(nba_sim):  # contrast KD tree and ANN timing
     # contrast KNN and ANN using speed and exactness (how close was ANN to exact KNN)
     print(f"\n=== Comparison Metrics ===")
     print(f"Common players in top {k}: {common_players}/{k}")  # how many matches did ANN get to exact KNN
-    print(f"Speed ratio: {comparison['knn']['time'] / comparison['ann']['time']:.2f}x faster")  # percentage ANN faster
+    if comparison['ann']['time'] > 0:  # how many times faster ANN was
+        print(f"Speed ratio: {comparison['knn']['time'] / comparison['ann']['time']:.2f}x faster")
+    else:
+        print("Speed ratio: too fast to measure")
     print(f"ANN found {100 * common_players / k:.2f}% of KNN results")  # percentage of exact KNN found by ANN
 
 
+def read_queries(path):  # one query per json line or csv row (player_name, season, feature_group, k, exact)
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                query = {key: value for key, value in row.items() if value not in (None, '')}
+                if 'season' in query:
+                    query['season'] = int(query['season'])
+                if 'k' in query:
+                    query['k'] = int(query['k'])
+                if 'exact' in query:
+                    query['exact'] = query['exact'].strip().lower() in ('1', 'true', 'yes')
+                yield query
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def run_batch(queries_path, output_path=None, workers=1):  # non interactive mode for nightly jobs
+    nba_sim = NBAPlayerSimilarity('playerstats.csv', snapshot_dir='index_snapshot', lsh_params_path=LSH_PARAMS)
+    out = open(output_path, 'w') if output_path else sys.stdout
+
+    start_time = time.time()
+    count = errors = 0
+    try:
+        for result in nba_sim.iter_similar_batch(read_queries(queries_path), workers=workers):
+            out.write(json.dumps(result) + '\n')  # stream results as soon as their chunk finishes
+            count += 1
+            errors += 'error' in result
+    finally:
+        if output_path:
+            out.close()
+    print(f"{count} queries ({errors} errors) in {time.time() - start_time:.2f}s", file=sys.stderr)
+
+
+def run_uniqueness(feature_group, radius, output_path=None):  # most unique player-seasons first
+    nba_sim = NBAPlayerSimilarity('playerstats.csv', snapshot_dir='index_snapshot', lsh_params_path=LSH_PARAMS)
+    start_time = time.time()
+    scores = nba_sim.uniqueness_scores(feature_group, radius)
+    scores.sort_values('comparables', kind='stable').to_csv(output_path or sys.stdout, index=False)
+    print(f"{len(scores)} player-seasons in {time.time() - start_time:.2f}s", file=sys.stderr)
+
+
+def run_tune_lsh(target_recall, k, max_ms=None):
+    nba_sim = NBAPlayerSimilarity('playerstats.csv', snapshot_dir='index_snapshot', lsh_params_path=LSH_PARAMS)
+    for group, result in nba_sim.tune_lsh(k=k, target_recall=target_recall, max_ms=max_ms).items():
+        print(f"{group}: num_tables={result['num_tables']} hash_size={result['hash_size']} "
+              f"recall@{k}={result['recall']:.3f} {result['query_ms']:.3f}ms/query "
+              f"{result['candidates']:.0f} candidates ({len(result['trials'])} settings tried"
+              f"{'' if result['met'] else ', target not reached'})")
+    print(f"saved to {LSH_PARAMS}")
+
+
 def list_feature_groups(nba_sim):  # similarity metric groups
     print("\nAvailable feature groups and their metrics:")
     for group, features in nba_sim.feature_groups.items():
@@ -0,0 +1,95 @@
+import bisect
+import threading
+import time
+
+# histogram bucket upper bounds, powers of two from ~0.004 to ~16 million
+# (milliseconds for phase timers, plain counts for traversal counters)
+BUCKET_BOUNDS = [2.0 ** exponent for exponent in range(-8, 25)]
+
+
+class Histogram:
+    # fixed buckets -> observing is one bisect + two adds, memory doesn't grow with the number of requests
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # last bucket = above the largest bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):  # upper bound of the bucket holding the q-th value (an over-estimate, within 2x)
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS + [self.max], self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': [[bound, count] for bound, count in zip(BUCKET_BOUNDS + ['inf'], self.counts) if count]
+        }
+
+
+class Metrics:
+    # named histograms shared by every request thread (per process, each serve.py worker has its own)
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def record(self, trace, prefix=''):  # every phase and counter of a finished request
+        for phase, seconds in trace.phases.items():
+            self.observe(f'{prefix}{phase}_ms', seconds * 1000)
+        for counter, value in trace.counters.items():
+            self.observe(counter, value)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+class RequestTrace:
+    # phase timings of one request, lap(phase) charges the time since the previous lap to that phase
+    # code paths take trace=None when nothing is being measured, so the only cost then is an `is None` check
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.last = self.start = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):  # adds the 'total' phase, wall time since the trace was created
+        self.phases['total'] = time.perf_counter() - self.start
+        return self
+
+    def as_dict(self):
+        return {'phases_ms': {phase: round(seconds * 1000, 4) for phase, seconds in self.phases.items()},
+                'counters': dict(self.counters)}
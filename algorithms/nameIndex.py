@@ -0,0 +1,93 @@
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+
+
+def normalize_name(text):  # "Nikola Jokić" / "nikola  jokic" -> "nikola jokic", punctuation dropped
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return ' '.join(re.sub(r"[^\w\s]", '', text).split())
+
+
+class NameIndex:
+    # prefix autocomplete over player names, built once -> every lookup is a bisect into sorted arrays
+    # full names: "leb" -> LeBron James, tokens: "jam" -> every James (last names, middle names, ...)
+    # fuzzy (optional): names containing most of the query's character trigrams (survives typos and dropped letters)
+    def __init__(self, names):
+        self.names = sorted(set(names))  # display names, alphabetical (also used for /api/players paging)
+        normalized = [normalize_name(name) for name in self.names]
+
+        order = sorted(range(len(self.names)), key=lambda i: (normalized[i], self.names[i]))
+        self.full_keys = [normalized[i] for i in order]
+        self.full_ids = order  # position in full_keys -> index into self.names
+
+        tokens = sorted((token, i) for i, key in enumerate(normalized) for token in key.split())
+        self.token_keys = [token for token, _ in tokens]
+        self.token_ids = [i for _, i in tokens]
+        self.name_tokens = [key.split() for key in normalized]
+
+        grams = {}  # trigram -> names containing it
+        for i, key in enumerate(normalized):
+            for gram in self._trigrams(key):
+                grams.setdefault(gram, []).append(i)
+        self.trigrams = {gram: np.array(ids, dtype=np.intp) for gram, ids in grams.items()}
+        self.gram_counts = np.array([len(self._trigrams(key)) for key in normalized])
+
+    @staticmethod
+    def _trigrams(key):
+        padded = f'  {key} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def _prefix_range(keys, prefix):  # [lo, hi) of the keys starting with prefix
+        return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + '\U0010ffff')
+
+    # up to limit (name, match) pairs, full name prefixes first, then token prefixes, then fuzzy matches
+    # keep -> optional predicate on the display name (e.g. skip players whose rows were all removed)
+    def search(self, query, limit=10, fuzzy=False, keep=None):
+        query = normalize_name(query)
+        if not query or limit <= 0:
+            return []
+        found = []
+        seen = set()
+
+        def add(i, match):
+            if i not in seen and (keep is None or keep(self.names[i])):
+                seen.add(i)
+                found.append((self.names[i], match))
+            return len(found) >= limit
+
+        lo, hi = self._prefix_range(self.full_keys, query)
+        for pos in range(lo, hi):
+            if add(self.full_ids[pos], 'prefix'):
+                return found
+
+        # every query token has to start one of the name's tokens ("le ja" -> LeBron James)
+        # candidates come from the longest query token, it has the narrowest range
+        query_tokens = query.split()
+        lo, hi = self._prefix_range(self.token_keys, max(query_tokens, key=len))
+        for pos in range(lo, hi):
+            i = self.token_ids[pos]
+            if all(any(token.startswith(q) for token in self.name_tokens[i]) for q in query_tokens):
+                if add(i, 'token'):
+                    return found
+
+        if fuzzy:
+            for i in self._fuzzy(query):
+                if add(i, 'fuzzy'):
+                    break
+        return found
+
+    # names ranked by the share of the query's trigrams they contain, ties -> fewer extra trigrams (jaccard)
+    def _fuzzy(self, query, cutoff=0.5):
+        query_grams = self._trigrams(query)
+        postings = [self.trigrams[gram] for gram in query_grams if gram in self.trigrams]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.names))
+        hits = np.flatnonzero(shared >= cutoff * len(query_grams))
+        containment = shared[hits] / len(query_grams)
+        jaccard = shared[hits] / (len(query_grams) + self.gram_counts[hits] - shared[hits])
+        return hits[np.lexsort((-jaccard, -containment))].tolist()
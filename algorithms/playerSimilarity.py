@@ -2,14 +2,102 @@ import pandas as pd
 import numpy as np
 from kdTree import KDTree
 from ann import ANNSearch
+from hnsw import HNSWIndex
+from bruteForce import BruteForceSearch
+from knnTable import KNNTable
+from careerSearch import CareerSearch
+from vectorStore import QuantizedSearch
+from columnStore import ColumnStore
+from resultCache import ResultCache
+from nameIndex import NameIndex
+import snapshot
+import lshTuner
+import hashlib
+import json
+import os
 import time
+import threading
+import tracemalloc
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_batch_sim = None  # instance used by forked batch workers (inherited, never pickled)
+_build_inputs = None  # group -> (points, player_ids, codes, alive) for forked build workers (inherited, never pickled)
+
+
+class GroupUnavailableError(Exception):
+    # a feature group whose indexes could not be built (missing/non-numeric column, ...), the others keep working
+    def __init__(self, group, error):
+        super().__init__(f"Feature group {group} is unavailable: {error}")
+        self.group = group
+        self.error = error
 
 
 class NBAPlayerSimilarity:
+    ENGINES = ('auto', 'kdtree', 'lsh', 'brute', 'hnsw', 'sq8', 'pq')
+    # compressed scans (vectorStore.py), built per group on first use: 8-bit codes or product quantization codes
+    # are scanned and a shortlist is re-ranked with the exact stats read from the column store
+    QUANTIZED_ENGINES = ('sq8', 'pq')
+
+    # crossover points for engine='auto' (measured with benchmark.py / single core, k=10):
+    # one blas pass beats the python kd tree walk up to ~20k points in 3 dims, and the kd tree
+    # gets roughly 2x worse per extra dimension, so the brute force limit doubles with each dimension
+    BRUTE_FORCE_MAX_POINTS = 20000
+    # below this many points the exact engines answer faster than lsh, so lsh only pays off past it
+    LSH_MIN_POINTS = 1000000
+    # indexes built on the fly for custom feature sets / weights, least recently used ones are dropped
+    CUSTOM_INDEX_CACHE_SIZE = 32
+    # uniqueness_scores results kept per (group, radius, engine), each is a few arrays the size of the data
+    UNIQUENESS_CACHE_SIZE = 16
+    # neighbours precomputed per row and group, unfiltered searches for k up to this are answered from the table
+    KNN_TABLE_K = 25
+    # lsh settings of groups that haven't been tuned (tune_lsh) and of custom searches, fixed seed -> the same
+    # planes on every start
+    LSH_DEFAULTS = {'num_tables': 10, 'hash_size': 8, 'num_probes': 0, 'seed': 0}
+    # find_similar_profiles: groups searched at once (a thread each, only with more than one core) and the
+    # reciprocal rank fusion constant (the larger it is, the less the top few ranks dominate)
+    PROFILE_WORKERS = os.cpu_count() or 1
+    RRF_K = 60
+
+    # snapshot_dir -> folder for saved indexes, reused on the next start as long as the csv has not changed
+    # build_workers/build_mode -> how many feature groups are indexed at once and where ('thread' or 'process')
+    # lazy -> only the stats are loaded up front, each group's indexes are built on its first search and a
+    # background thread warms the others, warm_order groups first (the rest follow in feature_groups order)
+    # lsh_params_path -> json file with each group's tuned lsh settings (written by tune_lsh)
+    def __init__(self, data_path='playerstats.csv', snapshot_dir=None, build_workers=1, build_mode='process',
+                 lazy=False, warm_order=('scoring',), lsh_params_path=None):
+        self.data_path = data_path
+        self.snapshot_dir = snapshot_dir
+        self.lsh_params_path = lsh_params_path
+        self.lsh_params = self.load_lsh_params()  # group -> tuned settings + how they did when tuned
+        self.build_workers = build_workers
+        self.build_mode = build_mode
+        self.build_timings = {}  # seconds per group of the last build/rebuild + 'total'
+        self.custom_indexes = ResultCache(self.CUSTOM_INDEX_CACHE_SIZE)  # emptied whenever index_version changes
+        self.uniqueness_cache = ResultCache(self.UNIQUENESS_CACHE_SIZE)  # same
+        self.career_cache = ResultCache(1)  # same, career layout used by find_similar_careers
+        self.index_version = 0  # bumped whenever the indexes are (re)built or loaded -> invalidates cached results
+        self.update_lock = threading.Lock()  # live updates (upsert_rows/remove_rows) and background rebuild swaps
+        self.update_count = 0
+        self.rebuild_thread = None
+        self.warm_thread = None
+        self.kd_trees = {}
+        self.ann_indices = {}
+        self.brute_indices = {}
+        self.hnsw_indices = {}
+        self.knn_tables = {}
+        if snapshot_dir and self.load_snapshot():
+            if any(group not in self.knn_tables for group in self.feature_data):  # saved before they were built
+                self.start_warmup(warm_order)
+            return
 
-    def __init__(self, data_path='playerstats.csv'):
         self.load_data(data_path)
+        if lazy:
+            self.start_warmup(warm_order)
+            return
         self.build_models()
+        if snapshot_dir and self.all_groups_ready():
+            self.save_snapshot()
 
     # all stats normalized to 0-1 range (so all stats considered equally)
     # points will naturally have > value, range than steals so this balances it
@@ -18,16 +106,20 @@ class NBAPlayerSimilarity:
         max_values = np.max(x, axis=0)
         return (x - min_values) / (max_values - min_values + 1e-8)  # 1e-8 prevents division by zero
 
+    # allow season to be searched using only one year (2022 instead of 2021-22)
+    @staticmethod
+    def parse_season_years(seasons):
+        if isinstance(seasons.iloc[0], str) and '-' in seasons.iloc[0]:
+            return seasons.str.split('-').str[0].astype(int)
+        return seasons.astype(int)
+
     def load_data(self, data_path):  # read data from csv file and define comparison groups
         # create dataframe, minor cleaning
         df = pd.read_csv(data_path)
-        df = df.dropna().drop_duplicates(subset=['PLAYER_NAME', 'SEASON'])
-
-        # allow season to be searched using only one year (2022 instead of 2021-22)
-        if isinstance(df['SEASON'].iloc[0], str) and '-' in df['SEASON'].iloc[0]:
-            df['SEASON_YEAR'] = df['SEASON'].str.split('-').str[0].astype(int)
-        else:
-            df['SEASON_YEAR'] = df['SEASON'].astype(int)
+        # an empty column would drop every row, without it only the groups that use it fail (see build_feature_data)
+        df = df.dropna(axis=1, how='all').dropna().drop_duplicates(subset=['PLAYER_NAME', 'SEASON'])
+        numeric_columns = [column for column in df.select_dtypes('number').columns if column != 'SEASON']
+        df['SEASON_YEAR'] = self.parse_season_years(df['SEASON'])
 
         # organize players into dataframe, differentiating individual seasons
         df['player_id'] = df.groupby(['PLAYER_NAME', 'SEASON']).ngroup()
@@ -41,104 +133,1242 @@ class NBAPlayerSimilarity:
             'impact': ['OFF_RATING', 'DEF_RATING', 'PLUS_MINUS']  # how well team plays with player on vs off
         }
 
+        # normalized stats (for calculations) and raw (for display) of every column once, groups index into it
+        # numeric columns outside the groups are kept too so custom searches can use any stat in the csv
+        # group stats that are missing or not numeric are left out here and reported per group
+        columns = list(dict.fromkeys([feat for features in self.feature_groups.values() for feat in features
+                                      if feat in numeric_columns] + numeric_columns))
+        self.stats = ColumnStore(columns, df[columns].to_numpy(dtype=float))
+        self.build_feature_data()
+        self.build_lookup()
+
+    # group -> its features and their column positions in self.stats, groups with a stat that isn't stored
+    # are left out and marked failed so a bad column only takes down the groups that use it
+    # group_status -> group -> {'state': pending/building/ready/failed, 'source': build/snapshot,
+    # 'build_seconds', 'error'}
+    def build_feature_data(self):
         self.feature_data = {}
-        for group, features in self.feature_groups.items():  # normalized stats (for calculations) and raw (for display)
-            X = df[features].values
-            self.feature_data[group] = {
-                'scaled': self.normalize(X),
-                'raw': dict(zip(df['player_id'], df[features].to_dict('records'))),
-                'features': features
-            }
-
-    def build_models(self):  # assemble both a kd tree and approximate nearest neighbors list
+        self.group_status = {}
+        for group, features in self.feature_groups.items():
+            missing = [feat for feat in features if feat not in self.stats.column_index]
+            if missing:
+                self.group_status[group] = {'state': 'failed', 'source': None, 'build_seconds': None,
+                                            'error': f"Missing or non-numeric columns {', '.join(missing)}"}
+                continue
+            self.feature_data[group] = {'features': features, 'columns': self.stats.indices(features)}
+            self.group_status[group] = {'state': 'pending', 'source': None, 'build_seconds': None, 'error': None}
+        self.group_locks = {group: threading.Lock() for group in self.feature_groups}  # one lazy build at a time
+        self.hnsw_locks = {group: threading.Lock() for group in self.feature_groups}  # same for the hnsw graphs
+
+    def group_points(self, group, rows=None):  # scaled points of one group (every row if rows is None)
+        return self.stats.group_points(self.feature_data[group]['columns'], rows)
+
+    # O(1) lookups instead of scanning player_info with pandas masks on every request
+    def build_lookup(self):
+        self.names = self.player_info['PLAYER_NAME'].to_numpy()  # row aligned, used to hydrate neighbours
+        self.seasons = self.player_info['SEASON'].to_numpy()
+        self.season_years = self.player_info['SEASON_YEAR'].to_numpy()
+        self.player_ids = player_ids = self.player_info['player_id'].to_numpy()
+
+        self.id_rows = np.empty(player_ids.max() + 1 if len(player_ids) else 0, dtype=np.intp)  # player_id -> row
+        self.id_rows[player_ids] = np.arange(len(player_ids))
+
+        self.name_rows = {}  # name -> all of that player's rows (csv order)
+        self.season_rows = {}  # (name, season year) -> row
+        for row, (name, year) in enumerate(zip(self.names.tolist(), self.season_years.tolist())):
+            self.name_rows.setdefault(name, []).append(row)
+            self.season_rows.setdefault((name, year), row)
+        self.name_rows = {name: np.array(rows) for name, rows in self.name_rows.items()}
+        self.name_index = NameIndex(self.name_rows)  # autocomplete + sorted names for /api/players
+        self.active = np.ones(len(self.names), dtype=bool)  # False = removed by remove_rows
+
+    # row of the inputted player (first listed season if no season given)
+    # season can be a year (2022) or the full season string (2021-22)
+    def find_player_row(self, player_name, season=None):
+        if season:
+            try:
+                row = self.season_rows.get((player_name, int(str(season).split('-')[0])))
+            except ValueError:
+                row = None
+        else:
+            rows = self.name_rows.get(player_name)
+            row = rows[0] if rows is not None else None
+
+        if row is None:  # player not in NBA or in given season
+            raise ValueError(f"Player {player_name} not found{'' if not season else f' in season {season}'}")
+        return row
+
+    def build_models(self):  # assemble a kd tree, lsh tables, brute force index and knn table (hnsw on first use)
+        player_ids = self.player_info['player_id'].values
+        built = self.build_all_groups({group: self.group_points(group) for group in self.feature_data},
+                                      player_ids, self.player_codes())  # use normalized points for distances
+        self.kd_trees = {}
+        self.ann_indices = {}
+        self.brute_indices = {}
+        self.hnsw_indices = {}
+        self.knn_tables = {}
+        for group, models in built.items():
+            self._install_group(group, models, 'build', self.build_timings[group])
+        self.index_version += 1
+
+    # (kd, ann, brute, table or None) -> live, group is ready, a graph of the old points is dropped (rebuilt on
+    # next use), without a table the group's searches go to its indexes until build_knn_table has made one
+    def _install_group(self, group, models, source, seconds):
+        self.kd_trees[group], self.ann_indices[group], self.brute_indices[group], table = models
+        if table is None:
+            self.knn_tables.pop(group, None)
+        else:
+            self.knn_tables[group] = table
+        self.hnsw_indices.pop(group, None)
+        self.group_status[group] = {'state': 'ready', 'source': source, 'build_seconds': seconds, 'error': None}
+
+    # make sure a group's indexes exist, building them now if lazy loading hasn't got to them yet
+    # concurrent first searches of a group wait for one build, a failed group raises GroupUnavailableError
+    def ensure_group(self, group):
+        status = self.group_status[group]  # KeyError for unknown groups
+        if status['state'] == 'ready':
+            return
+        with self.group_locks[group]:
+            if self.group_status[group]['state'] == 'pending':
+                self._build_group(group)
+            status = self.group_status[group]
+        if status['state'] == 'failed':
+            raise GroupUnavailableError(group, status['error'])
+
+    # lazy build of one group (its lock held), off the update lock like rebuild: if rows change or a rebuild
+    # swaps indexes in meanwhile, the result is stale and the build starts over
+    # the knn table compares every pair of rows (over a second per group), so it isn't built here but by the
+    # warmup thread once every group is ready
+    def _build_group(self, group):
+        start = time.perf_counter()
+        self.group_status[group] = dict(self.group_status[group], state='building')
+        try:
+            while self.group_status[group]['state'] != 'ready':  # a background rebuild may get there first
+                with self.update_lock:
+                    version = self.index_version
+                    points = self.group_points(group)
+                    player_ids = self.player_ids.copy()
+                    codes = self.player_codes()
+                    active = self.active.copy()
+                removed = np.flatnonzero(~active)
+                models = self.build_group_models(points, player_ids, codes, active, self.lsh_settings(group),
+                                                 table=False)
+                for model in models[:3]:
+                    model.delete(removed)
+                with self.update_lock:
+                    if self.index_version == version:
+                        seconds = time.perf_counter() - start
+                        self.build_timings[group] = seconds
+                        self._install_group(group, models, 'build', seconds)
+        except Exception as e:
+            self.group_status[group] = {'state': 'failed', 'source': 'build', 'error': f"{type(e).__name__}: {e}",
+                                        'build_seconds': time.perf_counter() - start}
+
+    # background warmup for lazy loading, builds the groups nobody has searched yet in priority order
+    # and saves a snapshot once every group is ready (if nothing was updated live in the meantime)
+    def start_warmup(self, warm_order=()):
+        order = [group for group in warm_order if group in self.group_status]
+        order += [group for group in self.feature_groups if group not in order]
+        self.warm_thread = threading.Thread(target=self._warm, args=(order,), daemon=True)
+        self.warm_thread.start()
+        return self.warm_thread
+
+    def _warm(self, order):
+        for group in order:
+            try:
+                self.ensure_group(group)
+            except GroupUnavailableError:
+                pass  # stays in group_status
+        for group in order:  # knn tables last, searches don't wait for them
+            if self.group_status[group]['state'] == 'ready':
+                self.build_knn_table(group)
+        if self.snapshot_dir and self.all_groups_ready():
+            with self.update_lock:
+                if self.update_count == 0:
+                    self.save_snapshot()
+
+    def wait_for_warmup(self, timeout=None):  # True once every group has been built (or failed)
+        if self.warm_thread is not None:
+            self.warm_thread.join(timeout)
+        return self.warm_thread is None or not self.warm_thread.is_alive()
+
+    def all_groups_ready(self):
+        return all(status['state'] == 'ready' for status in self.group_status.values())
+
+    def player_codes(self):  # one number per player, row aligned (tells the knn table which rows are the same player)
+        return pd.factorize(self.names)[0]
+
+    # every search index a feature group needs to be ready, the knn table leaves out codes' same-player rows and
+    # rows that aren't alive, lsh -> ANNSearch settings (default LSH_DEFAULTS)
+    # the hnsw graph isn't one of them, see hnsw_index, and table=False leaves the knn table out (None)
+    @staticmethod
+    def build_group_models(points, player_ids, codes, alive=None, lsh=None, table=True):
+        kd_tree = KDTree(points.shape[1])
+        kd_tree.build(points, player_ids)
+        ann_index = ANNSearch(points.shape[1], **(lsh or NBAPlayerSimilarity.LSH_DEFAULTS))
+        ann_index.build_index(points, player_ids)
+        brute_index = BruteForceSearch(points.shape[1])
+        brute_index.build_index(points, player_ids)
+        knn_table = None
+        if table:
+            knn_table = KNNTable(brute_index, NBAPlayerSimilarity.KNN_TABLE_K)
+            knn_table.build(codes, alive)
+        return kd_tree, ann_index, brute_index, knn_table
+
+    # knn table of a ready group that doesn't have one (lazy builds leave it out), built off the update lock on a
+    # private copy of the group's brute force index and then pointed at the live one
+    # like _build_group, if rows change or a rebuild swaps indexes in meanwhile it is stale and starts over
+    def build_knn_table(self, group):
+        while group not in self.knn_tables and self.group_status[group]['state'] == 'ready':
+            with self.update_lock:
+                version = self.index_version
+                points = self.group_points(group)
+                player_ids = self.player_ids.copy()
+                codes = self.player_codes()
+                active = self.active.copy()
+            brute_index = BruteForceSearch(points.shape[1])
+            brute_index.build_index(points, player_ids)
+            brute_index.delete(np.flatnonzero(~active))
+            table = KNNTable(brute_index, self.KNN_TABLE_K)
+            table.build(codes, active)
+            with self.update_lock:
+                if self.index_version == version and group not in self.knn_tables:
+                    table.index = self.brute_indices[group]
+                    self.knn_tables[group] = table
+
+    # the group's hnsw graph, built on its first use: wiring it takes seconds per group and only approximate
+    # searches use it, so groups are ready (and /api/ready answers) without one
+    # off the update lock like _build_group, if rows change or a rebuild swaps indexes in meanwhile the graph is
+    # stale and the build starts over, concurrent first uses wait for one build
+    def hnsw_index(self, group):
+        index = self.hnsw_indices.get(group)
+        if index is not None:
+            return index
+        with self.hnsw_locks[group]:
+            index = self.hnsw_indices.get(group)
+            while index is None:
+                with self.update_lock:
+                    version = self.index_version
+                    points = self.group_points(group)
+                    player_ids = self.player_ids.copy()
+                    active = self.active.copy()
+                index = HNSWIndex(points.shape[1])
+                index.build_index(points, player_ids)
+                index.delete(np.flatnonzero(~active))
+                with self.update_lock:
+                    if self.index_version == version:
+                        self.hnsw_indices[group] = index
+                    else:
+                        index = None
+            return index
+
+    # group -> scaled points in, group -> (kd, ann, brute, table) out, groups are independent so they
+    # build at once
+    # 'thread' -> shares the points directly, only helps as far as numpy releases the gil (argpartition, matmul)
+    # 'process' -> forked workers read the points copy on write and hand the finished index arrays back through
+    # files in shared memory that the parent maps, so nothing big is pickled in either direction
+    def build_all_groups(self, points_by_group, player_ids, codes, alive=None):
+        global _build_inputs
+        start = time.perf_counter()
+        workers = min(self.build_workers, len(points_by_group))
+        timings = {}
+        built = {}
+        lsh = {group: self.lsh_settings(group) for group in points_by_group}
+        if workers <= 1:
+            for group, points in points_by_group.items():
+                group_start = time.perf_counter()
+                built[group] = self.build_group_models(points, player_ids, codes, alive, lsh[group])
+                timings[group] = time.perf_counter() - group_start
+        elif self.build_mode == 'thread' or 'fork' not in mp.get_all_start_methods():
+            with ThreadPoolExecutor(workers) as pool:
+                for group, models, seconds in pool.map(
+                        lambda item: _timed_build(item[0], item[1], player_ids, codes, alive, lsh[item[0]]),
+                        points_by_group.items()):
+                    built[group], timings[group] = models, seconds
+        else:
+            _build_inputs = {group: (points, player_ids, codes, alive, lsh[group])
+                             for group, points in points_by_group.items()}
+            try:
+                with ProcessPoolExecutor(workers, mp_context=mp.get_context('fork')) as pool:
+                    for group, path, names, settings, seconds in pool.map(_build_group_shared, list(points_by_group)):
+                        built[group] = _models_from_arrays(snapshot.receive_arrays(path, names), settings)
+                        timings[group] = seconds
+            finally:
+                _build_inputs = None
+
+        timings['total'] = time.perf_counter() - start
+        self.build_timings = timings
+        return built
+
+    def load_lsh_params(self):  # {} without a params file, every group then uses LSH_DEFAULTS
+        if not self.lsh_params_path or not os.path.isfile(self.lsh_params_path):
+            return {}
+        with open(self.lsh_params_path) as f:
+            return json.load(f)
+
+    def save_lsh_params(self):
+        if self.lsh_params_path:
+            with open(self.lsh_params_path, 'w') as f:
+                json.dump(self.lsh_params, f, indent=2)
+
+    def lsh_settings(self, group):  # ANNSearch arguments of one group
+        params = self.lsh_params.get(group, {})
+        return {key: params.get(key, default) for key, default in self.LSH_DEFAULTS.items()}
+
+    # lsh settings of one group as shown by /api/status, tuned groups also get how the setting did when tuned
+    def lsh_info(self, group):
+        return {**self.LSH_DEFAULTS, 'tuned_at': None, **self.lsh_params.get(group, {})}
+
+    # sweeps num_tables/hash_size/num_probes of each group's lsh index (lshTuner.py) on num_queries sampled
+    # player-seasons, with exact kd tree answers as ground truth (the player's own seasons masked out like in
+    # find_similar_players)
+    # each group switches to the cheapest setting reaching target_recall at k, max_ms -> optional latency budget
+    # the settings and seed go to lsh_params_path and the snapshot, so later starts hash exactly the same way
+    # -> group -> tuner result (chosen setting, its recall/query_ms/candidates and every trial)
+    def tune_lsh(self, groups=None, k=10, target_recall=0.9, max_ms=None, num_queries=200, seed=0):
+        rng = np.random.default_rng(seed)
+        report = {}
+        for group in groups or list(self.feature_data):
+            self.ensure_group(group)
+            with self.update_lock:
+                points = self.group_points(group)
+                player_ids = self.player_ids.copy()
+                live = np.flatnonzero(self.active)
+            rows = rng.choice(live, min(num_queries, len(live)), replace=False)
+            queries, truth = [], []
+            for row in rows:
+                mask = self.filter_mask([self.names[row]])[:len(points)]
+                queries.append((points[row], mask))
+                truth.append({player_id for _, player_id, _ in
+                              self.kd_trees[group].find_nearest_neighbors(points[row], k, mask=mask)})
+            result = lshTuner.tune_lsh(points, player_ids, queries, truth, k, target_recall, max_ms, seed)
+            report[group] = result
+
+            settings = {key: result[key] for key in self.LSH_DEFAULTS}
+            with self.update_lock:  # rehash the live rows (rows may have changed while tuning)
+                index = ANNSearch(points.shape[1], **settings)
+                index.build_index(self.group_points(group), self.player_ids)
+                index.delete(np.flatnonzero(~self.active))
+                self.ann_indices[group] = index
+                self.lsh_params[group] = dict(settings, k=k, target_recall=target_recall, max_ms=max_ms,
+                                              met=result['met'], recall=round(result['recall'], 4),
+                                              query_ms=round(result['query_ms'], 4),
+                                              candidates=round(result['candidates'], 1),
+                                              tuned_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+                self.index_version += 1
+        self.save_lsh_params()
+        if self.snapshot_dir and self.all_groups_ready():
+            with self.update_lock:
+                if self.update_count == 0:
+                    self.save_snapshot()
+        return report
+
+    # a snapshot is only reused for the same csv and the same tuned lsh settings (they decide the hash tables)
+    def snapshot_checksum(self):
+        settings = json.dumps({group: self.lsh_settings(group) for group in sorted(self.lsh_params)}, sort_keys=True)
+        return hashlib.sha256((snapshot.file_checksum(self.data_path) + settings).encode()).hexdigest()
+
+    # save scaled matrices, player info and the indexes of every group as .npy files + manifest
+    def save_snapshot(self):
+        info_columns = ['player_id', 'PLAYER_NAME', 'SEASON', 'SEASON_YEAR']
+        arrays = {}
+        for column in info_columns:
+            values = self.player_info[column].to_numpy()
+            arrays['info.' + column] = values.astype(str) if values.dtype == object else values
+
+        for name, array in self.stats.get_state().items():
+            arrays['stats.' + name] = array
+        for group in self.feature_data:
+            for name, array in self.kd_trees[group].get_state().items():
+                arrays[f'{group}.kd.{name}'] = array
+            for name, array in self.ann_indices[group].get_state().items():
+                arrays[f'{group}.ann.{name}'] = array
+            if group in self.hnsw_indices:  # only graphs that have been used
+                for name, array in self.hnsw_indices[group].get_state().items():
+                    arrays[f'{group}.hnsw.{name}'] = array
+            if group in self.knn_tables:
+                for name, array in self.knn_tables[group].get_state().items():
+                    arrays[f'{group}.table.{name}'] = array
+
+        meta = {
+            'feature_groups': self.feature_groups,
+            'info_columns': info_columns,
+            'stat_columns': self.stats.columns,
+            'kd_leaf_size': {group: tree.leaf_size for group, tree in self.kd_trees.items()},
+            'lsh_params': {group: self.lsh_settings(group) for group in self.feature_groups}
+        }
+        return snapshot.save_snapshot(self.snapshot_dir, self.snapshot_checksum(), arrays, meta)
+
+    # returns False (and loads nothing) if there is no snapshot for the current csv
+    def load_snapshot(self):
+        loaded = snapshot.load_snapshot(self.snapshot_dir, self.snapshot_checksum())
+        if loaded is None:
+            return False
+        manifest, arrays = loaded
+
+        self.player_info = pd.DataFrame({column: arrays['info.' + column] for column in manifest['info_columns']})
+        self.feature_groups = manifest['feature_groups']
+        player_ids = self.player_info['player_id'].values
+
+        self.stats = ColumnStore.from_state(manifest['stat_columns'], {
+            name[6:]: array for name, array in arrays.items() if name.startswith('stats.')})
+        self.build_feature_data()
         self.kd_trees = {}
         self.ann_indices = {}
+        self.brute_indices = {}
+        self.hnsw_indices = {}
+        self.knn_tables = {}
+        self.index_version += 1
+        for group, features in self.feature_groups.items():
+            start = time.perf_counter()
+            kd_state = {name[len(group) + 4:]: array for name, array in arrays.items()
+                        if name.startswith(group + '.kd.')}
+            ann_state = {name[len(group) + 5:]: array for name, array in arrays.items()
+                         if name.startswith(group + '.ann.')}
+            hnsw_state = {name[len(group) + 6:]: array for name, array in arrays.items()
+                          if name.startswith(group + '.hnsw.')}
+            table_state = {name[len(group) + 7:]: array for name, array in arrays.items()
+                           if name.startswith(group + '.table.')}
+            brute_index = BruteForceSearch(len(features))  # one float32 cast, not worth storing
+            brute_index.build_index(self.group_points(group), player_ids)
+            self._install_group(group, (KDTree.from_state(len(features), kd_state, manifest['kd_leaf_size'][group]),
+                                        ANNSearch.from_state(ann_state, manifest['lsh_params'][group]['num_probes'],
+                                                             manifest['lsh_params'][group]['seed']),
+                                        brute_index,
+                                        KNNTable.from_state(table_state, brute_index) if table_state else None),
+                                'snapshot', time.perf_counter() - start)
+            if hnsw_state:
+                self.hnsw_indices[group] = HNSWIndex.from_state(hnsw_state)
+        self.build_lookup()
+        return True
+
+    # live updates: new or changed player-season rows from a delta csv (path) or a dataframe, no full reload
+    # rows that already exist (same name and season) keep their row and player_id, new ones get the next free id
+    # new stats are scaled with the current min/max, if they move a bound by more than rebuild_threshold
+    # (as a share of the feature's range) or an index degrades, everything is rebuilt in a background thread
+    def upsert_rows(self, rows, rebuild_threshold=0.05):
+        df = pd.read_csv(rows) if isinstance(rows, str) else pd.DataFrame(rows)
+        df = df.dropna().drop_duplicates(subset=['PLAYER_NAME', 'SEASON'], keep='last')
+        if df.empty:
+            return {'inserted': 0, 'updated': 0, 'rebuild': False}
+        df['SEASON_YEAR'] = self.parse_season_years(df['SEASON'])
+        missing = set(self.stats.columns) - set(df.columns)
+        if missing:
+            raise ValueError(f"Missing columns {', '.join(sorted(missing))}")
+
+        with self.update_lock:
+            existing = [self.season_rows.get(key) for key in zip(df['PLAYER_NAME'], df['SEASON_YEAR'].tolist())]
+            is_new = np.array([row is None for row in existing])
+            updated_rows = np.array([row for row in existing if row is not None], dtype=np.intp)
+            new_df = df[is_new]
+            df = pd.concat((df[~is_new], new_df))  # updated rows first, then new ones (same order as rows below)
+
+            # new rows go after every existing row with fresh ids
+            new_rows = np.arange(len(self.names), len(self.names) + len(new_df))
+            next_id = int(self.player_ids.max()) + 1 if len(self.player_ids) else 0
+            new_ids = np.arange(next_id, next_id + len(new_df))
+            if len(new_df):
+                self._append_rows(new_df, new_ids)
+            rows = np.concatenate((updated_rows, new_rows))
+            ids = self.player_ids[rows]
+
+            X = df[self.stats.columns].to_numpy(dtype=float)
+            drift = self.stats.drift(X)
+            self.stats.set_rows(rows, X)
+            codes = self.player_codes()
+            for group in self.kd_trees:  # groups still waiting for a lazy build get the new rows when built
+                points = self.group_points(group, rows)
+                self.kd_trees[group].delete(updated_rows)
+                self.kd_trees[group].insert(points, ids, rows)
+                self.ann_indices[group].insert(points, ids, rows)
+                self.brute_indices[group].insert(points, ids, rows)
+                if group in self.hnsw_indices:
+                    self.hnsw_indices[group].insert(points, ids, rows)
+                if group in self.knn_tables:  # after the brute force index, it reads the new points
+                    self.knn_tables[group].update(rows, codes)
+
+            self.update_count += 1
+            self.index_version += 1
+            rebuild = drift > rebuild_threshold or self.indexes_degraded()
+
+        if rebuild:
+            self.start_background_rebuild()
+        return {'inserted': len(new_rows), 'updated': len(updated_rows), 'rebuild': rebuild}
+
+    def _append_rows(self, new_df, new_ids):  # grow every row aligned lookup for brand new player-seasons
+        start = len(self.names)
+        info = pd.DataFrame({
+            'player_id': new_ids,
+            'PLAYER_NAME': new_df['PLAYER_NAME'].to_numpy(),
+            'SEASON': new_df['SEASON'].to_numpy(),
+            'SEASON_YEAR': new_df['SEASON_YEAR'].to_numpy()
+        })
+        self.player_info = pd.concat((self.player_info, info), ignore_index=True)
+        self.names = np.concatenate((self.names, info['PLAYER_NAME'].to_numpy()))
+        self.seasons = np.concatenate((self.seasons, info['SEASON'].to_numpy()))
+        self.season_years = np.concatenate((self.season_years, info['SEASON_YEAR'].to_numpy()))
+        self.player_ids = np.concatenate((self.player_ids, new_ids))
+        self.active = np.concatenate((self.active, np.ones(len(info), dtype=bool)))
+
+        id_rows = np.empty(int(new_ids.max()) + 1, dtype=np.intp)
+        id_rows[:len(self.id_rows)] = self.id_rows
+        id_rows[new_ids] = np.arange(start, start + len(info))
+        self.id_rows = id_rows
+
+        known_names = len(self.name_rows)
+        for row, (name, year) in enumerate(zip(info['PLAYER_NAME'].tolist(), info['SEASON_YEAR'].tolist()), start):
+            self.name_rows[name] = np.append(self.name_rows.get(name, np.empty(0, dtype=np.intp)), row)
+            self.season_rows.setdefault((name, year), row)
+        if len(self.name_rows) != known_names:  # brand new players
+            self.name_index = NameIndex(self.name_rows)
+
+    # top `limit` player names for a partial name -> [{'player', 'seasons', 'match'}]
+    # match is 'prefix' (start of the full name), 'token' (start of a last/middle name) or 'fuzzy' (misspelling)
+    def autocomplete(self, query, limit=10, fuzzy=False):
+        return [{'player': name, 'seasons': sorted(set(self.seasons[self.name_rows[name]].tolist())), 'match': match}
+                for name, match in self.name_index.search(query, limit, fuzzy, keep=self.name_rows.__contains__)]
+
+    # live delete of one player-season, its row and id are never reused
+    def remove_rows(self, player_name, season):
+        with self.update_lock:
+            row = self.find_player_row(player_name, season)
+            self.active[row] = False
+            self.season_rows.pop((player_name, int(self.season_years[row])), None)
+            remaining = self.name_rows[player_name][self.name_rows[player_name] != row]
+            if len(remaining):
+                self.name_rows[player_name] = remaining
+            else:
+                del self.name_rows[player_name]
+                self.name_index = NameIndex(self.name_rows)
+
+            for group in self.kd_trees:
+                self.kd_trees[group].delete([row])
+                self.ann_indices[group].delete([row])
+                self.brute_indices[group].delete([row])
+                if group in self.hnsw_indices:
+                    self.hnsw_indices[group].delete([row])
+                if group in self.knn_tables:
+                    self.knn_tables[group].delete([row])
+            self.update_count += 1
+            self.index_version += 1
+            rebuild = self.indexes_degraded()
+
+        if rebuild:
+            self.start_background_rebuild()
 
-        for group, data in self.feature_data.items():
-            points = data['scaled']  # use normalized points for distance calculations
-            player_ids = self.player_info['player_id'].values
-            self.kd_trees[group] = KDTree(points.shape[1])
-            self.kd_trees[group].build(points, player_ids)
-            self.ann_indices[group] = ANNSearch(points.shape[1])
-            self.ann_indices[group].build_index(points, player_ids)
-
-    def compare_search_methods(self, player_name, feature_group='scoring', k=5, season=None):  # compare KNN, ANN
-        # time both methods
-        start_knn = time.time()
-        knn_results = self.find_similar_players(player_name, feature_group, k, season, exact=True)
-        knn_time = time.time() - start_knn
-        start_ann = time.time()
-        ann_results = self.find_similar_players(player_name, feature_group, k, season, exact=False)
-        ann_time = time.time() - start_ann
+    def indexes_degraded(self):  # too many buffered inserts/tombstones in any tree, hash table or graph
+        return any(tree.degraded() for tree in self.kd_trees.values()) or \
+            any(index.degraded() for index in self.ann_indices.values()) or \
+            any(index.degraded() for index in self.hnsw_indices.values())
 
+    def start_background_rebuild(self):
+        with self.update_lock:
+            if self.rebuild_thread is None or not self.rebuild_thread.is_alive():
+                self.rebuild_thread = threading.Thread(target=self.rebuild, daemon=True)
+                self.rebuild_thread.start()
+            return self.rebuild_thread
+
+    # re-normalize every group with fresh bounds and rebuild all indexes off the request path, then swap them in
+    # if rows changed while building, the result is stale and the rebuild starts over
+    def rebuild(self):
+        while True:
+            with self.update_lock:
+                update_count = self.update_count
+                stats = ColumnStore.from_state(self.stats.columns, self.stats.get_state())  # rescaled off the lock
+                active = self.active.copy()
+                player_ids = self.player_ids.copy()
+                codes = self.player_codes()
+            removed = np.flatnonzero(~active)
+
+            stats.rescale(active)
+            built = self.build_all_groups({group: stats.group_points(data['columns'])
+                                           for group, data in self.feature_data.items()}, player_ids, codes, active)
+            for models in built.values():
+                for model in models:
+                    model.delete(removed)
+
+            with self.update_lock:
+                if self.update_count != update_count:
+                    continue
+                self.stats = stats
+                for group, models in built.items():
+                    self._install_group(group, models, 'build', self.build_timings[group])
+                self.index_version += 1
+                return
+
+    # bytes held by the stat store and every index, next to what the old layout (one {stat: value} dict per
+    # player-season per group + a float64 scaled matrix per group) would take for the same rows
+    # the dict cost is measured with tracemalloc on up to `sample` rows and scaled up to every row
+    def memory_report(self, sample=2000):
+        rows = len(self.stats)
+        sample_rows = np.arange(min(sample, rows))
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            legacy = [{int(pid): dict(zip(data['features'], self.stats.raw[row, data['columns']].astype(float).tolist()))
+                       for pid, row in zip(self.player_ids[sample_rows], sample_rows)}
+                      for data in self.feature_data.values()]
+            legacy_dict_bytes = (tracemalloc.get_traced_memory()[0] - before) * rows // max(len(sample_rows), 1)
+        finally:
+            tracemalloc.stop()
+        del legacy
+        legacy_scaled_bytes = sum(rows * len(data['features']) * 8 for data in self.feature_data.values())
+
+        def state_bytes(index):  # None for an index that hasn't been built yet
+            if index is None:
+                return None
+            return int(sum(np.asarray(array).nbytes for array in index.get_state().values()))
+
+        return {
+            'rows': rows,
+            'stat_columns': len(self.stats.columns),
+            'stats_bytes': self.stats.nbytes(),
+            'legacy_stats_bytes': legacy_dict_bytes + legacy_scaled_bytes,
+            'index_bytes': {group: {'kdtree': state_bytes(self.kd_trees[group]),
+                                    'lsh': state_bytes(self.ann_indices[group]),
+                                    'brute': state_bytes(self.brute_indices[group]),
+                                    'hnsw': state_bytes(self.hnsw_indices.get(group)),
+                                    'table': state_bytes(self.knn_tables.get(group))}
+                            for group in self.kd_trees}
+        }
+
+    # compare KNN, ANN -> one warmup call, then the median of `repeats` timed calls (perf_counter)
+    # a single time.time() call is mostly noise at these latencies, see benchmark.py for full recall/latency runs
+    def compare_search_methods(self, player_name, feature_group='scoring', k=5, season=None, repeats=5):
+        timings = {}
+        results = {}
+        for method, engine in (('knn', 'kdtree'), ('ann', 'lsh')):  # named engines, so not the knn table
+            results[method] = self.find_similar_players(player_name, feature_group, k, season, engine=engine)
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                self.find_similar_players(player_name, feature_group, k, season, engine=engine)
+                samples.append(time.perf_counter() - start)
+            timings[method] = float(np.median(samples))
+
+        knn_players = set((p['player'], p['season']) for p in results['knn'])
+        ann_players = set((p['player'], p['season']) for p in results['ann'])
         return {  # compile times and similar players between KNN, ANN
-            'knn': {'results': knn_results, 'time': knn_time},
-            'ann': {'results': ann_results, 'time': ann_time},
-            'common_players': len(set(p['player'] for p in knn_results) & set(p['player'] for p in ann_results))
+            'knn': {'results': results['knn'], 'time': timings['knn']},
+            'ann': {'results': results['ann'], 'time': timings['ann']},
+            'common_players': len(knn_players & ann_players)
         }
 
-    def find_similar_players(self, player_name, feature_group='scoring',
-                             k=5, season=None, exact=True):  # allow KNN or ANN search
-        player_and_season = (self.player_info['PLAYER_NAME'] == player_name)
-        if season:
-            player_and_season &= (self.player_info['SEASON_YEAR'] == season)
+    # boolean mask over rows for filtered searches (applied inside the index traversal, not afterwards)
+    # exclude_names -> players to leave out, season_range -> (first, last) season years inclusive (None = open)
+    # player_ids -> only these player-seasons are allowed
+    def filter_mask(self, exclude_names=(), season_range=None, player_ids=None):
+        if player_ids is not None:
+            mask = np.zeros(len(self.names), dtype=bool)
+            mask[self.id_rows[np.asarray(list(player_ids), dtype=np.intp)]] = True
+            mask &= self.active
+        else:
+            mask = self.active.copy()
 
-        target_info = self.player_info[player_and_season]
-        if target_info.empty:  # player not in NBA or in given season
-            raise ValueError(f"Player {player_name} not found{'' if not season else f' in season {season}'}")
+        for name in exclude_names:
+            rows = self.name_rows.get(name)
+            if rows is not None:
+                mask[rows] = False
 
+        if season_range is not None:
+            first, last = season_range
+            if first is not None:
+                mask &= self.season_years >= first
+            if last is not None:
+                mask &= self.season_years <= last
+        return mask
+
+    # engine='auto' -> brute force while one matrix product is cheaper than walking the kd tree,
+    # kd tree past that (hnsw instead if approximate results are fine), and lsh only on very large groups
+    # batches amortize the per query python overhead of brute force, so they stay on it a bit longer
+    # dims -> number of stats searched when it isn't a plain feature group (custom features)
+    def choose_engine(self, feature_group, exact=True, batch_size=1, dims=None):
+        n, dims = len(self.stats), dims or len(self.feature_data[feature_group]['features'])
+        if not exact and n >= self.LSH_MIN_POINTS:
+            return 'lsh'
+        brute_limit = self.BRUTE_FORCE_MAX_POINTS * 2 ** max(dims - 3, 0) * (2 if batch_size > 1 else 1)
+        if n <= brute_limit:
+            return 'brute'
+        return 'kdtree' if exact else 'hnsw'
+
+    # engine=None keeps the old exact flag behaviour (kd tree if exact else lsh)
+    def resolve_engine(self, feature_group, exact=True, engine=None, batch_size=1, dims=None):
+        if engine is None:
+            return 'kdtree' if exact else 'lsh'
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine}, use one of {', '.join(self.ENGINES)}")
+        if engine == 'auto':
+            return self.choose_engine(feature_group, exact, batch_size, dims)
+        return engine
+
+    # custom search space: any stored stat columns (default: the group's) with optional per-stat weights
+    # weighted distance sqrt(sum w * (a - b)^2) is plain euclidean after multiplying each column by sqrt(w),
+    # so every engine works unchanged on the rescaled points and exact engines stay exact
+    # returns None for a plain feature group search (no features/weights given)
+    def custom_space(self, feature_group, features=None, weights=None):
+        if features is None and weights is None:
+            return None
+        features = list(self.feature_groups[feature_group] if features is None else features)
+        if not features:
+            raise ValueError("features must not be empty")
+        unknown = [feat for feat in features if feat not in self.stats.column_index]
+        if unknown:
+            raise ValueError(f"Unknown stats {', '.join(map(str, unknown))}")
+        weights = dict(weights or {})
+        extra = set(weights) - set(features)
+        if extra:
+            raise ValueError(f"Weights given for stats not being searched: {', '.join(sorted(map(str, extra)))}")
+        try:
+            w = np.array([float(weights.get(feat, 1.0)) for feat in features])
+        except (TypeError, ValueError):
+            raise ValueError("weights must be numbers")
+        if not np.isfinite(w).all() or (w < 0).any() or not w.any():
+            raise ValueError("weights must be non-negative and not all zero")
+        return {
+            'features': features,
+            'columns': self.stats.indices(features),
+            'scale': np.sqrt(w).astype(np.float32),
+            'key': (tuple(features), tuple(w.tolist()))
+        }
+
+    # one index per (custom space, engine), built on first use and kept until evicted or the data changes
+    def custom_index(self, space, engine):
+        key = space['key'] + (engine,)
+        version = self.index_version
+        index = self.custom_indexes.get(key, version)
+        if index is None:
+            points = self.stats.group_points(space['columns']) * space['scale']
+            if engine == 'kdtree':
+                index = KDTree(len(space['features']))
+                index.build(points, self.player_ids)
+            elif engine in self.QUANTIZED_ENGINES:  # keeps only codes, re-ranks from the column store
+                stats, columns, scale = self.stats, space['columns'], space['scale']
+                index = QuantizedSearch(len(space['features']), engine,
+                                        exact=lambda rows: stats.group_points(columns, rows) * scale)
+                index.build_index(points, self.player_ids)
+            elif engine == 'lsh':
+                index = ANNSearch(len(space['features']), **self.LSH_DEFAULTS)
+                index.build_index(points, self.player_ids)
+            else:
+                index = {'brute': BruteForceSearch, 'hnsw': HNSWIndex}[engine](len(space['features']))
+                index.build_index(points, self.player_ids)
+            self.custom_indexes.put(key, index, version)
+        return index
+
+    # one neighbour as returned by find_similar_players
+    # features -> stats to show instead of the group's (custom searches)
+    def describe_row(self, feature_group, row, distance, features=None):
+        if features is None:
+            features, columns = self.feature_data[feature_group]['features'], self.feature_data[feature_group]['columns']
+        else:
+            columns = self.stats.indices(features)
+        return {
+            'player': self.names[row],
+            'season': self.seasons[row],
+            'distance': distance,
+            'raw_stats': self.stats.raw_stats(row, features, columns),
+            'norm_stats': self.stats.norm_stats(row, features, columns)
+        }
+
+    # everything a search around one player needs -> (target point, engine name, index, custom space or None, mask)
+    def search_setup(self, player_name, feature_group, season=None, exact=True, engine=None, features=None,
+                     weights=None, season_range=None, player_ids=None):
         # get info for inputted player
-        target_id = target_info['player_id'].values[0]
-        target_name = target_info['PLAYER_NAME'].values[0]
-        features = self.feature_data[feature_group]['features']
-        points = self.feature_data[feature_group]['scaled']
-        target_index = np.where(self.player_info['player_id'] == target_id)[0][0]
-        target_point = points[target_index]
-
-        if exact:  # kd tree
-            results = self.kd_trees[feature_group].find_nearest_neighbors(target_point, k * 2)
-            # k*2 -> go through extra players in case of target player repeating often
-            # players will usually be similar to themselves so the true k-nearest will usually include the target
-        else:  # ANN
-            results = self.ann_indices[feature_group].query(target_point, k * 2)  # same buffer for ANN
-
-        similar_players = []
-        for distance, player_id, target_point in results:
-            current_player = self.player_info[self.player_info['player_id'] == player_id].iloc[0]
-            # Skip if target player comes up (i.e. don't add the player as a nearest neighbor of himself)
-            if current_player['PLAYER_NAME'] == target_name:
+        target_index = self.find_player_row(player_name, season)
+        target_name = self.names[target_index]
+        space = self.custom_space(feature_group, features, weights)
+        if space is None:
+            self.ensure_group(feature_group)
+            target_point = self.group_points(feature_group, target_index)
+            engine = self.resolve_engine(feature_group, exact, engine)
+            index = self.group_index(feature_group, engine)
+        else:
+            target_point = self.stats.group_points(space['columns'], target_index) * space['scale']
+            engine = self.resolve_engine(feature_group, exact, engine, dims=len(space['features']))
+            index = self.custom_index(space, engine)
+
+        # players will usually be similar to themselves, so all of the target's seasons are filtered out
+        # during the search itself -> exactly k other players come back without over-fetching
+        mask = self.filter_mask([target_name], season_range, player_ids)
+        return target_point, engine, index, space, mask
+
+    def group_index(self, feature_group, engine):
+        self.ensure_group(feature_group)
+        if engine in self.QUANTIZED_ENGINES:  # not kept with the group's other indexes, cached like custom ones
+            return self.custom_index(self.custom_space(feature_group, weights={}), engine)
+        if engine == 'hnsw':
+            return self.hnsw_index(feature_group)
+        return {'kdtree': self.kd_trees, 'brute': self.brute_indices, 'lsh': self.ann_indices}[engine][feature_group]
+
+    def find_similar_players(self, player_name, feature_group='scoring',
+                             k=5, season=None, exact=True, probes=None,
+                             season_range=None, player_ids=None, engine=None,
+                             features=None, weights=None, trace=None, ef=None):  # allow KNN or ANN search
+        # probes -> extra neighbouring LSH buckets to check per query (multi-probe ANN, None = index default)
+        # ef -> hnsw candidate list size for this query (higher = better recall, slower, None = index default)
+        # season_range/player_ids -> only search those player-seasons (e.g. (1990, 1999) for 90s comparisons)
+        # engine -> 'kdtree', 'lsh', 'brute', 'hnsw' or 'auto' (overrides exact)
+        # features/weights -> custom stat list (default: the group's) and {stat: weight} (default 1 each),
+        # e.g. weights={'TS_PCT': 3} for scoring with true shooting counted 3x
+        # trace -> optional metrics.RequestTrace, gets lookup/search/hydrate timings and the engine's counters
+        # searches without filters, custom stats or a named engine are answered from the precomputed knn table
+        if self.table_applies(feature_group, k, engine, features, weights, season_range, player_ids, exact):
+            return self._table_neighbours(player_name, feature_group, k, season, trace)
+        target_point, engine, index, space, mask = self.search_setup(
+            player_name, feature_group, season, exact, engine, features, weights, season_range, player_ids)
+        stats = None
+        if trace is not None:
+            trace.lap('lookup')
+            stats = {}
+        results = self._index_query(index, engine, target_point, k, mask, probes, ef, stats)
+        if trace is not None:
+            trace.lap('search')
+            for name, value in stats.items():
+                trace.count(f'{engine}.{name}', value)
+
+        results = [self.describe_row(feature_group, self.id_rows[player_id], distance, space and space['features'])
+                   for distance, player_id, _ in results]
+        if trace is not None:
+            trace.lap('hydrate')
+        return results
+
+    # top k of one index, whatever the engine -> [(distance, player_id, point)]
+    def _index_query(self, index, engine, target_point, k, mask, probes=None, ef=None, stats=None):
+        if engine == 'kdtree':
+            return index.find_nearest_neighbors(target_point, k, mask=mask, stats=stats)
+        if engine == 'brute' or engine in self.QUANTIZED_ENGINES:
+            return index.query(target_point, k, mask=mask, stats=stats)
+        if engine == 'hnsw':
+            return index.query(target_point, k, ef=ef, mask=mask, stats=stats)
+        return index.query(target_point, k, probes=probes, mask=mask, stats=stats)  # ANN
+
+    # True if find_similar_players can answer from the knn table: a plain feature group whose table has been
+    # built, no season range or player id filter, k within the table, and either engine='auto' or no engine with
+    # exact=True (the table is exact, an approximate request without an engine still goes to lsh)
+    def table_applies(self, feature_group, k, engine=None, features=None, weights=None, season_range=None,
+                      player_ids=None, exact=True):
+        return (engine == 'auto' or engine is None and exact) and features is None and weights is None and \
+            player_ids is None and all(bound is None for bound in season_range or ()) and \
+            feature_group in self.knn_tables and isinstance(k, int) and 0 < k <= self.KNN_TABLE_K
+
+    def _table_neighbours(self, player_name, feature_group, k, season=None, trace=None):  # O(k) slice
+        row = self.find_player_row(player_name, season)
+        self.ensure_group(feature_group)
+        if trace is not None:
+            trace.lap('lookup')
+        rows, dists = self.knn_tables[feature_group].neighbours(row, k)
+        if trace is not None:
+            trace.lap('search')
+            trace.count('table.rows_read', len(rows))
+        results = [self.describe_row(feature_group, r, d) for r, d in zip(rows.tolist(), dists.tolist())]
+        if trace is not None:
+            trace.lap('hydrate')
+        return results
+
+    # several feature groups around one target in one call (a player's profile page): the target row and the filter
+    # mask are resolved once, groups the knn table can answer are a slice each and the rest are searched on
+    # PROFILE_WORKERS threads (numpy releases the gil in the distance math)
+    # a group that can't be searched gets an error entry, the others still answer
+    # fuse -> also an overall ranking over all the groups, distance = sqrt(mean over the groups of the squared
+    # distance per stat), i.e. every group counts the same however many stats it has
+    # - 'distance': exact top k of that distance (one more search, in the groups' stats weighted accordingly)
+    # - 'rank': reciprocal rank fusion of the groups' top max(k, KNN_TABLE_K) lists, sum of 1 / (RRF_K + rank)
+    # over the lists a player-season is in
+    # -> {'groups': {group: {'engine', 'results'} or {'error'}}, 'overall': [{'player', 'season', 'distance',
+    # 'distances', 'rrf'}] (fuse only)}, results as in find_similar_players
+    def find_similar_profiles(self, player_name, feature_groups=None, k=5, season=None, exact=True, engine=None,
+                              season_range=None, fuse=None, trace=None):
+        feature_groups = list(self.feature_groups if feature_groups is None else feature_groups)
+        unknown = [group for group in feature_groups if group not in self.feature_groups]
+        if unknown:
+            raise ValueError(f"Unknown feature groups {', '.join(map(str, unknown))}")
+        if fuse not in (None, 'distance', 'rank'):
+            raise ValueError(f"Unknown fuse {fuse}, use distance or rank")
+        row = self.find_player_row(player_name, season)
+        mask = self.filter_mask([self.names[row]], season_range)
+        fetch = max(k, self.KNN_TABLE_K) if fuse == 'rank' else k
+        if trace is not None:
+            trace.lap('lookup')
+
+        def search(group):  # -> (group, (rows, distances, engine) or None, error or None)
+            try:
+                return group, self._profile_search(group, row, fetch, exact, engine, season_range, mask), None
+            except GroupUnavailableError as e:
+                return group, None, str(e)
+
+        tabled = [group for group in feature_groups if self.table_applies(group, fetch, engine,
+                                                                          season_range=season_range, exact=exact)]
+        others = [group for group in feature_groups if group not in tabled]
+        found = [search(group) for group in tabled]
+        workers = min(self.PROFILE_WORKERS, len(others))
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                found += list(pool.map(search, others))
+        else:
+            found += [search(group) for group in others]
+        found = {group: (result, error) for group, result, error in found}
+        searched = {group: result for group, (result, _) in found.items() if result is not None}
+        candidates = np.empty(0, dtype=np.intp)  # rows for the overall ranking
+        if fuse == 'distance' and searched:
+            space = self.fused_space(list(searched))
+            fused_engine = self.resolve_engine(feature_groups[0], exact, engine or 'auto', dims=len(space['features']))
+            results = self._index_query(self.custom_index(space, fused_engine), fused_engine,
+                                        self.stats.group_points(space['columns'], row) * space['scale'], k, mask)
+            candidates = np.array([self.id_rows[player_id] for _, player_id, _ in results], dtype=np.intp)
+        elif fuse == 'rank' and searched:
+            candidates = np.unique(np.concatenate([rows for rows, _, _ in searched.values()]))
+        if trace is not None:
+            trace.lap('search')
+
+        groups = {}
+        for group in feature_groups:
+            result, error = found[group]
+            if error is not None:
+                groups[group] = {'error': error}
                 continue
+            rows, dists, group_engine = result
+            groups[group] = {'engine': group_engine, 'results': [
+                self.describe_row(group, r, d) for r, d in zip(rows[:k].tolist(), dists[:k].tolist())]}
+        profiles = {'groups': groups}
+        if fuse:
+            profiles['overall'] = self._fuse_profiles(row, candidates, searched, k, fuse)
+        if trace is not None:
+            trace.lap('hydrate')
+        return profiles
+
+    # one group's top k around a row -> (rows, distances, engine), from the knn table when it applies
+    def _profile_search(self, group, row, k, exact, engine, season_range, mask):
+        self.ensure_group(group)
+        if self.table_applies(group, k, engine, season_range=season_range, exact=exact):
+            rows, dists = self.knn_tables[group].neighbours(row, k)
+            return rows, dists, 'table'
+        engine = self.resolve_engine(group, exact, engine)
+        results = self._index_query(self.group_index(group, engine), engine, self.group_points(group, row), k, mask)
+        rows = np.array([self.id_rows[player_id] for _, player_id, _ in results], dtype=np.intp)
+        return rows, np.array([distance for distance, _, _ in results]), engine
+
+    # custom space whose plain euclidean distance is the fused profile distance: a group's squared distance is
+    # the sum over its stats, so each stat gets weight 1 / (groups * stats in the group), summed over the groups
+    # it is in (PTS is in scoring and traditional)
+    def fused_space(self, groups):
+        weights = {}
+        for group in groups:
+            for feat in self.feature_groups[group]:
+                weights[feat] = weights.get(feat, 0.0) + 1 / (len(groups) * len(self.feature_groups[group]))
+        return self.custom_space(groups[0], list(weights), weights)
+
+    # overall entries of find_similar_profiles for some candidate rows, in fused order
+    def _fuse_profiles(self, row, candidates, found, k, fuse):
+        if not len(candidates):
+            return []
+        distances = np.empty((len(found), len(candidates)))
+        rrf = np.zeros(len(candidates))
+        for i, (group, (rows, _, _)) in enumerate(found.items()):
+            diff = (self.group_points(group, candidates) - self.group_points(group, row)).astype(np.float64)
+            distances[i] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            if fuse == 'rank':  # candidates are sorted, every listed row is one of them
+                rrf[np.searchsorted(candidates, rows)] += 1 / (self.RRF_K + np.arange(1, len(rows) + 1))
+        dims = np.array([len(self.feature_data[group]['features']) for group in found])
+        fused = np.sqrt((distances ** 2 / dims[:, None]).mean(axis=0))
+        order = np.arange(len(candidates)) if fuse == 'distance' else np.lexsort((candidates, fused, -rrf))
+        return [{
+            'player': self.names[candidates[i]],
+            'season': self.seasons[candidates[i]],
+            'distance': float(fused[i]),
+            'distances': {group: float(distances[j, i]) for j, group in enumerate(found)},
+            'rrf': float(rrf[i]) if fuse == 'rank' else None
+        } for i in order[:k].tolist()]
+
+    # every other player-season within `radius` of the target, nearest first (same scaled distance as
+    # find_similar_players, so radius 0.1 ~ a tenth of one stat's range), the target's own seasons are left out
+    # -> {'total', 'results'} where only results[offset:offset + limit] are hydrated, so big radii page cheaply
+    # lazy -> results is a generator that hydrates while it is consumed (for streaming responses)
+    # other arguments as in find_similar_players, kd tree / brute force answers are exact, lsh / hnsw approximate
+    def find_players_within(self, player_name, feature_group='scoring', radius=0.1, season=None, exact=True,
+                            engine=None, season_range=None, player_ids=None, features=None, weights=None,
+                            offset=0, limit=None, lazy=False, probes=None, ef=None, trace=None):
+        target_point, engine, index, space, mask = self.search_setup(
+            player_name, feature_group, season, exact, engine, features, weights, season_range, player_ids)
+        found = self._range_query(index, engine, target_point, radius, mask, False, probes, ef, trace)
+        page = found[offset:] if limit is None else found[offset:offset + limit]
+        results = (self.describe_row(feature_group, self.id_rows[player_id], distance, space and space['features'])
+                   for distance, player_id, _ in page)
+        if not lazy:
+            results = list(results)
+            if trace is not None:
+                trace.lap('hydrate')
+        return {'total': len(found), 'results': results}
+
+    # how many other player-seasons are within `radius` (a player's comparables), nothing is hydrated and the
+    # kd tree counts whole boxes that fit inside the radius without scanning them
+    def count_players_within(self, player_name, feature_group='scoring', radius=0.1, season=None, exact=True,
+                             engine=None, season_range=None, player_ids=None, features=None, weights=None,
+                             probes=None, ef=None, trace=None):
+        target_point, engine, index, space, mask = self.search_setup(
+            player_name, feature_group, season, exact, engine, features, weights, season_range, player_ids)
+        return self._range_query(index, engine, target_point, radius, mask, True, probes, ef, trace)
+
+    def _range_query(self, index, engine, target_point, radius, mask, count_only, probes=None, ef=None, trace=None):
+        stats = None
+        if trace is not None:
+            trace.lap('lookup')
+            stats = {}
+        search = index.range_count if count_only else index.range_search
+        if engine == 'lsh':
+            found = search(target_point, radius, probes=probes, mask=mask, stats=stats)
+        elif engine == 'hnsw':
+            found = search(target_point, radius, ef=ef, mask=mask, stats=stats)
+        else:
+            found = search(target_point, radius, mask=mask, stats=stats)
+        if trace is not None:
+            trace.lap('search')
+            for name, value in stats.items():
+                trace.count(f'{engine}.{name}', value)
+        return found
+
+    # comparables of every active player-season in a feature group (other players' seasons within radius)
+    # and a uniqueness score = share of the other player-seasons with at least as many comparables (1.0 = none
+    # has fewer, i.e. the most unique)
+    # -> dataframe in row order with player, season, comparables, uniqueness
+    # brute force counts a block of targets per matrix product, other engines answer one range count per row
+    # results are cached per (group, radius, engine) until the data changes
+    def uniqueness_scores(self, feature_group, radius=0.1, engine='auto'):
+        key = (feature_group, float(radius), engine)
+        version = self.index_version
+        scores = self.uniqueness_cache.get(key, version)
+        if scores is not None:
+            return scores
+
+        self.ensure_group(feature_group)
+        rows = np.flatnonzero(self.active)
+        points = self.group_points(feature_group, rows)
+        engine = self.resolve_engine(feature_group, True, engine, batch_size=len(rows))
+        if engine == 'brute':
+            counts = self.group_index(feature_group, 'brute').range_count_batch(points, radius, self.active)
+        else:
+            index = self.group_index(feature_group, engine)
+            counts = np.array([self._range_query(index, engine, point, radius, self.active, True)
+                               for point in points], dtype=np.intp)
+        # a player's own seasons aren't comparables (same rule as the searches), approximate engines can miss
+        # some of them so the difference is clipped at 0
+        counts = np.maximum(counts - self._own_seasons_within(rows, points, radius), 0)
+        at_least = len(rows) - np.searchsorted(np.sort(counts), counts, side='left') - 1  # minus the row itself
+        scores = pd.DataFrame({
+            'player': self.names[rows],
+            'season': self.seasons[rows],
+            'comparables': counts,
+            'uniqueness': at_least / max(len(rows) - 1, 1)
+        })
+        self.uniqueness_cache.put(key, scores, version)
+        return scores
+
+    # per row: how many of the same player's rows (itself included) are within radius, all same-player pairs
+    # at once (a few seasons each, so ~seasons^2 pairs per player)
+    def _own_seasons_within(self, rows, points, radius):
+        codes = pd.factorize(self.names[rows])[0]
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, sorted_codes, side='left')
+        sizes = np.searchsorted(sorted_codes, sorted_codes, side='right') - starts
+        first = np.repeat(np.arange(len(rows)), sizes)  # every (position, same player position) pair
+        second = np.repeat(starts, sizes) + np.arange(len(first)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        ordered = points[order].astype(np.float64)
+        diff = ordered[first] - ordered[second]
+        within = np.einsum('ij,ij->i', diff, diff) <= float(radius) ** 2
+        own = np.empty(len(rows), dtype=np.intp)
+        own[order] = np.bincount(first, weights=within, minlength=len(rows)).astype(np.intp)
+        return own
+
+    # (player names, name -> career, CareerSearch) over the live rows, every player's seasons in season order
+    def careers(self):
+        version = self.index_version
+        careers = self.career_cache.get('careers', version)
+        if careers is None:
+            names = list(self.name_rows)
+            rows = [self.name_rows[name][self.active[self.name_rows[name]]] for name in names]
+            careers = (names, {name: i for i, name in enumerate(names)},
+                       CareerSearch([r[np.argsort(self.season_years[r], kind='stable')] for r in rows]))
+            self.career_cache.put('careers', careers, version)
+        return careers
+
+    # players whose career developed like the target's: the target's career seasons start..start + length - 1
+    # (0 = first season, length None = the rest of the career) against the same career seasons of every other
+    # player, e.g. start=0, length=4 -> rookie year vs rookie year up to year 4 vs year 4
+    # seasons -> (first, last) season years of the target instead of start/length (the stretch it covers)
+    # metric -> 'aligned' (season by season) or 'dtw' (seasons may shift by up to `band` to line up)
+    # season_range -> only careers whose compared seasons all fall inside (first, last) season years
+    # features/weights as in find_similar_players
+    # -> {'seasons': the target's compared seasons, 'results': [{'player', 'seasons', 'distance', 'raw_stats'}]}
+    # with raw_stats one {stat: value} per compared season
+    def find_similar_careers(self, player_name, feature_group='scoring', k=5, start=0, length=None, seasons=None,
+                             metric='aligned', band=1, season_range=None, features=None, weights=None, trace=None):
+        if metric not in ('aligned', 'dtw'):
+            raise ValueError(f"Unknown metric {metric}, use aligned or dtw")
+        names, career_ids, search = self.careers()
+        rows = search.rows[career_ids[player_name]] if player_name in career_ids else np.empty(0, dtype=np.intp)
+        rows = rows[rows >= 0]
+        if not len(rows):
+            raise ValueError(f"Player {player_name} not found")
+        if seasons is not None:
+            first, last = seasons
+            inside = np.flatnonzero((self.season_years[rows] >= first) & (self.season_years[rows] <= last))
+            if not len(inside):
+                raise ValueError(f"Player {player_name} has no seasons between {first} and {last}")
+            start, length = int(inside[0]), len(inside)
+        if length is None:
+            length = max(len(rows) - start, 1)
+        if start < 0 or length <= 0 or start + length > len(rows):
+            raise ValueError(f"Player {player_name} has {len(rows)} seasons, "
+                             f"career seasons {start} to {start + length - 1} don't exist")
+        target_rows = rows[start:start + length]
+
+        space = self.custom_space(feature_group, features, weights)
+        if space is None:
+            if self.group_status[feature_group]['state'] == 'failed':  # KeyError for unknown groups
+                raise GroupUnavailableError(feature_group, self.group_status[feature_group]['error'])
+            columns, scale = self.feature_data[feature_group]['columns'], 1
+            features = self.feature_data[feature_group]['features']
+        else:
+            columns, scale, features = space['columns'], space['scale'], space['features']
+        mask = self.filter_mask([player_name], season_range)
+        stats = None
+        if trace is not None:
+            trace.lap('lookup')
+            stats = {}
+        found = search.query(self.stats.group_points(columns, target_rows) * scale,
+                             lambda r: self.stats.group_points(columns, r) * scale, k, start,
+                             band if metric == 'dtw' else 0, mask, stats)
+        if trace is not None:
+            trace.lap('search')
+            for name, value in stats.items():
+                trace.count(f'career.{name}', value)
+
+        results = [{
+            'player': names[career],
+            'seasons': self.seasons[career_rows].tolist(),
+            'distance': distance,
+            'raw_stats': [self.stats.raw_stats(row, features, columns) for row in career_rows.tolist()]
+        } for distance, career, career_rows in found]
+        if trace is not None:
+            trace.lap('hydrate')
+        return {'seasons': self.seasons[target_rows].tolist(), 'results': results}
+
+    # many (player, season, group) queries at once, results come back in the same order as the queries
+    # each query is a dict with player_name and optionally season, feature_group, k, exact, probes, ef, engine,
+    # features, weights
+    # workers > 1 -> chunks of queries go to a forked process pool, the indexes are shared copy on write
+    def find_similar_batch(self, queries, workers=1, chunk_size=64):
+        return list(self.iter_similar_batch(queries, workers, chunk_size))
+
+    # generator version so results can be streamed out while later chunks are still running
+    def iter_similar_batch(self, queries, workers=1, chunk_size=64):
+        global _batch_sim
+        if workers <= 1 or 'fork' not in mp.get_all_start_methods():  # no fork on windows -> run in process
+            chunk = []
+            for query in queries:
+                chunk.append(query)
+                if len(chunk) == chunk_size:
+                    yield from self.run_queries(chunk)
+                    chunk = []
+            yield from self.run_queries(chunk)
+            return
+
+        queries = list(queries)
+        chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+        self.wait_for_warmup()  # a group lock held by the warmup thread at fork time would never be released
+        _batch_sim = self
+        try:
+            with ProcessPoolExecutor(workers, mp_context=mp.get_context('fork')) as pool:
+                for results in pool.map(_run_batch_chunk, chunks):
+                    yield from results
+        finally:
+            _batch_sim = None
+
+    # one batch entry -> {'query', 'results'} or {'query', 'error'} so one bad query doesn't fail the batch
+    def run_query(self, query):
+        try:
+            feature_group = query.get('feature_group', 'scoring')
+            if feature_group not in self.feature_groups and query.get('features') is None:
+                raise ValueError(f"Unknown feature group {feature_group}")
+            results = self.find_similar_players(
+                player_name=query['player_name'],
+                feature_group=feature_group,
+                k=query.get('k', 5),
+                season=query.get('season'),
+                exact=query.get('exact', True),
+                probes=query.get('probes'),
+                ef=query.get('ef'),
+                engine=query.get('engine'),
+                features=query.get('features'),
+                weights=query.get('weights')
+            )
+            return {'query': query, 'results': results}
+        except (KeyError, TypeError, ValueError, GroupUnavailableError) as e:  # TypeError -> e.g. probes='x'
+            return {'query': query, 'error': f"Missing field {e}" if isinstance(e, KeyError) else str(e)}
+
+    # a chunk of batch queries -> brute force ones the knn table can't answer go through one query_batch call
+    # per (group, k), everything else (and any query that fails to resolve) goes through run_query one by one
+    def run_queries(self, queries):
+        results = [None] * len(queries)
+        batched = {}
+        for i, query in enumerate(queries):
+            group = query.get('feature_group', 'scoring')
+            try:
+                if group not in self.feature_groups or 'player_name' not in query or \
+                        query.get('features') is not None or query.get('weights') is not None or \
+                        not isinstance(query.get('k', 5), int):
+                    raise ValueError  # custom searches (and bad k, reported by run_query) go one by one
+                self.ensure_group(group)
+                engine = self.resolve_engine(group, query.get('exact', True), query.get('engine'), len(queries))
+                row = self.find_player_row(query['player_name'], query.get('season'))
+            except (ValueError, GroupUnavailableError):
+                engine = None
+            if engine != 'brute' or self.table_applies(group, query.get('k', 5), query.get('engine'),
+                                                       exact=query.get('exact', True)):
+                results[i] = self.run_query(query)
+                continue
+            batched.setdefault((group, query.get('k', 5)), []).append((i, row))
+
+        for (group, k), items in batched.items():
+            rows = np.array([row for _, row in items])
+            masks = np.repeat(self.active[None, :], len(rows), axis=0)
+            for j, row in enumerate(rows):  # leave out each target's own seasons
+                masks[j, self.name_rows[self.names[row]]] = False
+            found, dists = self.group_index(group, 'brute').query_batch(self.group_points(group, rows), k, masks)
+            for (i, _), found_rows, found_dists in zip(items, found, dists):
+                results[i] = {'query': queries[i], 'results': [
+                    self.describe_row(group, r, float(d)) for r, d in zip(found_rows, found_dists) if r >= 0
+                ]}
+        return results
+
+
+def _run_batch_chunk(queries):  # runs inside a forked worker
+    return _batch_sim.run_queries(queries)
+
+
+def _timed_build(group, points, player_ids, codes, alive, lsh=None):  # always with the knn table
+    start = time.perf_counter()
+    models = NBAPlayerSimilarity.build_group_models(points, player_ids, codes, alive, lsh)
+    return group, models, time.perf_counter() - start
+
+
+def _build_group_shared(group):  # runs inside a forked worker, returns where the index arrays were written
+    group, models, seconds = _timed_build(group, *_build_inputs[group])
+    kd_tree, ann_index, _, _ = models
+    arrays = {f'{kind}.{name}': array for kind, model in zip(('kd', 'ann', 'brute', 'table'), models)
+              for name, array in model.get_state().items()}
+    path = snapshot.shared_temp_dir()
+    snapshot.save_arrays(path, arrays)
+    settings = {'dimensions': kd_tree.dimensions, 'leaf_size': kd_tree.leaf_size, 'probes': ann_index.num_probes,
+                'seed': ann_index.seed}
+    return group, path, sorted(arrays), settings, seconds
+
 
-            similar_players.append({
-                'player': current_player['PLAYER_NAME'],
-                'season': current_player['SEASON'],
-                'distance': distance,
-                'raw_stats': self.feature_data[feature_group]['raw'][player_id],
-                'norm_stats': dict(zip(features, target_point))
-            })
-
-            if len(similar_players) >= k:
-                break
-
-        # ensure that k nearest neighbors are actually outputted in the event that original loop yields < k neighbors
-        if len(similar_players) < k:
-            remaining = k - len(similar_players)
-            # go only as many times as we are missing players to fill knn
-            extra_results = self.kd_trees[feature_group].find_nearest_neighbors(target_point, k + remaining) if exact \
-                else self.ann_indices[feature_group].query(target_point, k + remaining)
-
-            for distance, player_id, target_point in extra_results:
-                if len(similar_players) >= k:
-                    break
-                current_player = self.player_info[self.player_info['player_id'] == player_id].iloc[0]
-                if current_player['PLAYER_NAME'] != target_name:
-                    similar_players.append({
-                        'player': current_player['PLAYER_NAME'],
-                        'season': current_player['SEASON'],
-                        'distance': distance,
-                        'raw_stats': self.feature_data[feature_group]['raw'][player_id],
-                        'norm_stats': dict(zip(features, target_point))
-                    })
-
-        # in the event that > k players are compiled, only return the top k
-        return similar_players[:k]
+def _models_from_arrays(arrays, settings):  # (kd, ann, brute, table) around memory mapped arrays
+    def state(kind):
+        return {name[len(kind) + 1:]: array for name, array in arrays.items() if name.startswith(kind + '.')}
+    brute_index = BruteForceSearch.from_state(state('brute'))
+    return (KDTree.from_state(settings['dimensions'], state('kd'), settings['leaf_size']),
+            ANNSearch.from_state(state('ann'), settings['probes'], settings['seed']),
+            brute_index,
+            KNNTable.from_state(state('table'), brute_index))
@@ -0,0 +1,95 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+# production style serving instead of the flask dev server (python flask_app.py):
+# the indexes are built/loaded once in this process, then N workers are forked and share them copy on write
+# (snapshot arrays are memory mapped on top of that, so their pages sit in the os page cache once for everyone)
+# every worker accepts on the same listening socket with a threaded wsgi server, the kernel spreads connections
+def main():
+    parser = argparse.ArgumentParser(description="serve the similarity api from several worker processes")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--access-log', action='store_true', help="log every request (slow under load)")
+    args = parser.parse_args()
+
+    import flask_app  # loads the stats (and the snapshot if there is one) before anything is forked
+    if flask_app.nba_sim is None:
+        sys.exit(f"nba sim failed to initialize ({flask_app.init_error}), not serving")
+    if args.workers > 1 and flask_app.ENABLE_UPDATES:
+        # an update would only reach the worker that got the request, the others would keep serving old stats
+        print("live updates (/api/rows) are disabled with more than one worker", file=sys.stderr)
+        flask_app.ENABLE_UPDATES = False
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    if args.workers <= 1 or not hasattr(os, 'fork'):  # no fork on windows -> one threaded process
+        serve(listener, flask_app.app, args)
+        return
+
+    # lazily built groups have to be finished first: forked workers would each build their own copy, and a
+    # group lock held by the warmup thread at fork time would never be released in them
+    flask_app.nba_sim.wait_for_warmup()
+
+    # objects that exist now are never collected anyway, freezing them keeps the gc from writing to
+    # (and so copying) every inherited page in every worker
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        workers.add(spawn(listener, flask_app.app, args))
+    print(f"serving on {args.host}:{args.port} with {args.workers} workers (pid {os.getpid()})", file=sys.stderr)
+
+    while workers:
+        pid, _ = os.wait()
+        workers.discard(pid)
+        if not stopping:  # a worker died -> replace it
+            workers.add(spawn(listener, flask_app.app, args))
+    listener.close()
+
+
+def spawn(listener, app, args):
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent forwards ctrl+c as SIGTERM
+    try:
+        serve(listener, app, args)
+    finally:
+        os._exit(0)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):  # errors are still logged
+        pass
+
+
+def serve(listener, app, args):
+    handler = WSGIRequestHandler if args.access_log else QuietRequestHandler
+    server = make_server(args.host, args.port, app, threaded=True, request_handler=handler, fd=listener.fileno())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
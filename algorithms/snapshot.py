@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+SNAPSHOT_VERSION = 5
+
+
+# sha256 of the source csv -> a snapshot is only reused if it was built from the exact same file
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# each snapshot lives in its own folder named after the csv checksum, one .npy per array plus manifest.json
+def snapshot_path(snapshot_dir, checksum):
+    return os.path.join(snapshot_dir, checksum[:16])
+
+
+def save_snapshot(snapshot_dir, checksum, arrays, meta):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    final_path = snapshot_path(snapshot_dir, checksum)
+
+    # write everything to a temp folder first and rename it into place so other workers never see half a snapshot
+    tmp_path = tempfile.mkdtemp(dir=snapshot_dir, prefix='.tmp-')
+    try:
+        save_arrays(tmp_path, arrays)
+        manifest = dict(meta, version=SNAPSHOT_VERSION, checksum=checksum, arrays=sorted(arrays))
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        replace_dir(tmp_path, final_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)  # only still there if it failed or wasn't needed
+
+    # old snapshots from previous versions of the csv are no longer needed
+    for entry in os.listdir(snapshot_dir):
+        old_path = os.path.join(snapshot_dir, entry)
+        if old_path != final_path and not entry.startswith('.') and os.path.isdir(old_path):
+            shutil.rmtree(old_path, ignore_errors=True)
+    return final_path
+
+
+# renames new_path to path, a snapshot already at path (e.g. the same csv saved again once the knn tables or hnsw
+# graphs are built) is renamed aside first and removed after, processes that mapped its arrays keep them. if the
+# snapshot there has the same manifest another process just wrote it and new_path is left alone
+def replace_dir(new_path, path, attempts=5):
+    old_paths = []
+    try:
+        for _ in range(attempts):
+            try:
+                os.rename(new_path, path)
+                return
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+            if read_manifest(path) == read_manifest(new_path):
+                return
+            old_paths.append(tempfile.mkdtemp(dir=os.path.dirname(path), prefix='.old-'))
+            try:
+                os.rename(path, os.path.join(old_paths[-1], 'snapshot'))
+            except FileNotFoundError:  # another process moved it aside first
+                pass
+        os.rename(new_path, path)  # still losing the race after attempts -> raise
+    finally:
+        for old_path in old_paths:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_manifest(path):  # None if there is none (yet) or it can't be read
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# returns (manifest, arrays) with every array memory mapped read only, or None if there is no usable snapshot
+def load_snapshot(snapshot_dir, checksum):
+    path = snapshot_path(snapshot_dir, checksum)
+    manifest_file = os.path.join(path, 'manifest.json')
+    if not os.path.isfile(manifest_file):
+        return None
+
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_VERSION or manifest.get('checksum') != checksum:
+        return None
+
+    return manifest, load_arrays(path, manifest['arrays'])
+
+
+def save_arrays(path, arrays):  # one .npy per array
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def load_arrays(path, names):
+    # mmap -> pages come straight from the os page cache and are shared between worker processes
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+
+
+# hands arrays from one process to another without pickling: the sender writes them to a temp folder in
+# shared memory (/dev/shm where available) and the receiver maps them, once mapped the files can be deleted
+def shared_temp_dir():
+    return tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None, prefix='nba-')
+
+
+def receive_arrays(path, names):
+    arrays = load_arrays(path, names)
+    shutil.rmtree(path, ignore_errors=True)  # the mappings stay valid until the arrays are garbage collected
+    return arrays
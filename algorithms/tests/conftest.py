@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the modules import each other flat (from kdTree import KDTree), so the tests run with algorithms/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# small generated playerstats.csv for the NBAPlayerSimilarity tests: every stat the feature groups use, random
+# values, players with one to four consecutive seasons
+STATS = ['PTS', 'FG_PCT', 'FG3_PCT', 'FT_PCT', 'TS_PCT', 'USG_PCT', 'FGA', 'FG3A', 'AST_PCT', 'FTA', 'PACE',
+         'E_TOV_PCT', 'STL', 'BLK', 'DREB', 'DEF_WS', 'DEF_RATING', 'PF', 'REB', 'AST', 'OFF_RATING', 'PLUS_MINUS']
+
+
+def season_name(year):
+    return f'{year}-{str(year + 1)[-2:]}'
+
+
+def make_rows(rng, count):  # count player-seasons, 1-4 seasons per player
+    rows = []
+    while len(rows) < count:
+        name = f'Player {len(rows):03d}'
+        start = int(rng.integers(2010, 2018))
+        for year in range(start, start + int(rng.integers(1, 5))):
+            rows.append(dict(zip(STATS, rng.random(len(STATS)) * 30), PLAYER_NAME=name, SEASON=season_name(year)))
+    return pd.DataFrame(rows[:count])
+
+
+@pytest.fixture
+def stats_csv(tmp_path):
+    path = tmp_path / 'playerstats.csv'
+    make_rows(np.random.default_rng(0), 400).to_csv(path, index=False)
+    return str(path)
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from ann import ANNSearch
+
+D = 5
+K = 10
+ATOL = 1e-5  # the index keeps float32 points, the oracle works in float64
+ID_OFFSET = 1000  # player ids != rows, so mixing them up fails
+
+
+def clustered(rng, n=3000):  # stat vectors bunch up around player types, uniform data would flatter lsh
+    centers = rng.random((30, D))
+    return np.clip(centers[rng.integers(0, 30, n)] + rng.normal(0, 0.08, (n, D)), 0, 1)
+
+
+def build(points, **settings):
+    index = ANNSearch(D, seed=0, **settings)
+    index.build_index(points, np.arange(len(points)) + ID_OFFSET)
+    return index
+
+
+# one key per point per table the slow way: one dot product per plane through the mean of the indexed points,
+# bit i set if the point is above plane i
+def oracle_keys(index, indexed, points):
+    center = indexed.astype(np.float32).mean(axis=0, dtype=np.float64)
+    keys = np.zeros((len(points), index.num_tables), dtype=np.int64)
+    for row, point in enumerate(points):
+        for table, planes in enumerate(index.random_planes):
+            keys[row, table] = sum(1 << bit for bit, plane in enumerate(planes) if np.dot(point - center, plane) > 0)
+    return keys
+
+
+def test_buckets_hold_exactly_the_points_with_their_key():
+    points = clustered(np.random.default_rng(0), 500)
+    index = build(points, num_tables=4, hash_size=6)
+    keys = oracle_keys(index, points, points.astype(np.float32))
+    for table in range(index.num_tables):
+        assert (np.diff(index.bucket_keys[table]) > 0).all()
+        assert set(index.bucket_keys[table].tolist()) == set(keys[:, table].tolist())
+        for key in index.bucket_keys[table].tolist():
+            assert sorted(index._bucket(table, key).tolist()) == np.flatnonzero(keys[:, table] == key).tolist()
+    assert not len(index._bucket(0, 1 << 6))  # no point can have a key past hash_size bits
+
+
+# lsh only compares the points sharing a bucket with the target, among those the ranking has to be exact
+@pytest.mark.parametrize('masked', [False, True])
+def test_query_ranks_its_candidates_exactly(masked):
+    rng = np.random.default_rng(1)
+    points = clustered(rng, 800)
+    index = build(points, num_tables=6, hash_size=6)
+    keys = oracle_keys(index, points, points.astype(np.float32))
+    mask = rng.random(len(points)) > 0.3 if masked else None
+    for target in list(rng.random((20, D))) + list(points[rng.choice(len(points), 20)]):
+        target_keys = oracle_keys(index, points, [target])[0]
+        candidates = np.flatnonzero((keys == target_keys).any(axis=1))
+        stats = {}
+        results = index.query(target, K, stats=stats, mask=mask)
+        assert stats['candidates'] == len(candidates) and stats['buckets_probed'] == index.num_tables
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        dists = np.linalg.norm(points[candidates].astype(np.float32) - target, axis=1)
+        np.testing.assert_allclose([distance for distance, _, _ in results], np.sort(dists)[:K], rtol=0, atol=ATOL)
+        for distance, player_id, _ in results:
+            assert player_id - ID_OFFSET in candidates
+            assert abs(distance - np.linalg.norm(points[player_id - ID_OFFSET] - target)) < ATOL
+
+
+def recall(index, points, targets, k=K, **query_args):  # share of the exact top k found, ties count as found
+    hits = 0
+    for target in targets:
+        kth = np.sort(np.linalg.norm(points - target, axis=1))[k - 1]
+        hits += sum(distance <= kth + ATOL for distance, _, _ in index.query(target, k, **query_args))
+    return hits / (k * len(targets))
+
+
+def test_default_settings_recall():
+    rng = np.random.default_rng(2)
+    points = clustered(rng)
+    index = build(points)  # num_tables=10, hash_size=8 like NBAPlayerSimilarity.LSH_DEFAULTS
+    assert recall(index, points, rng.random((100, D))) >= 0.9
+
+
+def test_saved_state_answers_the_same():
+    rng = np.random.default_rng(3)
+    points = clustered(rng, 1000)
+    index = build(points, num_tables=8, hash_size=6)
+    index.delete(np.arange(0, 1000, 7))
+    index.insert(rng.random((20, D)), np.arange(1000, 1020) + ID_OFFSET)
+    loaded = ANNSearch.from_state({name: np.array(array) for name, array in index.get_state().items()})
+    for target in rng.random((20, D)):
+        expected = [(distance, player_id) for distance, player_id, _ in index.query(target, K)]
+        assert [(distance, player_id) for distance, player_id, _ in loaded.query(target, K)] == expected
+
+
+# every perturbation of every table scored the slow way (all subsets of bits, score = sum of the flipped bits'
+# |projection|) -> the probes best scores, the probe sequence has to visit exactly those, best first
+def best_perturbations(index, target, probes):
+    projections = np.einsum('d,thd->th', target - index.center, index.random_planes)
+    scored = []
+    for table in range(index.num_tables):
+        for flips in range(1, 1 << index.hash_size):
+            bits = [bit for bit in range(index.hash_size) if flips >> bit & 1]
+            scored.append((np.abs(projections[table, bits]).sum(), table, flips))
+    return sorted(scored)[:probes], projections
+
+
+@pytest.mark.parametrize('probes', [1, 5, 40])
+def test_probe_sequence_visits_the_closest_buckets_first(probes):
+    rng = np.random.default_rng(4)
+    index = build(clustered(rng, 500), num_tables=3, hash_size=5)
+    for target in rng.random((10, D)):
+        expected, projections = best_perturbations(index, target, probes)
+        target_keys = (projections > 0).astype(np.int64) @ index.bit_weights
+        probed = list(index._probe_sequence(projections, target_keys, probes))
+        assert len(probed) == probes and len(set(probed)) == probes
+        scores = []
+        for table, key in probed:
+            flipped = [bit for bit in range(index.hash_size) if (key ^ target_keys[table]) >> bit & 1]
+            scores.append(np.abs(projections[table, flipped]).sum())
+        # ties between perturbations may come in either order, the scores may not
+        np.testing.assert_allclose(scores, [score for score, _, _ in expected], rtol=1e-9)
+
+
+def test_more_probes_only_add_candidates():
+    rng = np.random.default_rng(5)
+    points = clustered(rng)
+    index = build(points, num_tables=4, hash_size=8)
+    targets = rng.random((50, D))
+    for target in targets:
+        seen = None
+        for probes in (0, 5, 20):
+            stats = {}
+            index.query(target, K, probes=probes, stats=stats)
+            found = set(index._candidates(target, probes, None, None).tolist())
+            assert stats['buckets_probed'] == index.num_tables + probes and stats['candidates'] == len(found)
+            assert seen is None or seen <= found
+            seen = found
+    # multi-probe makes up for fewer tables: 4 tables reach the recall of the 10 table default
+    assert recall(index, points, targets, probes=20) >= max(recall(index, points, targets) + 0.1, 0.9)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from bruteForce import BruteForceSearch
+from playerSimilarity import NBAPlayerSimilarity
+
+D = 5
+K = 10
+ATOL = 1e-5  # the index keeps float32 points, the oracle works in float64
+ID_OFFSET = 1000  # player ids != rows, so mixing them up fails
+
+
+def build(points, block_size=37):  # small blocks so the running shortlist is merged many times
+    index = BruteForceSearch(D, block_size=block_size)
+    index.build_index(points, np.arange(len(points)) + ID_OFFSET)
+    return index
+
+
+def oracle(points, target, k, mask=None):  # sorted distances of the exact top k among the allowed rows
+    allowed = np.arange(len(points)) if mask is None else np.flatnonzero(mask)
+    return np.sort(np.linalg.norm(points[allowed].astype(np.float32).astype(np.float64) - target, axis=1))[:k]
+
+
+# offset -> points far from the origin, where |p|^2 - 2 p.t + |t|^2 in float32 loses the small distances to
+# cancellation and only the exact re-rank gets the order right
+@pytest.mark.parametrize('offset', [0, 50])
+def test_query_batch_matches_oracle(offset):
+    rng = np.random.default_rng(offset)
+    points = rng.random((1000, D)) + offset
+    points[-20:] = points[:20]  # duplicates -> distance ties
+    index = build(points)
+    targets = np.vstack((rng.random((20, D)) + offset, points[rng.choice(1000, 20)]))
+    masks = rng.random((len(targets), len(points))) > 0.5
+    masks[0] = False
+    masks[0, :4] = True  # fewer allowed rows than k
+    for m in (None, masks):
+        rows, dists = index.query_batch(targets, K, m)
+        assert rows.shape == dists.shape == (len(targets), K)
+        for i, target in enumerate(targets):
+            expected = oracle(points, target, K, None if m is None else m[i])
+            found = rows[i][rows[i] >= 0]
+            assert len(found) == len(expected) and len(set(found.tolist())) == len(found)
+            assert np.isinf(dists[i][len(found):]).all()
+            np.testing.assert_allclose(dists[i][:len(found)], expected, rtol=0, atol=ATOL)
+            np.testing.assert_allclose(np.linalg.norm(points[found] - target, axis=1), expected, rtol=0, atol=ATOL)
+            assert m is None or m[i][found].all()
+
+
+def test_query_matches_query_batch_and_skips_deleted_rows():
+    rng = np.random.default_rng(1)
+    points = rng.random((500, D))
+    index = build(points)
+    deleted = rng.choice(500, 100, replace=False)
+    index.delete(deleted)
+    alive = np.ones(500, dtype=bool)
+    alive[deleted] = False
+    targets = rng.random((10, D))
+    rows, dists = index.query_batch(targets, K)
+    for i, target in enumerate(targets):
+        results = index.query(target, K)
+        assert [player_id - ID_OFFSET for _, player_id, _ in results] == rows[i].tolist()
+        np.testing.assert_allclose([distance for distance, _, _ in results], oracle(points, target, K, alive),
+                                   rtol=0, atol=ATOL)
+    assert len(index.query(targets[0], 1000)) == 400
+
+
+# crossover thresholds shrunk to the 400 row test csv, scoring has 6 stats -> brute force up to
+# BRUTE_FORCE_MAX_POINTS * 2 ** 3 rows (twice that for batches)
+@pytest.mark.parametrize('max_points,lsh_min,exact,batch,expected', [
+    (50, 10 ** 6, True, 1, 'brute'), (49, 10 ** 6, True, 1, 'kdtree'), (49, 10 ** 6, False, 1, 'hnsw'),
+    (49, 10 ** 6, True, 8, 'brute'), (24, 10 ** 6, True, 8, 'kdtree'), (50, 400, False, 1, 'lsh'),
+    (50, 400, True, 1, 'brute')
+])
+def test_auto_engine_choice(stats_csv, monkeypatch, max_points, lsh_min, exact, batch, expected):
+    sim = NBAPlayerSimilarity(stats_csv)
+    monkeypatch.setattr(sim, 'BRUTE_FORCE_MAX_POINTS', max_points)
+    monkeypatch.setattr(sim, 'LSH_MIN_POINTS', lsh_min)
+    assert sim.resolve_engine('scoring', exact, 'auto', batch_size=batch) == expected
+    assert sim.resolve_engine('scoring', exact) == ('kdtree' if exact else 'lsh')
+    with pytest.raises(ValueError):
+        sim.resolve_engine('scoring', exact, 'faiss')
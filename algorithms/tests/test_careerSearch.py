@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from careerSearch import CareerSearch
+
+D = 3
+RTOL = 1e-9  # everything is float64, only the order of the sums differs
+
+
+def naive_dtw(a, b, band):  # textbook dp over (season of a, season of b) with |i - j| <= band
+    m = len(a)
+    cost = np.full((m + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    for i in range(1, m + 1):
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            cost[i, j] = ((a[i - 1] - b[j - 1]) ** 2).sum() + min(cost[i - 1, j], cost[i, j - 1], cost[i - 1, j - 1])
+    return cost[m, m]
+
+
+def make_careers(players=150, max_length=9, seed=0):  # careers of 1..max_length seasons over one stats matrix
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, max_length + 1, players)
+    rows = np.arange(lengths.sum())
+    rng.shuffle(rows)  # a career's rows aren't contiguous in the data
+    careers = np.split(rows, np.cumsum(lengths)[:-1])
+    points = rng.random((len(rows), D))
+    # a few careers that copy another career's stats (ties) or trail it by one season (dtw finds those)
+    for source, copy in rng.choice(players, (8, 2), replace=False).tolist():
+        shared = min(len(careers[source]), len(careers[copy]))
+        points[careers[copy][:shared]] = points[careers[source][:shared]]
+    return careers, points
+
+
+@pytest.mark.parametrize('band', [0, 1, 2, 4])
+def test_dtw_matches_naive(band):
+    rng = np.random.default_rng(band)
+    target, points = rng.random((5, D)), rng.random((30, 5, D))
+    band = min(band, len(target) - 1)
+    expected = [naive_dtw(target, candidate, band) for candidate in points]
+    np.testing.assert_allclose(CareerSearch.dtw(target, points, band), expected, rtol=RTOL)
+
+
+def test_dtw_early_abandon_only_drops_costs_past_the_limit():
+    rng = np.random.default_rng(1)
+    target, points = rng.random((6, D)), rng.random((50, 6, D))
+    expected = np.array([naive_dtw(target, candidate, 2) for candidate in points])
+    limit = np.median(expected)
+    stats = {}
+    costs = CareerSearch.dtw(target, points, 2, limit, stats)
+    kept = np.isfinite(costs)
+    np.testing.assert_allclose(costs[kept], expected[kept], rtol=RTOL)
+    assert (expected[~kept] >= limit).all()
+    assert stats['abandoned'] == (~kept).sum() > 0
+
+
+@pytest.mark.parametrize('band', [0, 1, 2, 3])
+def test_lower_bounds_never_exceed_the_cost(band):
+    rng = np.random.default_rng(10 + band)
+    target, points = rng.random((6, D)), rng.random((200, 6, D))
+    points[:20] = target + rng.normal(0, 0.02, (20, 6, D))  # close ones, where the bound is tight
+    bounds = CareerSearch.lower_bounds(target, points, band)
+    costs = np.array([naive_dtw(target, candidate, band) for candidate in points])
+    assert (bounds <= costs * (1 + RTOL)).all()
+    if band == 0:  # exact aligned cost
+        np.testing.assert_allclose(bounds, ((points - target) ** 2).sum(axis=(1, 2)), rtol=RTOL)
+
+
+# query against an exhaustive search: every career with the seasons (and every compared season allowed by the
+# mask), its exact cost, top k. with ties the search may return other careers than the oracle, so the
+# distances have to match and every returned career has to really be at its distance
+@pytest.mark.parametrize('start,length,band,k,masked', [
+    (0, 1, 0, 5, False), (0, 4, 0, 5, False), (2, 3, 0, 10, True),
+    (0, 4, 1, 5, False), (1, 5, 2, 8, True), (0, 6, 3, 3, False), (0, 3, 1, 500, False)
+])
+def test_query_matches_exhaustive_search(start, length, band, k, masked):
+    careers, points = make_careers(seed=start * 10 + length)
+    search = CareerSearch(careers, block_size=16)
+    mask = np.random.default_rng(band).random(len(points)) > 0.1 if masked else None
+    target_career = next(i for i, rows in enumerate(careers) if len(rows) >= start + length)
+    target = points[careers[target_career][start:start + length]]
+
+    stats = {}
+    found = search.query(target, lambda rows: points[rows], k, start, band, mask, stats)
+
+    candidates = [i for i, rows in enumerate(careers) if len(rows) >= start + length and
+                  (mask is None or mask[rows[start:start + length]].all())]
+    costs = {i: naive_dtw(target, points[careers[i][start:start + length]], band) for i in candidates}
+    expected = np.sqrt(np.sort(list(costs.values()))[:k] / length)
+    np.testing.assert_allclose([distance for distance, _, _ in found], expected, rtol=1e-7, atol=1e-12)
+    for distance, career, rows in found:
+        assert career in costs and len({c for _, c, _ in found}) == len(found)
+        np.testing.assert_array_equal(rows, careers[career][start:start + length])
+        assert np.isclose(distance, np.sqrt(costs[career] / length), rtol=1e-7, atol=1e-12)
+    assert stats['candidates'] == len(candidates)
+    assert stats['compared'] + stats['pruned'] == len(candidates)
+
+
+def test_query_prunes_with_dtw():
+    careers, points = make_careers(players=400, seed=7)
+    search = CareerSearch(careers, block_size=16)
+    target = points[careers[next(i for i, rows in enumerate(careers) if len(rows) >= 5)][:5]]
+    stats = {}
+    search.query(target, lambda rows: points[rows], 5, 0, 2, None, stats)
+    assert stats['pruned'] > 0
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from hnsw import HNSWIndex
+
+D = 5
+K = 10
+ATOL = 1e-5  # the index keeps float32 points, the oracle works in float64
+ID_OFFSET = 1000  # player ids != rows, so mixing them up fails
+
+
+def clustered(rng, n=4000, dims=D):  # stat vectors bunch up around player types
+    centers = rng.random((40, dims))
+    return np.clip(centers[rng.integers(0, 40, n)] + rng.normal(0, 0.08, (n, dims)), 0, 1)
+
+
+def build(points, **settings):
+    index = HNSWIndex(points.shape[1], **settings)
+    index.build_index(points, np.arange(len(points)) + ID_OFFSET)
+    return index
+
+
+# share of the exact top k (among the mask's rows) found, ties count as found, and every result checked: an
+# allowed row at its true distance, nearest first, no repeats
+def recall(index, points, targets, k=K, mask=None, **query_args):
+    allowed = np.arange(len(points)) if mask is None else np.flatnonzero(mask)
+    hits = 0
+    for target in targets:
+        kth = np.sort(np.linalg.norm(points[allowed] - target, axis=1))[min(k, len(allowed)) - 1]
+        results = index.query(target, k, mask=mask, **query_args)
+        rows = [int(player_id) - ID_OFFSET for _, player_id, _ in results]
+        dists = [distance for distance, _, _ in results]
+        assert len(results) == min(k, len(allowed)) and len(set(rows)) == len(rows) and dists == sorted(dists)
+        assert mask is None or mask[rows].all()
+        np.testing.assert_allclose(dists, np.linalg.norm(points[rows] - target, axis=1), rtol=0, atol=ATOL)
+        hits += sum(distance <= kth + ATOL for distance in dists)
+    return hits / (min(k, len(allowed)) * len(targets))
+
+
+@pytest.mark.parametrize('dims', [3, 5, 7])
+def test_recall_against_brute_force(dims):
+    rng = np.random.default_rng(dims)
+    points = clustered(rng, dims=dims)
+    index = build(points)
+    targets = np.vstack((rng.random((50, dims)), points[rng.choice(len(points), 50)]))
+    assert recall(index, points, targets, ef=64) >= 0.95
+    assert recall(index, points, targets, ef=200) >= recall(index, points, targets, ef=10)
+
+
+def reachable(links, entry):  # nodes a walk from entry can get to
+    seen = {entry}
+    stack = [entry]
+    while stack:
+        for node in links[stack.pop()].tolist():
+            if node >= 0 and node not in seen:
+                seen.add(node)
+                stack.append(node)
+    return seen
+
+
+# clusters much bigger than ef_construction -> nearest neighbour lists alone would never leave a cluster
+def test_graph_links_are_valid_and_connected():
+    rng = np.random.default_rng(1)
+    index = build(clustered(rng, 3000, dims=7)[np.argsort(rng.random(3000))], M=8, ef_construction=32)
+    links = index.links[:index.size]
+    assert ((links >= -1) & (links < index.size)).all()
+    assert not (links == np.arange(index.size)[:, None]).any()  # no self links
+    assert len(reachable(links, index.entry)) == index.size
+    for level, (slots, upper) in enumerate(zip(index.upper_slots, index.upper_links), 1):
+        nodes = np.array(sorted(slots))
+        assert (nodes == np.flatnonzero(index.levels[:index.size] >= level)).all()
+        assert upper.shape[1] == index.M and np.isin(upper[upper >= 0], nodes).all()
+        layer = np.full((index.size, index.M), -1)
+        layer[nodes] = upper[[slots[node] for node in nodes.tolist()]]
+        assert reachable(layer, index.entry) == set(nodes.tolist())
+    assert index.levels[index.entry] == index.max_level
+
+
+# big layers are wired from kd ordered windows instead of every pair, recall has to hold up
+def test_recall_with_windowed_wiring(monkeypatch):
+    rng = np.random.default_rng(2)
+    points = clustered(rng)
+    monkeypatch.setattr(HNSWIndex, 'EXACT_WIRING_MAX_POINTS', 500)
+    index = build(points)
+    assert recall(index, points, rng.random((100, D)), ef=64) >= 0.95
+
+
+def test_recall_after_incremental_inserts():
+    rng = np.random.default_rng(3)
+    points = clustered(rng, 2000)
+    index = build(points[:500])
+    for start in range(500, len(points), 500):  # most of the graph comes from inserts
+        index.insert(points[start:start + 500], np.arange(start, start + 500) + ID_OFFSET)
+    assert index.size == len(points)
+    assert recall(index, points, rng.random((100, D)), ef=64) >= 0.95
+
+
+# a very selective mask is scanned directly (exact), a looser one filters the graph walk
+@pytest.mark.parametrize('keep', [0.01, 0.5])
+def test_masked_queries(keep):
+    rng = np.random.default_rng(4)
+    points = clustered(rng)
+    index = build(points)
+    mask = rng.random(len(points)) < keep
+    hit_rate = recall(index, points, rng.random((50, D)), mask=mask, ef=64)
+    assert hit_rate == 1.0 if keep < 0.05 else hit_rate >= 0.95
+
+
+def test_saved_state_answers_the_same():
+    rng = np.random.default_rng(5)
+    points = clustered(rng, 2000)
+    index = build(points)
+    index.delete(np.arange(0, 2000, 9))
+    index.insert(rng.random((50, D)), np.arange(2000, 2050) + ID_OFFSET)
+    loaded = HNSWIndex.from_state({name: np.array(array) for name, array in index.get_state().items()})
+    for target in rng.random((20, D)):
+        expected = [(distance, player_id) for distance, player_id, _ in index.query(target, K, ef=32)]
+        assert [(distance, player_id) for distance, player_id, _ in loaded.query(target, K, ef=32)] == expected
@@ -0,0 +1,120 @@
+import numpy as np
+
+from bruteForce import BruteForceSearch
+from knnTable import KNNTable
+
+K = 10
+ATOL = 1e-5  # the brute force index works in float32, the oracle in float64
+
+
+# synthetic player-seasons: a few seasons per player, some exact duplicates so there are distance ties
+def make_data(n=300, d=4, players=120, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, d)).astype(np.float32)
+    points[rng.choice(n, 20, replace=False)] = points[rng.choice(n, 20, replace=False)]
+    codes = rng.integers(0, players, n)
+    return points, codes
+
+
+def make_table(points, codes, alive=None):
+    index = BruteForceSearch(points.shape[1])
+    index.build_index(points, np.arange(len(points)))
+    if alive is not None:
+        index.delete(np.flatnonzero(~alive))
+    table = KNNTable(index, K)
+    table.build(codes, alive)
+    return index, table
+
+
+# every row's list against a numpy brute force oracle: same distances, and the listed rows are allowed and
+# really at those distances (with ties the table may pick other rows than np.sort would)
+def assert_matches_oracle(table, points, codes, alive):
+    points = points.astype(np.float64)
+    diff = points[:, None, :] - points[None, :, :]
+    dists = np.sqrt(np.einsum('ijd,ijd->ij', diff, diff))
+    for row in range(len(points)):
+        rows, found = table.neighbours(row, K)
+        if not alive[row]:
+            assert len(rows) == 0
+            continue
+        allowed = alive & (codes != codes[row])
+        expected = np.sort(dists[row, allowed])[:K]
+        assert len(rows) == len(expected) == len(np.unique(rows))
+        assert allowed[rows].all()
+        np.testing.assert_allclose(found, expected, rtol=0, atol=ATOL)
+        np.testing.assert_allclose(dists[row, rows], found, rtol=0, atol=ATOL)
+
+
+def test_build():
+    points, codes = make_data()
+    _, table = make_table(points, codes)
+    assert_matches_oracle(table, points, codes, np.ones(len(points), dtype=bool))
+
+
+def test_build_leaves_out_dead_rows():
+    points, codes = make_data(seed=1)
+    alive = np.random.default_rng(1).random(len(points)) > 0.2
+    _, table = make_table(points, codes, alive)
+    assert_matches_oracle(table, points, codes, alive)
+
+
+def test_update_moved_rows():
+    points, codes = make_data(seed=2)
+    index, table = make_table(points, codes)
+    rng = np.random.default_rng(2)
+    for _ in range(5):
+        rows = rng.choice(len(points), 8, replace=False)
+        points[rows[:4]] = rng.random((4, points.shape[1]))  # anywhere
+        points[rows[4:]] = points[rng.choice(len(points), 4)] + 1e-3  # right next to other rows
+        index.insert(points[rows], rows, rows)
+        table.update(rows, codes)
+        assert_matches_oracle(table, points, codes, np.ones(len(points), dtype=bool))
+
+
+def test_update_new_rows():
+    points, codes = make_data(seed=3)
+    index, table = make_table(points, codes)
+    rng = np.random.default_rng(3)
+    for _ in range(4):
+        new_points = rng.random((6, points.shape[1])).astype(np.float32)
+        new_points[0] = points[0]  # a tie with an existing row
+        new_rows = np.arange(len(points), len(points) + len(new_points))
+        new_codes = np.concatenate((rng.choice(codes, 3), codes.max() + 1 + np.arange(3)))  # old and new players
+        points, codes = np.concatenate((points, new_points)), np.concatenate((codes, new_codes))
+        index.insert(new_points, new_rows, new_rows)
+        table.update(new_rows, codes)
+        assert_matches_oracle(table, points, codes, np.ones(len(points), dtype=bool))
+
+
+def test_delete_and_reinsert():
+    points, codes = make_data(seed=4)
+    index, table = make_table(points, codes)
+    alive = np.ones(len(points), dtype=bool)
+    rng = np.random.default_rng(4)
+    for _ in range(4):
+        rows = rng.choice(np.flatnonzero(alive), 10, replace=False)
+        index.delete(rows)
+        table.delete(rows)
+        alive[rows] = False
+        assert_matches_oracle(table, points, codes, alive)
+
+    back = rng.choice(np.flatnonzero(~alive), 5, replace=False)
+    points[back] = rng.random((5, points.shape[1]))
+    index.insert(points[back], back, back)
+    table.update(back, codes)
+    alive[back] = True
+    assert_matches_oracle(table, points, codes, alive)
+
+
+def test_update_from_snapshot_arrays():  # read only (memory mapped) arrays are copied on the first change
+    points, codes = make_data(seed=5)
+    index, table = make_table(points, codes)
+    state = {name: array.copy() for name, array in table.get_state().items()}
+    for array in state.values():
+        array.flags.writeable = False
+    table = KNNTable.from_state(state, index)
+    rows = np.array([3, 7])
+    points[rows] = points[rows] + 0.05
+    index.insert(points[rows], rows, rows)
+    table.update(rows, codes)
+    assert_matches_oracle(table, points, codes, np.ones(len(points), dtype=bool))
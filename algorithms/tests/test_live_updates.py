@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+
+from ann import ANNSearch
+from bruteForce import BruteForceSearch
+from hnsw import HNSWIndex
+from kdTree import KDTree
+
+D = 5
+K = 10
+ATOL = 1e-5  # indexes keep float32 points, the oracle works in float64
+ID_OFFSET = 1000  # player ids != rows, so mixing them up fails
+
+
+def build(engine, points):
+    ids = np.arange(len(points)) + ID_OFFSET
+    if engine == 'kdtree':
+        index = KDTree(D, leaf_size=8)
+        index.build(points, ids)
+    elif engine == 'lsh':
+        index = ANNSearch(D, num_tables=12, hash_size=6, num_probes=4, seed=0)
+        index.build_index(points, ids)
+    else:
+        index = {'brute': BruteForceSearch, 'hnsw': HNSWIndex}[engine](D)
+        index.build_index(points, ids)
+    return index
+
+
+def query(index, engine, target, k, mask=None):
+    if engine == 'kdtree':
+        return index.find_nearest_neighbors(target, k, mask=mask)
+    if engine == 'hnsw':
+        return index.query(target, k, ef=64, mask=mask)
+    return index.query(target, k, mask=mask)
+
+
+# the same live updates on an index and on a row -> point dict (the oracle): deletes, updates of existing
+# rows (kd tree: delete + insert, the others replace on insert) and brand new rows, some of them exact
+# copies of live points so there are distance ties
+def apply_updates(index, engine, live, rng, rounds=3):
+    n = len(live)
+    for _ in range(rounds):
+        rows = np.array(sorted(live))
+        deleted = rng.choice(rows, 40, replace=False)
+        index.delete(deleted)
+        for row in deleted.tolist():
+            del live[row]
+
+        rows = np.array(sorted(live))
+        updated = rng.choice(rows, 40, replace=False)
+        new = np.arange(n, n + 40)
+        n += 40
+        changed = np.concatenate((updated, new))
+        points = rng.random((len(changed), D))
+        points[-5:] = [live[row] for row in rng.choice(rows, 5).tolist()]
+        if engine == 'kdtree':
+            index.delete(updated)
+        index.insert(points, changed + ID_OFFSET, changed)
+        for row, point in zip(changed.tolist(), points):
+            live[row] = point.astype(np.float32).astype(np.float64)
+    return n
+
+
+def oracle(live, target, k, mask=None):  # -> (rows, distances) of the exact top k, nearest first
+    rows = np.array([row for row in sorted(live) if mask is None or mask[row]])
+    points = np.array([live[row] for row in rows.tolist()])
+    dists = np.sqrt(((points - target) ** 2).sum(axis=1))
+    order = np.argsort(dists, kind='stable')[:k]
+    return rows[order], dists[order]
+
+
+# every result is a live row at its current point (no deleted or stale entries) and the list is sorted
+def check_results(results, live, target, mask=None):
+    dists = [distance for distance, _, _ in results]
+    assert dists == sorted(dists)
+    rows = [int(player_id) - ID_OFFSET for _, player_id, _ in results]
+    assert len(set(rows)) == len(rows)
+    for distance, row in zip(dists, rows):
+        assert row in live and (mask is None or mask[row])
+        assert abs(distance - np.linalg.norm(live[row] - target)) < ATOL
+    return rows
+
+
+def updated_index(engine, seed=0, n=1500):
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, D))
+    index = build(engine, points)
+    live = {row: point.astype(np.float32).astype(np.float64) for row, point in enumerate(points)}
+    total = apply_updates(index, engine, live, rng)
+    return index, live, total, rng
+
+
+@pytest.mark.parametrize('engine', ['kdtree', 'brute'])
+def test_exact_engines_match_oracle(engine):
+    index, live, total, rng = updated_index(engine)
+    mask = rng.random(total) > 0.5
+    for target in list(rng.random((30, D))) + [live[row] for row in rng.choice(sorted(live), 20).tolist()]:
+        for m in (None, mask):
+            results = query(index, engine, target, K, m)
+            check_results(results, live, target, m)
+            _, expected = oracle(live, target, K, m)
+            np.testing.assert_allclose([distance for distance, _, _ in results], expected, rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize('engine', ['kdtree', 'brute'])
+def test_exact_range_search_matches_oracle(engine):
+    index, live, total, rng = updated_index(engine, seed=1)
+    rows = np.array(sorted(live))
+    points = np.array([live[row] for row in rows.tolist()])
+    for target in rng.random((20, D)):
+        radius = 0.3
+        dists = np.sqrt(((points - target) ** 2).sum(axis=1))
+        found = check_results(index.range_search(target, radius), live, target)
+        # rows within float32 noise of the radius may go either way
+        assert set(rows[dists < radius - ATOL].tolist()) <= set(found) <= set(rows[dists <= radius + ATOL].tolist())
+        assert index.range_count(target, radius) == len(found)
+
+
+@pytest.mark.parametrize('engine', ['lsh', 'hnsw'])
+def test_approximate_engines_after_updates(engine):
+    index, live, total, rng = updated_index(engine, seed=2)
+    hits = expected_total = 0
+    for target in rng.random((50, D)):
+        results = query(index, engine, target, K)
+        rows = check_results(results, live, target)
+        expected, dists = oracle(live, target, K)
+        # any row at least as close as the k-th exact neighbour counts (ties)
+        hits += sum(np.linalg.norm(live[row] - target) <= dists[-1] + ATOL for row in rows)
+        expected_total += len(expected)
+    assert hits / expected_total >= 0.9
+
+
+@pytest.mark.parametrize('engine', ['lsh', 'hnsw'])
+def test_approximate_engines_find_inserted_and_drop_deleted(engine):
+    rng = np.random.default_rng(3)
+    points = rng.random((1500, D))
+    index = build(engine, points)
+    deleted = rng.choice(1500, 50, replace=False)
+    index.delete(deleted)
+    new_points = rng.random((50, D))
+    new_rows = np.arange(1500, 1550)
+    index.insert(new_points, new_rows + ID_OFFSET, new_rows)
+
+    # an inserted point hashes to the target's own bucket in every table (lsh) / is linked into the graph (hnsw)
+    found = [int(query(index, engine, point, 1)[0][1]) - ID_OFFSET for point in new_points]
+    assert found == new_rows.tolist()
+    for row in deleted.tolist():  # the deleted point itself is the closest thing to its old position
+        assert row + ID_OFFSET not in [player_id for _, player_id, _ in query(index, engine, points[row], K)]
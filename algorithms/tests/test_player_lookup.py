@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import STATS
+from playerSimilarity import NBAPlayerSimilarity
+
+
+# the lookup index against the pandas scans it replaced: a boolean mask over the csv rows per request
+def test_lookup_matches_pandas_scans(stats_csv):
+    df = pd.read_csv(stats_csv)
+    sim = NBAPlayerSimilarity(stats_csv)
+    for name, season in zip(df['PLAYER_NAME'], df['SEASON']):
+        expected = np.flatnonzero((df['PLAYER_NAME'] == name) & (df['SEASON'] == season))[0]
+        year = int(season[:4])
+        assert sim.find_player_row(name, season) == sim.find_player_row(name, year) == \
+            sim.find_player_row(name, str(year)) == expected
+        assert sim.id_rows[sim.player_ids[expected]] == expected
+        assert sim.names[expected] == name and sim.seasons[expected] == season and sim.season_years[expected] == year
+    for name in df['PLAYER_NAME'].unique():
+        rows = np.flatnonzero(df['PLAYER_NAME'] == name)
+        assert sim.name_rows[name].tolist() == rows.tolist()
+        assert sim.find_player_row(name) == rows[0]  # no season -> first listed one
+
+
+def test_unknown_players_and_seasons_raise(stats_csv):
+    sim = NBAPlayerSimilarity(stats_csv)
+    name = sim.names[0]
+    for player, season in [('Nobody', None), ('Nobody', 2015), (name, 1990), (name, '1990-91'), (name, 'x')]:
+        with pytest.raises(ValueError):
+            sim.find_player_row(player, season)
+
+
+# neighbours are hydrated by row: names, seasons and stats have to be the ones of that csv row
+def test_hydrated_rows_match_the_csv(stats_csv):
+    df = pd.read_csv(stats_csv)
+    sim = NBAPlayerSimilarity(stats_csv)
+    for result in sim.find_similar_players(df['PLAYER_NAME'][7], 'style', 20, df['SEASON'][7], engine='brute'):
+        row = df[(df['PLAYER_NAME'] == result['player']) & (df['SEASON'] == result['season'])].iloc[0]
+        expected = row[sim.feature_groups['style']].to_numpy(dtype=np.float32).tolist()
+        assert list(result['raw_stats'].values()) == expected
+
+
+def test_lookup_follows_live_updates(stats_csv):
+    sim = NBAPlayerSimilarity(stats_csv)
+    name, season = sim.names[0], sim.seasons[0]
+    seasons = [sim.seasons[row] for row in sim.name_rows[name]]
+    rows = [dict(dict.fromkeys(STATS, 1.0), PLAYER_NAME='New Player', SEASON='2019-20'),
+            dict(dict.fromkeys(STATS, 1.0), PLAYER_NAME=name, SEASON='2040-41')]
+    sim.upsert_rows(rows)
+    assert sim.names[sim.find_player_row('New Player', 2019)] == 'New Player'
+    assert sim.seasons[sim.find_player_row(name, 2040)] == '2040-41'
+    assert sim.find_player_row(name) == sim.name_rows[name][0]
+
+    sim.remove_rows(name, season)
+    with pytest.raises(ValueError):
+        sim.find_player_row(name, season)
+    assert [sim.seasons[row] for row in sim.name_rows[name]] == seasons[1:] + ['2040-41']
+    sim.remove_rows('New Player', 2019)
+    assert 'New Player' not in sim.name_rows and not sim.autocomplete('New Pl')
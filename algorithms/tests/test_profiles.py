@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from playerSimilarity import NBAPlayerSimilarity
+
+K = 5
+ATOL = 1e-5  # scaled points are float32, the oracle works in float64
+GROUPS = ['scoring', 'style', 'defense', 'traditional', 'impact']
+
+
+@pytest.fixture
+def sim(stats_csv):
+    return NBAPlayerSimilarity(stats_csv)
+
+
+# every group's distance from one row to every row, other players' seasons only (inf for the rest)
+def group_distances(sim, row, groups=GROUPS):
+    others = sim.names != sim.names[row]
+    distances = {}
+    for group in groups:
+        points = sim.group_points(group).astype(np.float64)
+        distances[group] = np.where(others, np.linalg.norm(points - points[row], axis=1), np.inf)
+    return distances
+
+
+def fused(sim, distances):  # sqrt of the mean over the groups of the squared distance per stat
+    return np.sqrt(np.mean([dists ** 2 / len(sim.feature_groups[group]) for group, dists in distances.items()],
+                           axis=0))
+
+
+@pytest.mark.parametrize('engine', [None, 'kdtree', 'brute'])
+def test_groups_match_single_group_searches(sim, engine):
+    for row in (0, 57, 200):
+        name, season = sim.names[row], sim.seasons[row]
+        profiles = sim.find_similar_profiles(name, GROUPS, K, season, engine=engine)
+        for group in GROUPS:
+            expected = sim.find_similar_players(name, group, K, season, engine=engine)
+            assert profiles['groups'][group]['engine'] == (engine or 'table')
+            assert [(r['player'], r['season']) for r in profiles['groups'][group]['results']] == \
+                [(r['player'], r['season']) for r in expected]
+            np.testing.assert_allclose([r['distance'] for r in profiles['groups'][group]['results']],
+                                       np.sort(group_distances(sim, row, [group])[group])[:K], rtol=0, atol=ATOL)
+
+
+@pytest.mark.parametrize('groups', [GROUPS, ['scoring', 'traditional'], ['impact']])
+def test_fused_distance_is_the_exact_top_k(sim, groups):
+    for row in (3, 120, 333):
+        distances = group_distances(sim, row, groups)
+        overall = fused(sim, distances)
+        found = sim.find_similar_profiles(sim.names[row], groups, K, sim.seasons[row], fuse='distance')['overall']
+        np.testing.assert_allclose([entry['distance'] for entry in found], np.sort(overall)[:K], rtol=0, atol=ATOL)
+        for entry in found:
+            other = sim.find_player_row(entry['player'], entry['season'])
+            assert abs(entry['distance'] - overall[other]) < ATOL
+            for group in groups:
+                assert abs(entry['distances'][group] - distances[group][other]) < ATOL
+
+
+def test_rank_fusion_matches_oracle(sim):
+    fetch = sim.KNN_TABLE_K
+    for row in (8, 99, 250):
+        distances = group_distances(sim, row)
+        rrf = np.zeros(len(sim.names))
+        for dists in distances.values():  # every group's top fetch list, 1 / (RRF_K + rank) per list a row is in
+            rrf[np.argsort(dists, kind='stable')[:fetch]] += 1 / (sim.RRF_K + np.arange(1, fetch + 1))
+        overall = fused(sim, distances)
+        listed = np.flatnonzero(rrf)
+        expected = listed[np.lexsort((listed, overall[listed], -rrf[listed]))][:K]
+        found = sim.find_similar_profiles(sim.names[row], GROUPS, K, sim.seasons[row], fuse='rank')['overall']
+        assert [sim.find_player_row(entry['player'], entry['season']) for entry in found] == expected.tolist()
+        np.testing.assert_allclose([entry['rrf'] for entry in found], rrf[expected])
+        np.testing.assert_allclose([entry['distance'] for entry in found], overall[expected], rtol=0, atol=ATOL)
+
+
+def test_bad_arguments_raise(sim):
+    name = sim.names[0]
+    with pytest.raises(ValueError):
+        sim.find_similar_profiles(name, ['scoring', 'passing'])
+    with pytest.raises(ValueError):
+        sim.find_similar_profiles(name, fuse='votes')
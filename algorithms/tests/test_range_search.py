@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from playerSimilarity import NBAPlayerSimilarity
+
+ATOL = 1e-5  # scaled points are float32, the oracle works in float64
+RADIUS = 0.5  # a handful of comparables per player-season in the generated csv
+
+
+@pytest.fixture
+def sim(stats_csv):
+    return NBAPlayerSimilarity(stats_csv)
+
+
+# other players' seasons within radius of one row, by distance -> (rows surely in, rows that may be in)
+# (rows within float32 noise of the radius may go either way)
+def oracle(sim, group, row, radius, season_range=(None, None)):
+    points = sim.group_points(group).astype(np.float64)
+    dists = np.linalg.norm(points - points[row], axis=1)
+    allowed = sim.names != sim.names[row]
+    first, last = season_range
+    if first is not None:
+        allowed &= sim.season_years >= first
+    if last is not None:
+        allowed &= sim.season_years <= last
+    return set(np.flatnonzero(allowed & (dists < radius - ATOL)).tolist()), \
+        set(np.flatnonzero(allowed & (dists <= radius + ATOL)).tolist()), dists
+
+
+def found_rows(sim, results):
+    return [sim.find_player_row(result['player'], result['season']) for result in results]
+
+
+@pytest.mark.parametrize('engine', ['kdtree', 'brute', 'sq8', 'pq'])
+@pytest.mark.parametrize('season_range', [(None, None), (2012, 2016)])
+def test_exact_engines_match_oracle(sim, engine, season_range):
+    rng = np.random.default_rng(0)
+    for row in rng.choice(len(sim.names), 25, replace=False).tolist():
+        for group in ('scoring', 'impact'):
+            sure, maybe, dists = oracle(sim, group, row, RADIUS, season_range)
+            found = sim.find_players_within(sim.names[row], group, RADIUS, sim.seasons[row], engine=engine,
+                                            season_range=season_range)
+            rows = found_rows(sim, found['results'])
+            assert sure <= set(rows) <= maybe and len(set(rows)) == len(rows) == found['total']
+            distances = [result['distance'] for result in found['results']]
+            assert distances == sorted(distances)
+            np.testing.assert_allclose(distances, dists[rows], rtol=0, atol=ATOL)
+            assert sim.count_players_within(sim.names[row], group, RADIUS, sim.seasons[row], engine=engine,
+                                            season_range=season_range) == found['total']
+
+
+def test_pages_slice_the_full_answer(sim):
+    name, season = sim.names[3], sim.seasons[3]
+    full = sim.find_players_within(name, 'traditional', 0.7, season, engine='kdtree')
+    assert full['total'] > 10
+    for offset, limit in [(0, 4), (4, 4), (full['total'] - 2, 10), (full['total'], 5)]:
+        page = sim.find_players_within(name, 'traditional', 0.7, season, engine='kdtree', offset=offset, limit=limit)
+        assert page['total'] == full['total'] and page['results'] == full['results'][offset:offset + limit]
+
+
+# approximate engines may miss rows but never return one outside the radius
+@pytest.mark.parametrize('engine,min_recall', [('hnsw', 0.95), ('lsh', 0.5)])
+def test_approximate_engines_stay_inside_the_radius(sim, engine, min_recall):
+    rng = np.random.default_rng(1)
+    hits = total = 0
+    for row in rng.choice(len(sim.names), 40, replace=False).tolist():
+        sure, maybe, dists = oracle(sim, 'scoring', row, RADIUS)
+        rows = found_rows(sim, sim.find_players_within(sim.names[row], 'scoring', RADIUS, sim.seasons[row],
+                                                       engine=engine)['results'])
+        assert set(rows) <= maybe
+        hits += len(sure & set(rows))
+        total += len(sure)
+    assert total and hits / total >= min_recall
+
+
+@pytest.mark.parametrize('engine', ['brute', 'kdtree'])
+def test_uniqueness_scores_match_oracle(sim, engine):
+    sim.remove_rows(sim.names[10], sim.seasons[10])
+    scores = sim.uniqueness_scores('defense', RADIUS, engine)
+    live = np.flatnonzero(sim.active)
+    assert len(scores) == len(live) and (scores['player'].to_numpy() == sim.names[live]).all()
+    points = sim.group_points('defense', live).astype(np.float64)
+    dists = np.linalg.norm(points[:, None] - points[None], axis=2)
+    others = sim.names[live][:, None] != sim.names[live][None, :]
+    low, high = ((others & (dists < RADIUS - ATOL)).sum(axis=1), (others & (dists <= RADIUS + ATOL)).sum(axis=1))
+    counts = scores['comparables'].to_numpy()
+    assert ((low <= counts) & (counts <= high)).all() and counts.any()
+    # share of the other rows with at least as many comparables
+    expected = [((counts >= count).sum() - 1) / (len(live) - 1) for count in counts]
+    np.testing.assert_allclose(scores['uniqueness'], expected)
+    assert sim.uniqueness_scores('defense', RADIUS, engine) is scores  # cached until the data changes
+    sim.remove_rows(sim.names[11], sim.seasons[11])
+    assert len(sim.uniqueness_scores('defense', RADIUS, engine)) == len(live) - 1
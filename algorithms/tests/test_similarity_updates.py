@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from conftest import STATS, season_name
+from playerSimilarity import NBAPlayerSimilarity
+from resultCache import ResultCache
+
+K = 5
+ATOL = 1e-5  # stats and scaled points are float32, the oracle works in float64
+EXACT = [('table', None), ('auto', 'auto'), ('kdtree', 'kdtree'), ('brute', 'brute')]
+APPROXIMATE = ['lsh', 'hnsw', 'sq8', 'pq']
+
+
+# the csv rows as the class should see them: (name, season) -> float32 stats, live rows only
+def live_rows(df):
+    return {(name, season): np.asarray(stats, dtype=np.float32)
+            for name, season, stats in zip(df['PLAYER_NAME'], df['SEASON'], df[STATS].to_numpy())}
+
+
+def bounds(live):  # min/max of the live rows, what a (re)build normalizes with
+    X = np.array(list(live.values()))
+    return X.min(axis=0).astype(float), X.max(axis=0).astype(float)
+
+
+# exact top k around (name, season) in one group: other players' live seasons only, scaled with the given
+# bounds like ColumnStore.scale -> (key -> distance of every candidate, sorted top k distances)
+def oracle(live, scale, sim, group, name, season, k):
+    low, high = scale
+    columns = [STATS.index(feat) for feat in sim.feature_groups[group]]
+    points = {key: ((stats - low) / (high - low + 1e-8)).astype(np.float32)[columns].astype(np.float64)
+              for key, stats in live.items()}
+    target = points[(name, season)]
+    dists = {key: float(np.linalg.norm(point - target)) for key, point in points.items() if key[0] != name}
+    return dists, sorted(dists.values())[:k]
+
+
+def check_engines(sim, live, scale, rng, targets=12):
+    keys = sorted(live)
+    recall = {engine: [0, 0] for engine in APPROXIMATE}
+    for i in rng.choice(len(keys), targets, replace=False).tolist():
+        name, season = keys[i]
+        for group in sim.feature_groups:
+            dists, expected = oracle(live, scale, sim, group, name, season, K)
+            for label, engine in EXACT + [(engine, engine) for engine in APPROXIMATE]:
+                results = sim.find_similar_players(name, group, K, season, exact=label not in APPROXIMATE,
+                                                   engine=engine)
+                found = [(result['player'], result['season']) for result in results]
+                # every result is a live other-player season at its current distance, nearest first
+                assert len(set(found)) == len(found)
+                assert all(key in dists for key in found), label
+                np.testing.assert_allclose([result['distance'] for result in results], [dists[key] for key in found],
+                                           rtol=0, atol=ATOL, err_msg=label)
+                assert [result['distance'] for result in results] == sorted(result['distance'] for result in results)
+                if label in APPROXIMATE:
+                    recall[label][0] += sum(dists[key] <= expected[-1] + ATOL for key in found)
+                    recall[label][1] += len(expected)
+                else:  # with ties another row at the same distance may come back, so distances are compared
+                    np.testing.assert_allclose([result['distance'] for result in results], expected, rtol=0,
+                                               atol=ATOL, err_msg=label)
+    for engine, (hits, total) in recall.items():
+        assert hits / total >= 0.8, engine
+
+
+# new stats kept inside the current bounds (mixes of two live rows), so upserts don't trigger a background rebuild
+def mixed_stats(rng, live):
+    keys = sorted(live)
+    a, b = (live[keys[i]] for i in rng.choice(len(keys), 2, replace=False))
+    return dict(zip(STATS, (a + rng.random() * (b - a)).tolist()))
+
+
+def test_updates_match_oracle_for_every_engine(stats_csv):
+    rng = np.random.default_rng(1)
+    sim = NBAPlayerSimilarity(stats_csv)
+    assert set(sim.knn_tables) == set(sim.feature_groups)
+    live = live_rows(pd.read_csv(stats_csv))
+    scale = bounds(live)
+    check_engines(sim, live, scale, rng)
+
+    keys = sorted(live)
+    changed = [keys[i] for i in rng.choice(len(keys), 15, replace=False)]  # new stats for existing seasons
+    changed += [(f'Rookie {i}', season_name(2020)) for i in range(6)]  # brand new players
+    names = sorted({name for name, _ in keys})
+    changed += [(names[i], season_name(2030)) for i in rng.choice(len(names), 4, replace=False)]  # new seasons
+    rows = [dict(mixed_stats(rng, live), PLAYER_NAME=name, SEASON=season) for name, season in changed]
+    rows[-1].update(zip(STATS, live[keys[0]].tolist()))  # an exact copy of another row -> distance ties
+    report = sim.upsert_rows(rows)
+    assert report == {'inserted': 10, 'updated': 15, 'rebuild': False}
+    for row in rows:
+        live[row['PLAYER_NAME'], row['SEASON']] = np.array([row[stat] for stat in STATS], dtype=np.float32)
+
+    removed = [key for key in sorted(live) if key not in changed][::40]
+    for name, season in removed:
+        sim.remove_rows(name, season)
+        del live[name, season]
+    assert not sim.indexes_degraded()
+    check_engines(sim, live, scale, rng)  # still scaled with the bounds of the original csv
+
+    sim.rebuild()
+    check_engines(sim, live, bounds(live), rng)  # re-normalized with the live rows
+
+
+def test_cached_response_is_invalidated_by_updates(stats_csv, tmp_path, monkeypatch):
+    (tmp_path / 'app').mkdir()
+    monkeypatch.chdir(tmp_path / 'app')  # flask_app loads ./playerstats.csv on import, there is none here
+    import flask_app
+    sim = NBAPlayerSimilarity(stats_csv)
+    monkeypatch.setattr(flask_app, 'nba_sim', sim)
+    monkeypatch.setattr(flask_app, 'result_cache', ResultCache())
+    client = flask_app.app.test_client()
+
+    name, season = sim.names[0], sim.seasons[0]
+    query = {'player_name': name, 'season': season, 'feature_group': 'scoring', 'k': K, 'exact': True}
+    first = client.post('/api/similar', json=query).get_json()
+    assert client.post('/api/similar', json=query).get_json() == first
+    assert flask_app.result_cache.stats()['hits'] == 1
+
+    # a new player with the target's exact stats is now its nearest neighbour
+    row = sim.find_player_row(name, season)
+    twin = dict(zip(sim.stats.columns, sim.stats.raw[row].tolist()), PLAYER_NAME='Twin Player', SEASON=season)
+    sim.upsert_rows([twin])
+    updated = client.post('/api/similar', json=query).get_json()
+    assert updated['data'][1]['player'] == 'Twin Player' and updated['data'][1]['distance'] == 0
+    assert [player['player'] for player in updated['data'][2:]] == [player['player'] for player in first['data'][1:K]]
+
+    sim.remove_rows('Twin Player', season)
+    assert client.post('/api/similar', json=query).get_json() == first
+    assert flask_app.result_cache.stats()['hits'] == 1
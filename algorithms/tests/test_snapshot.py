@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+import snapshot
+
+CHECKSUM = 'ab' * 32
+
+
+def test_save_replaces_an_existing_snapshot(tmp_path):
+    first = snapshot.save_snapshot(str(tmp_path), CHECKSUM, {'a': np.arange(3)}, {'tables': False})
+    # same csv saved again with more arrays (e.g. once the knn tables are built)
+    second = snapshot.save_snapshot(str(tmp_path), CHECKSUM, {'a': np.arange(3), 'b': np.ones(2)}, {'tables': True})
+    assert first == second
+    manifest, arrays = snapshot.load_snapshot(str(tmp_path), CHECKSUM)
+    assert manifest['tables'] and sorted(arrays) == ['a', 'b']
+    np.testing.assert_array_equal(arrays['b'], np.ones(2))
+    assert os.listdir(tmp_path) == [os.path.basename(first)]  # no temp or old folders left behind
+
+
+def test_save_keeps_an_identical_snapshot(tmp_path):
+    path = snapshot.save_snapshot(str(tmp_path), CHECKSUM, {'a': np.arange(3)}, {})
+    before = os.stat(os.path.join(path, 'a.npy')).st_ino
+    snapshot.save_snapshot(str(tmp_path), CHECKSUM, {'a': np.arange(3)}, {})
+    assert os.stat(os.path.join(path, 'a.npy')).st_ino == before
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_save_drops_snapshots_of_other_csvs(tmp_path):
+    old = snapshot.save_snapshot(str(tmp_path), 'cd' * 32, {'a': np.arange(3)}, {})
+    new = snapshot.save_snapshot(str(tmp_path), CHECKSUM, {'a': np.arange(4)}, {})
+    assert os.listdir(tmp_path) == [os.path.basename(new)] and not os.path.exists(old)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from vectorStore import QuantizedSearch, VectorStore
+
+D = 6
+K = 10
+ATOL = 1e-5  # float32 points and lookup tables, the oracle works in float64
+ID_OFFSET = 1000  # player ids != rows, so mixing them up fails
+
+
+def clustered(rng, n=3000):  # stat vectors bunch up around player types
+    centers = rng.random((30, D))
+    return np.clip(centers[rng.integers(0, 30, n)] + rng.normal(0, 0.08, (n, D)), 0, 1).astype(np.float32)
+
+
+def build(points, kind, **settings):
+    index = QuantizedSearch(D, kind, **settings)
+    index.build_index(points, np.arange(len(points)) + ID_OFFSET)
+    return index
+
+
+@pytest.mark.parametrize('kind', ['float32', 'sq8', 'pq'])
+def test_scan_distances_are_distances_to_the_decoded_points(kind):
+    rng = np.random.default_rng(0)
+    points = clustered(rng, 1000)
+    store = VectorStore(D, kind)
+    store.build(points)
+    decoded = store.decode().astype(np.float64)
+    for target in rng.random((10, D)):
+        expected = ((decoded - target) ** 2).sum(axis=1)
+        np.testing.assert_allclose(store.distances(target), expected, rtol=1e-5, atol=ATOL)
+    if kind == 'sq8':  # every stat is rounded to the nearest of 256 levels
+        assert (np.abs(decoded - points) <= store.step / 2 + ATOL).all()
+    np.testing.assert_allclose(store.errors(points), np.linalg.norm(decoded - points, axis=1), rtol=1e-6, atol=ATOL)
+
+
+# recall of the top k against brute force, every result at its exact distance (re-ranked), nearest first
+@pytest.mark.parametrize('kind,min_recall', [('sq8', 0.99), ('pq', 0.9)])
+def test_query_recall_against_brute_force(kind, min_recall):
+    rng = np.random.default_rng(1)
+    points = clustered(rng)
+    index = build(points, kind)
+    mask = rng.random(len(points)) > 0.3
+    hits = total = 0
+    for target in list(rng.random((30, D))) + list(points[rng.choice(len(points), 30)]):
+        for m in (None, mask):
+            allowed = np.arange(len(points)) if m is None else np.flatnonzero(m)
+            kth = np.sort(np.linalg.norm(points[allowed] - target, axis=1))[K - 1]
+            results = index.query(target, K, mask=m)
+            rows = [player_id - ID_OFFSET for _, player_id, _ in results]
+            dists = [distance for distance, _, _ in results]
+            assert len(set(rows)) == len(rows) == K and dists == sorted(dists) and np.isin(rows, allowed).all()
+            np.testing.assert_allclose(dists, np.linalg.norm(points[rows] - target, axis=1), rtol=0, atol=ATOL)
+            hits += sum(distance <= kth + ATOL for distance in dists)
+            total += K
+    assert hits / total >= min_recall
+
+
+@pytest.mark.parametrize('kind', ['sq8', 'pq'])
+def test_rerank_everything_is_exact(kind):
+    rng = np.random.default_rng(2)
+    points = clustered(rng, 500)
+    index = build(points, kind, rerank=500)
+    for target in rng.random((20, D)):
+        expected = np.sort(np.linalg.norm(points - target, axis=1))[:K]
+        np.testing.assert_allclose([distance for distance, _, _ in index.query(target, K)], expected, rtol=0,
+                                   atol=ATOL)
+
+
+# the radius is widened by the largest coding error, so with exact points range search misses nothing
+@pytest.mark.parametrize('kind', ['sq8', 'pq'])
+def test_range_search_is_exact(kind):
+    rng = np.random.default_rng(3)
+    points = clustered(rng)
+    index = build(points, kind, exact=points)
+    index.delete(np.arange(0, len(points), 5))
+    index.insert(rng.random((100, D)), np.arange(3000, 3100) + ID_OFFSET)  # grows the coding error
+    everything = np.vstack((points, index.exact[3000:]))
+    alive = index.alive.copy()
+    for target in rng.random((20, D)):
+        dists = np.linalg.norm(everything - target, axis=1)
+        found = [player_id - ID_OFFSET for _, player_id, _ in index.range_search(target, 0.25)]
+        # rows within float32 noise of the radius may go either way
+        assert set(np.flatnonzero(alive & (dists < 0.25 - ATOL)).tolist()) <= set(found) <= \
+            set(np.flatnonzero(alive & (dists <= 0.25 + ATOL)).tolist())
+        assert index.range_count(target, 0.25) == len(found)
@@ -0,0 +1,277 @@
+import numpy as np
+
+
+class VectorStore:
+    # compressed copy of a group's points for scanning millions of rows, one code row per point:
+    # 'float32' -> 4 bytes per stat, the points as they are (the column store is float32 already)
+    # 'sq8' -> 1 byte per stat, every stat cut into 256 even steps between its min and max
+    # 'pq' -> product quantization, the stats are split into `subspaces` slices and each slice is replaced by
+    #         the nearest of 256 k-means centroids trained on that slice, 1 byte per slice
+    # distances are asymmetric (ADC): the query stays exact and is compared with every code through one
+    # (codes, 256) lookup table, so scanning never decodes a point
+    KINDS = ('float32', 'sq8', 'pq')
+
+    def __init__(self, dimensions, kind='sq8', subspaces=None, iterations=15, sample=65536, seed=0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown store {kind}, use one of {', '.join(self.KINDS)}")
+        self.dimensions = dimensions
+        self.kind = kind
+        self.subspaces = min(subspaces or (dimensions + 1) // 2, dimensions)  # pq: ~2 stats per byte
+        self.iterations = iterations  # k-means rounds per pq slice
+        self.sample = sample  # rows k-means is trained on
+        self.seed = seed
+        self.codes = np.empty((0, dimensions), dtype=np.float32 if kind == 'float32' else np.uint8)
+        # sq8 -> per stat min and step, pq -> (subspaces, 256, slice width) centroids (zero padded slices)
+        self.lo = self.step = self.centroids = None
+        self.bounds = self._slices()
+
+    def _slices(self):  # pq: [start, end) stats of every slice, as even as possible
+        edges = np.linspace(0, self.dimensions, self.subspaces + 1).round().astype(int)
+        return np.stack((edges[:-1], edges[1:]), axis=1)
+
+    def train(self, points):
+        points = np.asarray(points, dtype=np.float32)
+        if self.kind == 'sq8':
+            self.lo = points.min(axis=0) if len(points) else np.zeros(self.dimensions, dtype=np.float32)
+            hi = points.max(axis=0) if len(points) else self.lo
+            self.step = np.maximum(hi - self.lo, 1e-8) / 255
+        elif self.kind == 'pq':
+            rng = np.random.default_rng(self.seed)
+            rows = rng.choice(len(points), min(self.sample, len(points)), replace=False) if len(points) else []
+            sample = points[rows]
+            width = int((self.bounds[:, 1] - self.bounds[:, 0]).max())
+            self.centroids = np.zeros((self.subspaces, 256, width), dtype=np.float32)
+            for s, (lo, hi) in enumerate(self.bounds):
+                self.centroids[s, :, :hi - lo] = _kmeans(sample[:, lo:hi], 256, self.iterations, rng)
+
+    def encode(self, points):
+        points = np.atleast_2d(np.asarray(points, dtype=np.float32))
+        if self.kind == 'float32':
+            return points.copy()
+        if self.kind == 'sq8':
+            return np.clip(np.rint((points - self.lo) / self.step), 0, 255).astype(np.uint8)
+        codes = np.empty((len(points), self.subspaces), dtype=np.uint8)
+        for s, (lo, hi) in enumerate(self.bounds):
+            codes[:, s] = _nearest_centroid(points[:, lo:hi], self.centroids[s, :, :hi - lo])
+        return codes
+
+    def decode(self, rows=None):  # approximate points back
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.kind == 'float32':
+            return np.array(codes)
+        if self.kind == 'sq8':
+            return self.lo + codes.astype(np.float32) * self.step
+        points = np.empty((len(codes), self.dimensions), dtype=np.float32)
+        for s, (lo, hi) in enumerate(self.bounds):
+            points[:, lo:hi] = self.centroids[s, codes[:, s], :hi - lo]
+        return points
+
+    def build(self, points):
+        self.train(points)
+        self.codes = self.encode(points)
+
+    # write rows (past the end grows the store) with the trained quantizer, nothing is retrained
+    def set_rows(self, rows, points):
+        grow = int(rows.max()) + 1 - len(self.codes) if len(rows) else 0
+        if grow > 0:
+            self.codes = np.concatenate((self.codes, np.zeros((grow, self.codes.shape[1]), dtype=self.codes.dtype)))
+        elif not self.codes.flags.writeable:  # memory mapped snapshot -> private copy on first change
+            self.codes = self.codes.copy()
+        self.codes[rows] = self.encode(points)
+
+    # (columns, 256) squared distance of the target to every level / centroid of every code column
+    def lookup_table(self, target):
+        target = np.asarray(target, dtype=np.float64)
+        if self.kind == 'sq8':
+            levels = self.lo[:, None] + np.arange(256) * self.step[:, None]
+            return (levels - target[:, None]) ** 2
+        table = np.empty((self.subspaces, 256))
+        for s, (lo, hi) in enumerate(self.bounds):
+            diff = self.centroids[s, :, :hi - lo] - target[lo:hi]
+            table[s] = np.einsum('cd,cd->c', diff, diff)
+        return table
+
+    # approximate squared distances from target to rows [lo, hi)
+    def distances(self, target, lo=0, hi=None):
+        codes = self.codes[lo:hi]
+        if self.kind == 'float32':
+            diff = codes - np.asarray(target, dtype=np.float32)
+            return np.einsum('ij,ij->i', diff, diff)
+        table = self.lookup_table(target).astype(np.float32)
+        dists = np.zeros(len(codes), dtype=np.float32)
+        for column in range(codes.shape[1]):  # one gather per code column, a handful of columns
+            dists += table[column][codes[:, column]]
+        return dists
+
+    # largest distance between a point and its code (per row), what a distance can be off by
+    def errors(self, points, rows=None):
+        diff = np.asarray(points, dtype=np.float64) - self.decode(rows)
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+    def nbytes(self):
+        return int(sum(np.asarray(array).nbytes for array in self.get_state().values()))
+
+    def get_state(self):
+        state = {'codes': self.codes}
+        if self.kind == 'sq8':
+            state.update(lo=self.lo, step=self.step)
+        elif self.kind == 'pq':
+            state['centroids'] = self.centroids
+        return state
+
+    @classmethod
+    def from_state(cls, dimensions, kind, state, subspaces=None):  # arrays are used as given
+        store = cls(dimensions, kind, subspaces)
+        store.codes = state['codes']
+        store.lo, store.step, store.centroids = state.get('lo'), state.get('step'), state.get('centroids')
+        return store
+
+
+def _nearest_centroid(points, centroids):
+    dists = (np.einsum('ij,ij->i', points, points)[:, None] - 2 * points @ centroids.T +
+             np.einsum('ij,ij->i', centroids, centroids)[None, :])
+    return np.argmin(dists, axis=1)
+
+
+def _kmeans(points, clusters, iterations, rng):  # lloyd's with random starts, empty clusters get a random point
+    if not len(points):
+        return np.zeros((clusters, points.shape[1]), dtype=np.float32)
+    centroids = points[rng.choice(len(points), clusters, replace=len(points) < clusters)].copy()
+    for _ in range(iterations):
+        labels = _nearest_centroid(points, centroids)
+        counts = np.bincount(labels, minlength=clusters)
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(sums, labels, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        centroids[~filled] = points[rng.integers(0, len(points), int((~filled).sum()))]
+    return centroids
+
+
+class QuantizedSearch:
+    # brute force scan over a VectorStore: approximate distances for every row from the codes, then the best
+    # `rerank` rows are re-ranked with their exact points
+    # exact -> where those come from: an array indexed by row or a function rows -> points (e.g. reading the
+    # column store), None keeps a float32 copy here (no memory saved, for standalone use)
+    # range queries widen the radius by the largest coding error seen, so with exact points they are exact
+    def __init__(self, dimensions, kind='sq8', subspaces=None, rerank=64, exact=None, block_size=65536):
+        self.dimensions = dimensions
+        self.store = VectorStore(dimensions, kind, subspaces)
+        self.rerank = rerank
+        self.exact = exact
+        self.block_size = block_size
+        self.player_ids = np.empty(0)
+        self.alive = np.empty(0, dtype=bool)
+        self.max_error = 0.0  # largest |point - decoded point| of any stored row
+        self.trained_error = 0.0  # same, right after build (inserts outside the trained range grow it)
+
+    def build_index(self, points, player_ids):
+        points = np.asarray(points, dtype=np.float32)
+        self.store.build(points)
+        if self.exact is None:
+            self.exact = points
+        self.player_ids = np.asarray(player_ids)
+        self.alive = np.ones(len(points), dtype=bool)
+        self.max_error = self.trained_error = float(self.store.errors(points).max()) if len(points) else 0.0
+
+    @classmethod
+    def from_state(cls, state, exact=None, rerank=64):
+        kind = str(state['kind'])
+        store = VectorStore.from_state(int(state['dimensions']), kind, state, int(state['subspaces']))
+        index = cls(store.dimensions, kind, store.subspaces, rerank, exact)
+        index.store = store
+        index.player_ids, index.alive = state['player_ids'], state['alive']
+        index.max_error, index.trained_error = (float(e) for e in state['errors'])
+        if index.exact is None:
+            index.exact = store.decode()  # no exact points saved -> re-rank against the codes
+        return index
+
+    def get_state(self):
+        return dict(self.store.get_state(), player_ids=self.player_ids, alive=self.alive,
+                    errors=np.array([self.max_error, self.trained_error]), kind=np.array(self.store.kind),
+                    dimensions=np.array(self.dimensions), subspaces=np.array(self.store.subspaces))
+
+    def _exact_points(self, rows):
+        return np.asarray(self.exact(rows) if callable(self.exact) else self.exact[rows], dtype=np.float64)
+
+    def insert(self, points, player_ids, rows=None):
+        points = np.atleast_2d(np.asarray(points, dtype=np.float32))
+        if rows is None:
+            rows = np.arange(len(self.alive), len(self.alive) + len(points))
+        rows = np.asarray(rows, dtype=np.intp)
+        self.store.set_rows(rows, points)
+        grow = len(self.store.codes) - len(self.alive)
+        if grow > 0:
+            self.player_ids = np.concatenate((self.player_ids, np.zeros(grow, dtype=self.player_ids.dtype)))
+            self.alive = np.concatenate((self.alive, np.zeros(grow, dtype=bool)))
+            if not callable(self.exact):
+                self.exact = np.concatenate((self.exact, np.zeros((grow, self.dimensions), dtype=np.float32)))
+        if not self.alive.flags.writeable:
+            self.player_ids, self.alive = self.player_ids.copy(), self.alive.copy()
+        if not callable(self.exact):
+            if not self.exact.flags.writeable:
+                self.exact = self.exact.copy()
+            self.exact[rows] = points
+        self.player_ids[rows] = player_ids
+        self.alive[rows] = True
+        self.max_error = max(self.max_error, float(self.store.errors(points, rows).max()))
+
+    def delete(self, rows):
+        if not self.alive.flags.writeable:
+            self.alive = self.alive.copy()
+        self.alive[np.asarray(rows, dtype=np.intp)] = False
+
+    def degraded(self):  # inserts far outside what the quantizer was trained on
+        return self.max_error > 2 * self.trained_error + 1e-6
+
+    # (rows, approximate squared distances) of every allowed row, scanned in blocks
+    def _scan(self, target, mask):
+        n = len(self.alive)
+        allowed = self.alive if mask is None else self.alive & mask[:n]
+        dists = np.empty(n, dtype=np.float32)
+        for lo in range(0, n, self.block_size):
+            dists[lo:lo + self.block_size] = self.store.distances(target, lo, lo + self.block_size)
+        dists[~allowed] = np.inf
+        return dists
+
+    # same output as BruteForceSearch.query, stats (dict) gets the rows scanned and re-ranked
+    def query(self, target, k=5, mask=None, stats=None):
+        if k <= 0:
+            return []
+        target = np.asarray(target, dtype=np.float64)
+        dists = self._scan(target, mask)
+        shortlist = min(max(k, self.rerank), len(dists))
+        if not shortlist:
+            return []
+        if shortlist < len(dists):
+            rows = np.argpartition(dists, shortlist - 1)[:shortlist]
+        else:
+            rows = np.arange(len(dists))
+        rows = rows[np.isfinite(dists[rows])]
+        points = self._exact_points(rows)
+        diff = points - target
+        exact = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        order = np.argsort(exact, kind='stable')[:k]
+        if stats is not None:
+            stats['points_scanned'] = len(dists)
+            stats['reranked'] = len(rows)
+        return [(float(exact[i]), self.player_ids[rows[i]], points[i]) for i in order]
+
+    def range_search(self, target, radius, mask=None, stats=None):
+        target = np.asarray(target, dtype=np.float64)
+        dists = self._scan(target, mask)
+        # a row within radius has its code within radius + its coding error (+ float32 rounding of the scan)
+        rows = np.flatnonzero(dists <= (float(radius) + self.max_error) ** 2 * (1 + 1e-5) + 1e-6)
+        points = self._exact_points(rows)
+        diff = points - target
+        exact = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        keep = exact <= float(radius)
+        rows, points, exact = rows[keep], points[keep], exact[keep]
+        order = np.argsort(exact, kind='stable')
+        if stats is not None:
+            stats['points_scanned'] = len(dists)
+            stats['reranked'] = len(keep)
+        return [(float(exact[i]), self.player_ids[rows[i]], points[i]) for i in order]
+
+    def range_count(self, target, radius, mask=None, stats=None):
+        return len(self.range_search(target, radius, mask, stats))